@@ -2,4 +2,14 @@
 
 set -eux
 
-python /src/manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+## SERVER_MODE=runserver (default) runs the django development server.
+## SERVER_MODE=wsgi / asgi run gunicorn, see /src/gunicorn.conf.py
+SERVER_MODE="${SERVER_MODE:-runserver}"
+
+if [ "$SERVER_MODE" = "runserver" ]; then
+    python /src/manage.py middleware_report
+    exec python /src/manage.py runserver 0.0.0.0:8000
+else
+    cd /src
+    exec gunicorn --config /src/gunicorn.conf.py
+fi
@@ -0,0 +1,10 @@
+#!/bin/sh
+
+set -eux
+
+## gracefully replaces the gunicorn workers: new workers are started and the old
+## ones finish their in-flight requests (up to GUNICORN_GRACEFUL_TIMEOUT) first.
+## with GUNICORN_PRELOAD the master keeps the loaded code, so this picks up
+## configuration changes; restart the container to deploy new code
+
+kill -HUP "$(cat "${GUNICORN_PIDFILE:-/tmp/gunicorn.pid}")"
@@ -0,0 +1,5 @@
+#!/bin/sh
+
+set -eux
+
+python /src/manage.py run_provisioning_worker
\ No newline at end of file
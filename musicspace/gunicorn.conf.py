@@ -0,0 +1,62 @@
+## gunicorn settings for the production launch modes in bin/command.sh.
+## SERVER_MODE=wsgi runs threaded sync workers, SERVER_MODE=asgi runs uvicorn workers
+## so the async views can serve many TakeOne-bound requests per worker
+
+import multiprocessing
+## note: module level names are read as gunicorn settings, so decouple's `config`
+## can't be imported by name here
+import decouple
+
+SERVER_MODE = decouple.config('SERVER_MODE', default='wsgi')
+
+bind = decouple.config('GUNICORN_BIND', default='0.0.0.0:8000')
+
+## the usual (2 x cores) + 1 for sync workers. each uvicorn worker runs an event
+## loop, so one per core is enough
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'musicspace.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    DEFAULT_WORKERS = multiprocessing.cpu_count()
+else:
+    wsgi_app = 'musicspace.wsgi:application'
+    worker_class = 'gthread'
+    threads = decouple.config('GUNICORN_THREADS', cast=int, default=4)
+    DEFAULT_WORKERS = multiprocessing.cpu_count() * 2 + 1
+
+workers = decouple.config('GUNICORN_WORKERS', cast=int, default=DEFAULT_WORKERS)
+
+## load django once in the master so forked workers share its memory
+## (see post_fork for the connections that must not be shared)
+preload_app = decouple.config('GUNICORN_PRELOAD', cast=bool, default=True)
+
+## a worker is only killed once it has been busy for longer than the slowest TakeOne
+## call it can make (TAKEONE_HTTP_TIMEOUT) plus some headroom for our own work
+TAKEONE_HTTP_TIMEOUT = decouple.config('TAKEONE_HTTP_TIMEOUT', cast=float, default=30.0)
+timeout = decouple.config('GUNICORN_TIMEOUT', cast=int, default=int(TAKEONE_HTTP_TIMEOUT) + 15)
+
+## on a HUP (bin/reload.sh) or shutdown, workers get this long to finish
+## their in-flight requests before they are killed
+graceful_timeout = decouple.config('GUNICORN_GRACEFUL_TIMEOUT', cast=int, default=int(TAKEONE_HTTP_TIMEOUT) + 5)
+
+keepalive = decouple.config('GUNICORN_KEEPALIVE', cast=int, default=5)
+
+## recycle workers now and then, staggered so they don't all restart at once
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', cast=int, default=2000)
+max_requests_jitter = decouple.config('GUNICORN_MAX_REQUESTS_JITTER', cast=int, default=200)
+
+pidfile = decouple.config('GUNICORN_PIDFILE', default='/tmp/gunicorn.pid')
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    ## anything the master opened while preloading belongs to the master.
+    ## each worker opens its own database connections
+    from django.db import connections
+    connections.close_all()
+
+def when_ready(server):
+    import os
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'musicspace.settings')
+    from musicspace_app.middleware_report import build_middleware_report
+    for line in build_middleware_report():
+        server.log.info(line)
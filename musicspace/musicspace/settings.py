@@ -30,11 +30,17 @@ DEBUG = config('DEBUG', cast=bool, default=False)
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='[]').split(",")
 
 
+## SETTINGS_PROFILE is `dev` or `prod` (the default unless DEBUG is on). the prod
+## profile leaves out the development-only apps and middleware and caches compiled
+## templates. `manage.py middleware_report` lists what runs on each request
+SETTINGS_PROFILE = config('SETTINGS_PROFILE', default='dev' if DEBUG else 'prod')
+if SETTINGS_PROFILE not in ('dev', 'prod'):
+    raise ValueError(f'Unsupported SETTINGS_PROFILE: {SETTINGS_PROFILE}')
+
+
 # Application definition
 
 INSTALLED_APPS = [
-    'whitenoise.runserver_nostatic',
-
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -44,30 +50,48 @@ INSTALLED_APPS = [
     'rest_framework',
     'django_htmx',
     'musicspace_app',
-    'debug_toolbar',
-
 ]
 
+if SETTINGS_PROFILE == 'dev':
+    ## runserver_nostatic has to come before django.contrib.staticfiles
+    INSTALLED_APPS = ['whitenoise.runserver_nostatic'] + INSTALLED_APPS + ['debug_toolbar']
+
+## WhiteNoise answers static file requests straight after SecurityMiddleware, so
+## they never load a session, the user or a CSRF token
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_htmx.middleware.HtmxMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
 
+if SETTINGS_PROFILE == 'dev':
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.csrf.CsrfViewMiddleware') + 1,
+        'debug_toolbar.middleware.DebugToolbarMiddleware'
+    )
+
 ROOT_URLCONF = 'musicspace.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+## templates are compiled once per process in prod. in dev they are re-read on
+## every render so edits show up without a restart
+if SETTINGS_PROFILE == 'prod':
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -75,6 +99,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages'
             ],
+            'loaders': TEMPLATE_LOADERS,
         },
     },
 ]
@@ -85,14 +110,75 @@ WSGI_APPLICATION = 'musicspace.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-## TODO - update to postgres??
+## DATABASE_BACKEND selects the database: `sqlite` (the default, for single node
+## installs) or `postgresql`. postgres connections are kept open between requests
+## (DATABASE_CONN_MAX_AGE) and checked before being reused
+
+DATABASE_BACKEND = config('DATABASE_BACKEND', default='sqlite')
+
+if DATABASE_BACKEND == 'sqlite':
+    SQLITE_DATABASE_DIR = '/var/musicspace/db'
+    os.makedirs(SQLITE_DATABASE_DIR, exist_ok=True)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(SQLITE_DATABASE_DIR, 'db.sqlite3'),
+        }
+    }
 
-SQLITE_DATABASE_DIR = '/var/musicspace/db'
-os.makedirs(SQLITE_DATABASE_DIR, exist_ok=True)
-DATABASES = {
+    ## WAL journaling, synchronous=NORMAL, a busy timeout and larger mmap / page
+    ## caches, applied to every connection by musicspace_app.sqlite
+    SQLITE_HARDENED = config('SQLITE_HARDENED', cast=bool, default=True)
+    SQLITE_BUSY_TIMEOUT_MS = config('SQLITE_BUSY_TIMEOUT_MS', cast=int, default=5000)
+    SQLITE_MMAP_SIZE = config('SQLITE_MMAP_SIZE', cast=int, default=256 * 1024 * 1024)
+    ## negative values are in KiB
+    SQLITE_CACHE_SIZE = config('SQLITE_CACHE_SIZE', cast=int, default=-64 * 1024)
+elif DATABASE_BACKEND == 'postgresql':
+    def postgresql_database(host: str, port: int) -> dict:
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME', default='musicspace'),
+            'USER': config('DATABASE_USER', default='musicspace'),
+            'PASSWORD': config('DATABASE_PASSWORD', default=''),
+            'HOST': host,
+            'PORT': port,
+            'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', cast=int, default=60),
+            'CONN_HEALTH_CHECKS': config('DATABASE_CONN_HEALTH_CHECKS', cast=bool, default=True),
+            'OPTIONS': {
+                'connect_timeout': config('DATABASE_CONNECT_TIMEOUT', cast=int, default=5),
+            },
+        }
+
+    DATABASES = {
+        'default': postgresql_database(
+            host=config('DATABASE_HOST', default='localhost'),
+            port=config('DATABASE_PORT', cast=int, default=5432)
+        )
+    }
+
+    ## optional read replica for the public search / detail views, see
+    ## musicspace_app.db_router
+    DATABASE_REPLICA_HOST = config('DATABASE_REPLICA_HOST', default='')
+    if DATABASE_REPLICA_HOST:
+        DATABASES['replica'] = postgresql_database(
+            host=DATABASE_REPLICA_HOST,
+            port=config('DATABASE_REPLICA_PORT', cast=int, default=5432)
+        )
+        DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+else:
+    raise ValueError(f'Unsupported DATABASE_BACKEND: {DATABASE_BACKEND}')
+
+DATABASE_ROUTERS = ['musicspace_app.db_router.ReadReplicaRouter']
+
+## Cache
+## the default in-memory cache is per process. when running more than one worker,
+## point this at a shared cache (e.g. memcached / redis) so invalidations made by one
+## worker (genre / instrument changes, facet counts, ...) are seen by the others
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(SQLITE_DATABASE_DIR, 'db.sqlite3'),
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
     }
 }
 
@@ -147,9 +233,11 @@ STATIC_URL = '/static/'
 STATIC_ROOT = '/var/musicspace/static'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
-# Django Debug Toolbar
+# Django Debug Toolbar (dev profile only)
+DEBUG_TOOLBAR_ENABLED = config('DEBUG_TOOLBAR_ENABLED', cast=bool, default=False)
+
 def show_toolbar(request):
-    return DEBUG and config('DEBUG_TOOLBAR_ENABLED', cast=bool, default=False)
+    return DEBUG and DEBUG_TOOLBAR_ENABLED
     
 DEBUG_TOOLBAR_CONFIG = {
     "SHOW_TOOLBAR_CALLBACK" : show_toolbar,
@@ -166,6 +254,64 @@ TAKEONE_CLIENT_ID = config('TAKEONE_CLIENT_ID')
 TAKEONE_CLIENT_SECRET = config('TAKEONE_CLIENT_SECRET')
 TAKEONE_VIDEO_CONTAINER_TEMPLATE_ID = config('TAKEONE_VIDEO_CONTAINER_TEMPLATE_ID')
 
+## TakeOne HTTP connection pool
+TAKEONE_HTTP_MAX_CONNECTIONS = config('TAKEONE_HTTP_MAX_CONNECTIONS', cast=int, default=100)
+TAKEONE_HTTP_MAX_KEEPALIVE_CONNECTIONS = config('TAKEONE_HTTP_MAX_KEEPALIVE_CONNECTIONS', cast=int, default=20)
+TAKEONE_HTTP_KEEPALIVE_EXPIRY = config('TAKEONE_HTTP_KEEPALIVE_EXPIRY', cast=float, default=5.0)
+TAKEONE_HTTP_TIMEOUT = config('TAKEONE_HTTP_TIMEOUT', cast=float, default=30.0)
+## requires the h2 package to be installed
+TAKEONE_HTTP2_ENABLED = config('TAKEONE_HTTP2_ENABLED', cast=bool, default=False)
+## async views only keep pooled connections under ASGI (SERVER_MODE=asgi), where each
+## worker runs one long lived event loop
+TAKEONE_ASYNC_HTTP_POOLED = config(
+    'TAKEONE_ASYNC_HTTP_POOLED',
+    cast=bool,
+    default=config('SERVER_MODE', default='runserver') == 'asgi'
+)
+
+## How long (in seconds) a locally stored video container is served before it is
+## refreshed from TakeOne in the background. Containers that are not published
+## yet are refreshed on the shorter interval
+TAKEONE_VIDEO_CONTAINER_STALENESS_SECONDS = config('TAKEONE_VIDEO_CONTAINER_STALENESS_SECONDS', cast=int, default=300)
+TAKEONE_VIDEO_CONTAINER_UNPUBLISHED_STALENESS_SECONDS = config('TAKEONE_VIDEO_CONTAINER_UNPUBLISHED_STALENESS_SECONDS', cast=int, default=15)
+TAKEONE_BACKGROUND_WORKERS = config('TAKEONE_BACKGROUND_WORKERS', cast=int, default=4)
+
+## Provisioning jobs (run by `manage.py run_provisioning_worker`)
+PROVISIONING_JOB_MAX_ATTEMPTS = config('PROVISIONING_JOB_MAX_ATTEMPTS', cast=int, default=5)
+PROVISIONING_JOB_RETRY_DELAY_SECONDS = config('PROVISIONING_JOB_RETRY_DELAY_SECONDS', cast=int, default=30)
+PROVISIONING_JOB_LOCK_TIMEOUT_SECONDS = config('PROVISIONING_JOB_LOCK_TIMEOUT_SECONDS', cast=int, default=300)
+PROVISIONING_WORKER_POLL_INTERVAL_SECONDS = config('PROVISIONING_WORKER_POLL_INTERVAL_SECONDS', cast=float, default=1.0)
+
+## How long provider search facet counts are cached. They are also invalidated
+## whenever a provider changes
+PROVIDER_FACET_COUNTS_CACHE_SECONDS = config('PROVIDER_FACET_COUNTS_CACHE_SECONDS', cast=int, default=300)
+
+## How long a rendered provider list item is cached. Changes to the provider replace it
+## straight away, but only in the process that made them when the cache is per process
+## (locmem), so the default is kept short unless the cache is shared between workers
+CACHE_IS_PER_PROCESS = CACHES['default']['BACKEND'] in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+PROVIDER_LIST_ITEM_CACHE_SECONDS = config(
+    'PROVIDER_LIST_ITEM_CACHE_SECONDS',
+    cast=int,
+    default=60 if CACHE_IS_PER_PROCESS else 86400
+)
+
+## How long whole pages of the public views are cached for anonymous visitors. They
+## are also replaced whenever a provider or their video changes. 0 disables the cache
+PUBLIC_PAGE_CACHE_SECONDS = config('PUBLIC_PAGE_CACHE_SECONDS', cast=int, default=300)
+
+## Webhook inbox (drained by `manage.py run_webhook_consumer`)
+WEBHOOK_CONSUMER_BATCH_SIZE = config('WEBHOOK_CONSUMER_BATCH_SIZE', cast=int, default=100)
+WEBHOOK_CONSUMER_POLL_INTERVAL_SECONDS = config('WEBHOOK_CONSUMER_POLL_INTERVAL_SECONDS', cast=float, default=1.0)
+## Applied events are deleted by the consumer once they are this old
+WEBHOOK_EVENT_RETENTION_DAYS = config('WEBHOOK_EVENT_RETENTION_DAYS', cast=int, default=7)
+## When set, webhooks are only accepted with `?token=<TAKEONE_WEBHOOK_TOKEN>` in the url
+## registered with TakeOne
+TAKEONE_WEBHOOK_TOKEN = config('TAKEONE_WEBHOOK_TOKEN', default='')
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = '/tmp/emails'
 FROM_EMAIL = config('FROM_EMAIL', default='test@example.com')
\ No newline at end of file
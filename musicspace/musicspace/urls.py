@@ -13,6 +13,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
@@ -21,6 +22,7 @@ from musicspace_app import urls as musicspace_urls
 urlpatterns = [
     path('', include((musicspace_urls, 'musicspace'))),
     path('admin/', admin.site.urls),
-
-    path('__debug__/', include('debug_toolbar.urls')),
 ]
+
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    urlpatterns.append(path('__debug__/', include('debug_toolbar.urls')))
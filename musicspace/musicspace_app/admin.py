@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import (
     MusicspaceUser, Genre, Instrument,
-    Provider, Address, TakeOneUser, TakeOneProfileVideoContainer
+    Provider, Address, TakeOneUser, TakeOneProfileVideoContainer,
+    ProvisioningJob, TakeOneWebhookEvent
 )
 
 # Register your models here.
@@ -19,3 +20,5 @@ admin.site.register(Provider)
 admin.site.register(Address)
 admin.site.register(TakeOneUser)
 admin.site.register(TakeOneProfileVideoContainer)
+admin.site.register(ProvisioningJob)
+admin.site.register(TakeOneWebhookEvent)
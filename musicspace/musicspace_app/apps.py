@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MusicspaceAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'musicspace_app'
+
+    def ready(self):
+        from musicspace_app import signals
+        from musicspace_app import sqlite
@@ -1,5 +1,7 @@
-from typing import Optional, List
+from typing import Optional, List, Any, Type
 from datetime import datetime
+import threading
+import asyncio
 import httpx
 from pydantic import BaseModel
 from uuid import UUID
@@ -118,129 +120,329 @@ class TakeOneWebhookRequest(BaseModel):
     project: WebhookProject
     video_container: WebhookVideoContainer
 
-class TakeOneClient:
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 5.0
+DEFAULT_TIMEOUT = 30.0
+
+class TakeOneClientPoolStats(BaseModel):
+    max_connections: Optional[int]
+    max_keepalive_connections: Optional[int]
+    requests_total: int
+    requests_in_flight: int
+    ## transport errors and 4xx / 5xx responses
+    requests_failed: int
+    connections_open: int
+    connections_idle: int
+
+class AuthorizationCodeRequest(BaseModel):
+    user: str
+
+class AuthorizationCodeResponse(BaseModel):
+    code: str
+
+## a TakeOne api call: the request to send and the model its response is parsed into
+class TakeOneRequest(BaseModel):
+    method: str
+    path: str
+    json_body: Optional[Any]
+    response_model: Type[BaseModel]
+    ## the error body is printed for these statuses
+    logged_error_statuses: range = range(400, 401)
 
-    class AuthorizationCodeRequest(BaseModel):
-        user: str
+    class Config:
+        arbitrary_types_allowed = True
 
-    class AuthorizationCodeResponse(BaseModel):
-        code: str
+## builds the requests and parses the responses of every TakeOne api call, and keeps
+## the request counts. the sync and async clients below only differ in how a request
+## is sent
+class BaseTakeOneClient:
 
     def __init__(
         self,
         base_url: str,
         client_id: str,
-        client_secret: str
+        client_secret: str,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        timeout: float = DEFAULT_TIMEOUT,
+        http2: bool = False
     ):
         self.base_url = base_url
         self.auth = (client_id, client_secret)
-
-    def create_user(
-        self,
-        request: CreateUserRequest
-    ) -> User:
-
-        url = f'{self.base_url}/api/v1/app_users'
-        r = httpx.post(
-            url, 
-            json=request.dict(exclude_none=True),
-            auth=self.auth, 
-            timeout=30
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
         )
+        self.timeout = timeout
+        self.http2 = http2
+
+        self._stats_lock = threading.Lock()
+        self._requests_total = 0
+        self._requests_in_flight = 0
+        self._requests_failed = 0
+
+    def _request_started(self):
+        with self._stats_lock:
+            self._requests_total += 1
+            self._requests_in_flight += 1
+
+    def _request_finished(self, failed: bool):
+        with self._stats_lock:
+            self._requests_in_flight -= 1
+            if failed:
+                self._requests_failed += 1
+
+    def _parse_response(
+        self,
+        request: TakeOneRequest,
+        r: httpx.Response
+    ) -> BaseModel:
 
-        if r.status_code >= 400:
+        if r.status_code in request.logged_error_statuses:
             response_body = r.json()
             print(response_body)
 
         r.raise_for_status()
         response_body = r.json()
-        return User(**response_body)
+        return request.response_model(**response_body)
+
+    ## httpx does not expose the connection pool publicly, so this
+    ## degrades to zero connection counts if the internals change
+    def _pool_stats(self, clients: List[Any]) -> TakeOneClientPoolStats:
+
+        connections = []
+        for client in clients:
+            pool = getattr(getattr(client, '_transport', None), '_pool', None)
+            connections.extend(getattr(pool, 'connections', []))
+
+        with self._stats_lock:
+            return TakeOneClientPoolStats(
+                max_connections=self.limits.max_connections,
+                max_keepalive_connections=self.limits.max_keepalive_connections,
+                requests_total=self._requests_total,
+                requests_in_flight=self._requests_in_flight,
+                requests_failed=self._requests_failed,
+                connections_open=len(connections),
+                connections_idle=len([c for c in connections if c.is_idle()])
+            )
+
+    def _create_user_request(
+        self,
+        request: CreateUserRequest
+    ) -> TakeOneRequest:
+        return TakeOneRequest(
+            method='POST',
+            path='/api/v1/app_users',
+            json_body=request.dict(exclude_none=True),
+            response_model=User,
+            logged_error_statuses=range(400, 600)
+        )
 
-    def create_video_container(
+    def _create_video_container_request(
         self,
         request: CreateVideoContainerRequest
-    ) -> VideoContainer:
-        
-        url = f'{self.base_url}/api/v1/video_containers'
-        r = httpx.post(
-            url, 
-            json=request.dict(exclude_none=True),
-            auth=self.auth, 
-            timeout=30
+    ) -> TakeOneRequest:
+        return TakeOneRequest(
+            method='POST',
+            path='/api/v1/video_containers',
+            json_body=request.dict(exclude_none=True),
+            response_model=VideoContainer
         )
 
-        if r.status_code == 400:
-            response_body = r.json()
-            print(response_body)
-
-        r.raise_for_status()
-        response_body = r.json()
-        return VideoContainer(**response_body)
-    
-    def fetch_video_container(
+    def _fetch_video_container_request(
         self,
         video_container_id: UUID
-    ) -> VideoContainer:
-        
-        url = f'{self.base_url}/api/v1/video_containers/{video_container_id}'
-        r = httpx.get(
-            url, 
-            auth=self.auth, 
-            timeout=30
+    ) -> TakeOneRequest:
+        return TakeOneRequest(
+            method='GET',
+            path=f'/api/v1/video_containers/{video_container_id}',
+            response_model=VideoContainer
         )
 
-        if r.status_code == 400:
-            response_body = r.json()
-            print(response_body)
-
-        r.raise_for_status()
-        response_body = r.json()
-        return VideoContainer(**response_body)
-
-    def create_project(
+    def _create_project_request(
         self,
         request: CreateProjectRequest
-    ) -> Project:
-
-        url = f'{self.base_url}/api/v1/projects'
-        r = httpx.post(
-            url, 
-            json=request.dict(exclude_none=True),
-            auth=self.auth, 
-            timeout=30
+    ) -> TakeOneRequest:
+        return TakeOneRequest(
+            method='POST',
+            path='/api/v1/projects',
+            json_body=request.dict(exclude_none=True),
+            response_model=Project
         )
 
-        if r.status_code == 400:
-            response_body = r.json()
-            print(response_body)
-
-        r.raise_for_status()
-        response_body = r.json()
-        return Project(**response_body)
-
-    def authorize(
+    def _authorize_request(
         self,
         user_id: str
-    ) -> str:
-
-        request = self.AuthorizationCodeRequest(
+    ) -> TakeOneRequest:
+        request = AuthorizationCodeRequest(
             user=user_id
         )
 
-        url = f'{self.base_url}/api/v1/app_users/authorize'
-        r = httpx.post(
-            url, 
-            json=request.dict(exclude_none=True),
-            auth=self.auth, 
-            timeout=30
+        return TakeOneRequest(
+            method='POST',
+            path='/api/v1/app_users/authorize',
+            json_body=request.dict(exclude_none=True),
+            response_model=AuthorizationCodeResponse
         )
 
-        if r.status_code == 400:
-            response_body = r.json()
-            print(response_body)
+class TakeOneClient(BaseTakeOneClient):
 
-        r.raise_for_status()
-        response_body = r.json()
-        auth_code_response = self.AuthorizationCodeResponse(**response_body)
-        return auth_code_response.code
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+
+        ## a single pooled client is shared by every request (and every thread),
+        ## so connections and TLS sessions are reused between calls
+        ## NOTE - http2 requires the `h2` package (`pip install httpx[http2]`)
+        self._client = httpx.Client(
+            auth=self.auth,
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2
+        )
+
+    def __enter__(self) -> "TakeOneClient":
+        return self
+
+    def __exit__(self, *args: Any):
+        self.close()
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client.is_closed
+
+    def close(self):
+        if not self._client.is_closed:
+            self._client.close()
+
+    def _send(
+        self,
+        request: TakeOneRequest
+    ) -> BaseModel:
+
+        self._request_started()
+        failed = True
+        try:
+            r = self._client.request(
+                request.method,
+                f'{self.base_url}{request.path}',
+                json=request.json_body
+            )
+            failed = r.is_error
+        finally:
+            self._request_finished(failed=failed)
+
+        return self._parse_response(request, r)
+
+    def pool_stats(self) -> TakeOneClientPoolStats:
+        return self._pool_stats([self._client])
+
+    def create_user(
+        self,
+        request: CreateUserRequest
+    ) -> User:
+        return self._send(self._create_user_request(request=request))
+
+    def create_video_container(
+        self,
+        request: CreateVideoContainerRequest
+    ) -> VideoContainer:
+        return self._send(self._create_video_container_request(request=request))
 
+    def fetch_video_container(
+        self,
+        video_container_id: UUID
+    ) -> VideoContainer:
+        return self._send(self._fetch_video_container_request(video_container_id=video_container_id))
+
+    def create_project(
+        self,
+        request: CreateProjectRequest
+    ) -> Project:
+        return self._send(self._create_project_request(request=request))
+
+    def authorize(
+        self,
+        user_id: str
+    ) -> str:
+        return self._send(self._authorize_request(user_id=user_id)).code
+
+## the calls async views make, see TakeOneClient for the others.
+## pooled connections belong to the event loop that opened them, so they are only kept
+## when `pooled` is set, i.e. under ASGI where each worker runs one long lived loop.
+## under WSGI every async view runs on a loop of its own (async_to_sync), and each
+## request gets a client that is closed again before the loop goes away
+class AsyncTakeOneClient(BaseTakeOneClient):
+
+    def __init__(self, *args: Any, pooled: bool = False, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.pooled = pooled
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def __aenter__(self) -> "AsyncTakeOneClient":
+        return self
+
+    async def __aexit__(self, *args: Any):
+        await self.aclose()
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            auth=self.auth,
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2
+        )
+
+    ## the pooled client, if it can be used from the running loop
+    def _pooled_client(self) -> Optional[httpx.AsyncClient]:
+        if not self.pooled:
+            return None
+
+        loop = asyncio.get_running_loop()
+        with self._stats_lock:
+            ## a client whose loop has gone can't be used (or closed) any more
+            if self._client is None or self._client.is_closed or self._client_loop.is_closed():
+                self._client = self._new_client()
+                self._client_loop = loop
+            return self._client if self._client_loop is loop else None
+
+    async def aclose(self):
+        with self._stats_lock:
+            client = self._client
+            self._client = None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    async def _send(
+        self,
+        request: TakeOneRequest
+    ) -> BaseModel:
+
+        client = self._pooled_client()
+
+        self._request_started()
+        failed = True
+        try:
+            url = f'{self.base_url}{request.path}'
+            if client is not None:
+                r = await client.request(request.method, url, json=request.json_body)
+            else:
+                async with self._new_client() as client:
+                    r = await client.request(request.method, url, json=request.json_body)
+            failed = r.is_error
+        finally:
+            self._request_finished(failed=failed)
+
+        return self._parse_response(request, r)
+
+    def pool_stats(self) -> TakeOneClientPoolStats:
+        return self._pool_stats([self._client] if self._client is not None else [])
+
+    async def authorize(
+        self,
+        user_id: str
+    ) -> str:
+        return (await self._send(self._authorize_request(user_id=user_id))).code
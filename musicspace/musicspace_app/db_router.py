@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = 'replica'
+
+_replica_reads_enabled: ContextVar[bool] = ContextVar('replica_reads_enabled', default=False)
+
+## reads made inside this block go to the read replica, when one is configured.
+## only use it around read-only work that can tolerate replication lag, e.g. the
+## public search / detail views. works for sync and async code alike
+@contextmanager
+def replica_reads():
+    token = _replica_reads_enabled.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads_enabled.reset(token)
+
+class ReadReplicaRouter:
+
+    ## the logged in user and their session are always read from the primary, so a
+    ## user who just logged in (or out) never sees a stale session from the replica
+    def _is_replica_model(self, model) -> bool:
+        return model._meta.app_label == 'musicspace_app' and \
+            model._meta.model_name != 'musicspaceuser'
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads_enabled.get() and \
+            REPLICA_DB_ALIAS in settings.DATABASES and \
+            self._is_replica_model(model):
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    ## the replica holds the same data as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
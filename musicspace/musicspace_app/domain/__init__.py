@@ -1,22 +1,57 @@
 
 from .takeone_project_use_case import TakeOneProjectUseCase
 from .takeone_user_use_case import TakeOneUserUseCase
+from .provisioning_job_use_case import ProvisioningJobUseCase
+from .reference_data_cache import ReferenceDataCache, reference_data_cache
+from .page_cache import PageCache
+from .provider_search_use_case import (
+    ProviderSearchUseCase, Modality, QueryParameters, FacetCounts
+)
 import musicspace_app.settings as app_settings
 
-from musicspace_app.service_locator import takeone_client
+from musicspace_app.service_locator import (
+    takeone_client, async_takeone_client, background_executor
+)
+
+## anonymous responses of the public views, see views.AnonymousPageCacheMixin
+page_cache = PageCache(
+    reference_data_cache=reference_data_cache,
+    timeout_seconds=app_settings.PUBLIC_PAGE_CACHE_SECONDS
+)
 
 class UseCaseFactory():
 
     def takeone_project_use_case(self) -> TakeOneProjectUseCase:
         return TakeOneProjectUseCase(
             takeone_client=takeone_client,
-            profile_video_container_template_id=app_settings.TAKEONE_VIDEO_CONTAINER_TEMPLATE_ID
+            profile_video_container_template_id=app_settings.TAKEONE_VIDEO_CONTAINER_TEMPLATE_ID,
+            background_executor=background_executor,
+            staleness_seconds=app_settings.TAKEONE_VIDEO_CONTAINER_STALENESS_SECONDS,
+            unpublished_staleness_seconds=app_settings.TAKEONE_VIDEO_CONTAINER_UNPUBLISHED_STALENESS_SECONDS,
+            page_cache=page_cache,
+            webhook_token=app_settings.TAKEONE_WEBHOOK_TOKEN
         )
 
     def takeone_user_use_case(self) -> TakeOneUserUseCase:
         return TakeOneUserUseCase(
             takeone_client=takeone_client,
-            from_email=app_settings.FROM_EMAIL
+            from_email=app_settings.FROM_EMAIL,
+            async_takeone_client=async_takeone_client
+        )
+
+    def provisioning_job_use_case(self) -> ProvisioningJobUseCase:
+        return ProvisioningJobUseCase(
+            takeone_user_use_case=self.takeone_user_use_case(),
+            takeone_project_use_case=self.takeone_project_use_case(),
+            max_attempts=app_settings.PROVISIONING_JOB_MAX_ATTEMPTS,
+            retry_delay_seconds=app_settings.PROVISIONING_JOB_RETRY_DELAY_SECONDS,
+            lock_timeout_seconds=app_settings.PROVISIONING_JOB_LOCK_TIMEOUT_SECONDS
+        )
+
+    def provider_search_use_case(self) -> ProviderSearchUseCase:
+        return ProviderSearchUseCase(
+            reference_data_cache=reference_data_cache,
+            facet_counts_cache_seconds=app_settings.PROVIDER_FACET_COUNTS_CACHE_SECONDS
         )
 
 use_case_factory = UseCaseFactory()
\ No newline at end of file
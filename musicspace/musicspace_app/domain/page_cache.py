@@ -0,0 +1,83 @@
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import uuid
+from django.core.cache import cache
+from .reference_data_cache import ReferenceDataCache
+
+LIST_PAGES_VERSION_CACHE_KEY = 'page_cache:list:version'
+
+## whole rendered pages for anonymous visitors of the public views. entries are never
+## deleted; instead every key includes version tokens that are replaced when the data
+## on the page changes:
+##  - list pages (index / find-a-teacher) change whenever any provider does
+##  - a provider detail page only changes with that provider or its video container
+##  - every page shows genre / instrument names, so both include the reference data version
+class PageCache:
+
+    def __init__(
+        self,
+        reference_data_cache: ReferenceDataCache,
+        timeout_seconds: int = 300
+    ):
+        self.reference_data_cache = reference_data_cache
+        self.timeout_seconds = timeout_seconds
+
+    def _provider_version_cache_key(self, provider_id) -> str:
+        return f'page_cache:provider:{provider_id}:version'
+
+    ## a fresh random token rather than a counter, so a version key that was evicted
+    ## and recreated can never point back at an old page
+    def _get_versions(self, version_keys: List[str]) -> List[Any]:
+        cached_versions = cache.get_many(version_keys)
+
+        versions = []
+        for version_key in version_keys:
+            version = cached_versions.get(version_key)
+            if version is None:
+                version = uuid.uuid4().hex
+                if not cache.add(version_key, version, timeout=None):
+                    version = cache.get(version_key, version)
+            versions.append(version)
+        return versions
+
+    def _build_key(self, name: str, version_keys: List[str], key_parts: List[Any]) -> str:
+        versions = [self.reference_data_cache.version()] + self._get_versions(version_keys=version_keys)
+        key_parts_hash = hashlib.sha256(
+            json.dumps(key_parts, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        return f"page_cache:{name}:{':'.join(str(version) for version in versions)}:{key_parts_hash}"
+
+    def list_page_key(self, name: str, key_parts: List[Any]) -> str:
+        return self._build_key(
+            name=name,
+            version_keys=[LIST_PAGES_VERSION_CACHE_KEY],
+            key_parts=key_parts
+        )
+
+    def provider_page_key(self, name: str, provider_id, key_parts: List[Any]) -> str:
+        return self._build_key(
+            name=name,
+            version_keys=[self._provider_version_cache_key(provider_id)],
+            key_parts=key_parts
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return cache.get(key)
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        cache.set(key, entry, timeout=self.timeout_seconds)
+
+    def invalidate_list_pages(self):
+        cache.set(LIST_PAGES_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+    ## the provider shows up on the list pages as well as their own detail page
+    def invalidate_provider(self, provider_id):
+        cache.set_many({
+            LIST_PAGES_VERSION_CACHE_KEY: uuid.uuid4().hex,
+            self._provider_version_cache_key(provider_id): uuid.uuid4().hex
+        }, timeout=None)
+
+    ## the video is only shown on the detail page
+    def invalidate_provider_detail(self, provider_id):
+        cache.set(self._provider_version_cache_key(provider_id), uuid.uuid4().hex, timeout=None)
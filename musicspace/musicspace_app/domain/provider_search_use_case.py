@@ -0,0 +1,337 @@
+from typing import Dict, Iterable, List, Optional
+from dataclasses import dataclass, field
+from enum import Enum
+import hashlib
+import json
+from pydantic import BaseModel
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, QuerySet
+from musicspace_app.models import (
+    Provider, ProviderSearchIndex
+)
+from musicspace_app.sqlite import serialized_write
+from .reference_data_cache import ReferenceDataCache
+
+class Modality(str, Enum):
+    IN_PERSON_ONLY = 'in_person_only'
+    ONLINE_ONLY = 'online_only'
+    EITHER = 'either'
+
+@dataclass
+class QueryParameters:
+    modality: Modality = Modality.EITHER
+    genre: List[str] = field(default_factory=list)
+    instrument: List[str] = field(default_factory=list)
+
+class FacetCounts(BaseModel):
+    total: int
+    genres: Dict[str, int]
+    instruments: Dict[str, int]
+    modalities: Dict[str, int]
+
+FACET_COUNTS_VERSION_CACHE_KEY = 'provider_search:facet_counts:version'
+
+def _mask_from_bits(search_bits: Iterable[Optional[int]]) -> int:
+    mask = 0
+    for search_bit in search_bits:
+        if search_bit is not None:
+            mask |= 1 << search_bit
+    return mask
+
+class ProviderSearchUseCase:
+
+    def __init__(
+        self,
+        reference_data_cache: ReferenceDataCache,
+        facet_counts_cache_seconds: int = 300
+    ):
+        self.reference_data_cache = reference_data_cache
+        self.facet_counts_cache_seconds = facet_counts_cache_seconds
+
+    def genre_mask(
+        self,
+        genre_ids: List[str]
+    ) -> int:
+        genre_search_bits = self.reference_data_cache.genre_search_bits()
+        return _mask_from_bits(genre_search_bits.get(genre_id) for genre_id in genre_ids)
+
+    def instrument_mask(
+        self,
+        instrument_ids: List[str]
+    ) -> int:
+        instrument_search_bits = self.reference_data_cache.instrument_search_bits()
+        return _mask_from_bits(instrument_search_bits.get(instrument_id) for instrument_id in instrument_ids)
+
+    ## the masks of many providers, with the search bits looked up once
+    def genre_masks(
+        self,
+        genre_id_lists: List[List[str]]
+    ) -> List[int]:
+        genre_search_bits = self.reference_data_cache.genre_search_bits()
+        return [
+            _mask_from_bits(genre_search_bits.get(genre_id) for genre_id in genre_ids)
+            for genre_ids in genre_id_lists
+        ]
+
+    def instrument_masks(
+        self,
+        instrument_id_lists: List[List[str]]
+    ) -> List[int]:
+        instrument_search_bits = self.reference_data_cache.instrument_search_bits()
+        return [
+            _mask_from_bits(instrument_search_bits.get(instrument_id) for instrument_id in instrument_ids)
+            for instrument_ids in instrument_id_lists
+        ]
+
+    def _modality_filter(
+        self,
+        modality: Optional[Modality]
+    ) -> Q:
+        if modality == Modality.IN_PERSON_ONLY:
+            return Q(in_person=True)
+        elif modality == Modality.ONLINE_ONLY:
+            return Q(online=True)
+        else:
+            return Q()
+
+    ## if genres are selected, we want to include teachers that match ANY of the genres.
+    ## the filter refers to the `matching_genres` alias added by `search`
+    def _genre_filter(
+        self,
+        query_params: QueryParameters
+    ) -> Q:
+        if query_params.genre:
+            return ~Q(matching_genres=0)
+        else:
+            return Q()
+
+    def _instrument_filter(
+        self,
+        query_params: QueryParameters
+    ) -> Q:
+        if query_params.instrument:
+            return ~Q(matching_instruments=0)
+        else:
+            return Q()
+
+    def _annotated_index(
+        self,
+        query_params: QueryParameters
+    ) -> QuerySet:
+        search_index_queryset = ProviderSearchIndex.objects.all()
+
+        if query_params.genre:
+            search_index_queryset = search_index_queryset.alias(
+                matching_genres=F('genre_mask').bitand(
+                    self.genre_mask(genre_ids=query_params.genre)
+                )
+            )
+
+        if query_params.instrument:
+            search_index_queryset = search_index_queryset.alias(
+                matching_instruments=F('instrument_mask').bitand(
+                    self.instrument_mask(instrument_ids=query_params.instrument)
+                )
+            )
+
+        return search_index_queryset
+
+    ## searches the denormalized ProviderSearchIndex table, so filtering, counting and
+    ## ordering never join the genre / instrument tables. returns index entries
+    def search(
+        self,
+        query_params: QueryParameters
+    ) -> QuerySet:
+        search_index_queryset = self._annotated_index(query_params=query_params).filter(
+            self._modality_filter(modality=query_params.modality),
+            self._genre_filter(query_params=query_params),
+            self._instrument_filter(query_params=query_params)
+        )
+
+        ## the provider rows are only joined (by primary key) for the page being rendered
+        return search_index_queryset.select_related(
+            'provider', 'provider__user', 'provider__location'
+        ).order_by('date_joined', 'provider_id')
+
+    def _remove_search_bit(
+        self,
+        mask_field: str,
+        search_bit: int
+    ):
+        ProviderSearchIndex.objects.alias(
+            search_bit_set=F(mask_field).bitand(1 << search_bit)
+        ).exclude(search_bit_set=0).update(
+            **{mask_field: F(mask_field).bitand(~(1 << search_bit))}
+        )
+
+    ## a deleted genre / instrument's bit is cleared from the index, since removing it
+    ## from the providers (the cascade) doesn't send m2m_changed
+    def remove_genre_search_bit(
+        self,
+        search_bit: int
+    ):
+        self._remove_search_bit(mask_field='genre_mask', search_bit=search_bit)
+
+    def remove_instrument_search_bit(
+        self,
+        search_bit: int
+    ):
+        self._remove_search_bit(mask_field='instrument_mask', search_bit=search_bit)
+
+    def _facet_counts_cache_key(
+        self,
+        query_params: QueryParameters
+    ) -> str:
+        version = cache.get_or_set(FACET_COUNTS_VERSION_CACHE_KEY, 1, timeout=None)
+        normalized_query_params = json.dumps([
+            query_params.modality or Modality.EITHER,
+            sorted(query_params.genre),
+            sorted(query_params.instrument)
+        ])
+        query_params_hash = hashlib.sha256(normalized_query_params.encode('utf-8')).hexdigest()
+        return f'provider_search:facet_counts:{version}:{query_params_hash}'
+
+    def invalidate_facet_counts(self):
+        try:
+            cache.incr(FACET_COUNTS_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(FACET_COUNTS_VERSION_CACHE_KEY, 1, timeout=None)
+
+    ## counts for the current search, plus how many results there would be for each
+    ## genre / instrument / modality given the other selected filters, in a single query
+    def facet_counts(
+        self,
+        query_params: QueryParameters
+    ) -> FacetCounts:
+        cache_key = self._facet_counts_cache_key(query_params=query_params)
+        cached_facet_counts = cache.get(cache_key)
+        if cached_facet_counts is not None:
+            return FacetCounts(**cached_facet_counts)
+
+        modality_filter = self._modality_filter(modality=query_params.modality)
+        genre_filter = self._genre_filter(query_params=query_params)
+        instrument_filter = self._instrument_filter(query_params=query_params)
+
+        genres = [genre for genre in self.reference_data_cache.genres() if genre.search_bit is not None]
+        instruments = [instrument for instrument in self.reference_data_cache.instruments() if instrument.search_bit is not None]
+
+        search_index_queryset = self._annotated_index(query_params=query_params)
+        aggregations = {
+            'total': Count('pk', filter=modality_filter & genre_filter & instrument_filter),
+            'modality_either': Count('pk', filter=genre_filter & instrument_filter)
+        }
+
+        for modality in [Modality.IN_PERSON_ONLY, Modality.ONLINE_ONLY]:
+            aggregations[f'modality_{modality.value}'] = Count(
+                'pk',
+                filter=self._modality_filter(modality=modality) & genre_filter & instrument_filter
+            )
+
+        for genre in genres:
+            alias = f'genre_{genre.search_bit}'
+            search_index_queryset = search_index_queryset.alias(
+                **{alias: F('genre_mask').bitand(1 << genre.search_bit)}
+            )
+            aggregations[alias] = Count(
+                'pk',
+                filter=~Q(**{alias: 0}) & modality_filter & instrument_filter
+            )
+
+        for instrument in instruments:
+            alias = f'instrument_{instrument.search_bit}'
+            search_index_queryset = search_index_queryset.alias(
+                **{alias: F('instrument_mask').bitand(1 << instrument.search_bit)}
+            )
+            aggregations[alias] = Count(
+                'pk',
+                filter=~Q(**{alias: 0}) & modality_filter & genre_filter
+            )
+
+        result = search_index_queryset.aggregate(**aggregations)
+
+        facet_counts = FacetCounts(
+            total=result['total'],
+            genres={genre.id: result[f'genre_{genre.search_bit}'] for genre in genres},
+            instruments={instrument.id: result[f'instrument_{instrument.search_bit}'] for instrument in instruments},
+            modalities={modality.value: result[f'modality_{modality.value}'] for modality in Modality}
+        )
+
+        cache.set(cache_key, facet_counts.dict(), timeout=self.facet_counts_cache_seconds)
+        return facet_counts
+
+    def _build_index_entry(
+        self,
+        provider: Provider
+    ) -> ProviderSearchIndex:
+        return ProviderSearchIndex(
+            provider=provider,
+            genre_mask=_mask_from_bits(genre.search_bit for genre in provider.genres.all()),
+            instrument_mask=_mask_from_bits(instrument.search_bit for instrument in provider.instruments.all()),
+            in_person=provider.in_person,
+            online=provider.online,
+            date_joined=provider.user.date_joined
+        )
+
+    def update_index(
+        self,
+        provider_id: str
+    ):
+        self.update_indexes(provider_ids=[provider_id])
+
+    ## updates the entries of several providers, loading them in one go. providers
+    ## that no longer exist are skipped
+    def update_indexes(
+        self,
+        provider_ids: List[str]
+    ):
+        providers = Provider.objects.select_related('user').prefetch_related(
+            'genres', 'instruments'
+        ).filter(id__in=provider_ids)
+
+        with serialized_write():
+            for provider in providers:
+                entry = self._build_index_entry(provider=provider)
+                ProviderSearchIndex.objects.update_or_create(
+                    provider=provider,
+                    defaults={
+                        'genre_mask': entry.genre_mask,
+                        'instrument_mask': entry.instrument_mask,
+                        'in_person': entry.in_person,
+                        'online': entry.online,
+                        'date_joined': entry.date_joined
+                    }
+                )
+
+        ## a request in between would otherwise count the old rows under the new version
+        transaction.on_commit(self.invalidate_facet_counts)
+
+    ## rebuilds the index for every provider, returning the number of entries written
+    def rebuild_index(
+        self,
+        batch_size: int = 1000
+    ) -> int:
+        providers = Provider.objects.select_related('user').prefetch_related(
+            'genres', 'instruments'
+        ).order_by('id')
+
+        ## searches keep seeing the old index until the new one is committed, and a
+        ## failed rebuild leaves the old one in place
+        with serialized_write():
+            ProviderSearchIndex.objects.all().delete()
+
+            count = 0
+            entries = []
+            for provider in providers.iterator(chunk_size=batch_size):
+                entries.append(self._build_index_entry(provider=provider))
+                if len(entries) >= batch_size:
+                    ProviderSearchIndex.objects.bulk_create(entries)
+                    count += len(entries)
+                    entries = []
+
+            ProviderSearchIndex.objects.bulk_create(entries)
+            count += len(entries)
+
+        transaction.on_commit(self.invalidate_facet_counts)
+
+        return count
\ No newline at end of file
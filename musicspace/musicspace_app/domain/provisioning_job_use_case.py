@@ -0,0 +1,183 @@
+from typing import Optional
+from datetime import timedelta
+from django.db.models import F, Q
+from django.utils import timezone
+
+from musicspace_app.models import (
+    Provider, TakeOneUser, TakeOneProfileVideoContainer, ProvisioningJob
+)
+from .takeone_user_use_case import TakeOneUserUseCase
+from .takeone_project_use_case import TakeOneProjectUseCase
+import musicspace_app.errors as app_errors
+from musicspace_app.sqlite import serialized_write
+
+class ProvisioningJobUseCase:
+
+    def __init__(
+        self,
+        takeone_user_use_case: TakeOneUserUseCase,
+        takeone_project_use_case: TakeOneProjectUseCase,
+        max_attempts: int = 5,
+        retry_delay_seconds: int = 30,
+        lock_timeout_seconds: int = 300
+    ):
+        self.takeone_user_use_case = takeone_user_use_case
+        self.takeone_project_use_case = takeone_project_use_case
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+        self.lock_timeout_seconds = lock_timeout_seconds
+
+    def get_latest_job(
+        self,
+        provider: Provider
+    ) -> Optional[ProvisioningJob]:
+        return ProvisioningJob.objects.filter(
+            provider=provider
+        ).order_by('-created_date_time').first()
+
+    def enqueue(
+        self,
+        provider: Provider
+    ) -> ProvisioningJob:
+
+        with serialized_write():
+            latest_job = self.get_latest_job(provider=provider)
+
+            if latest_job and latest_job.is_active:
+                return latest_job
+
+            ## a failed job is resumed rather than replaced so that the
+            ## steps it already completed are not repeated
+            if latest_job and latest_job.state == ProvisioningJob.State.FAILED:
+                latest_job.state = ProvisioningJob.State.PENDING
+                latest_job.attempts = 0
+                latest_job.available_date_time = timezone.now()
+                latest_job.locked_date_time = None
+                latest_job.save()
+                return latest_job
+
+            ## a new job would skip the user and video container steps but create a
+            ## second project and invitation (e.g. for a replayed request)
+            if latest_job and latest_job.state == ProvisioningJob.State.COMPLETED:
+                return latest_job
+
+            if TakeOneProfileVideoContainer.objects.filter(takeone_user__provider=provider).exists():
+                raise app_errors.BadRequestError()
+
+            job = ProvisioningJob(provider=provider)
+            job.full_clean()
+            job.save()
+            return job
+
+    def _claimable_jobs_filter(self) -> Q:
+        now = timezone.now()
+        lock_expired_date_time = now - timedelta(seconds=self.lock_timeout_seconds)
+        return Q(state=ProvisioningJob.State.PENDING, available_date_time__lte=now) | \
+            Q(state=ProvisioningJob.State.RUNNING, locked_date_time__lt=lock_expired_date_time)
+
+    def claim_next_job(self) -> Optional[ProvisioningJob]:
+
+        candidate_ids = ProvisioningJob.objects.filter(
+            self._claimable_jobs_filter()
+        ).order_by('created_date_time').values_list('id', flat=True)[:10]
+
+        for candidate_id in candidate_ids:
+            ## the conditional update is the lock. if another worker claimed
+            ## the job first, it no longer matches and nothing is updated
+            claimed = ProvisioningJob.objects.filter(
+                self._claimable_jobs_filter(),
+                id=candidate_id
+            ).update(
+                state=ProvisioningJob.State.RUNNING,
+                locked_date_time=timezone.now(),
+                attempts=F('attempts') + 1,
+                modified_date_time=timezone.now()
+            )
+
+            if claimed:
+                return ProvisioningJob.objects.select_related(
+                    'provider', 'provider__user'
+                ).get(id=candidate_id)
+
+        return None
+
+    def _advance(
+        self,
+        job: ProvisioningJob,
+        step: ProvisioningJob.Step
+    ):
+        job.step = step
+        job.save(update_fields=['step', 'takeone_project_id', 'modified_date_time'])
+
+    def _run_steps(
+        self,
+        job: ProvisioningJob
+    ):
+        provider = job.provider
+
+        if job.step == ProvisioningJob.Step.CREATE_USER:
+            if provider.takeone_user is None:
+                self.takeone_user_use_case.create_user(provider=provider)
+            self._advance(job, ProvisioningJob.Step.CREATE_VIDEO_CONTAINER)
+
+        takeone_user = TakeOneUser.objects.select_related(
+            'provider', 'provider__user'
+        ).get(provider=provider)
+
+        if job.step == ProvisioningJob.Step.CREATE_VIDEO_CONTAINER:
+            video_container_exists = TakeOneProfileVideoContainer.objects.filter(
+                takeone_user=takeone_user
+            ).exists()
+            if not video_container_exists:
+                self.takeone_project_use_case.create_profile_video_container(
+                    takeone_user=takeone_user
+                )
+            self._advance(job, ProvisioningJob.Step.CREATE_PROJECT)
+
+        if job.step == ProvisioningJob.Step.CREATE_PROJECT:
+            ## NOTE - TakeOne has no idempotency key for projects, so if the job dies
+            ## between the request succeeding and this save, the retry creates a second project
+            if not job.takeone_project_id:
+                video_container = TakeOneProfileVideoContainer.objects.get(
+                    takeone_user=takeone_user
+                )
+                takeone_project = self.takeone_project_use_case.create_project(
+                    takeone_user=takeone_user,
+                    video_container=video_container
+                )
+                job.takeone_project_id = takeone_project.id
+            self._advance(job, ProvisioningJob.Step.SEND_INVITATION)
+
+        if job.step == ProvisioningJob.Step.SEND_INVITATION:
+            self.takeone_user_use_case.send_invitation_email(
+                takeone_user=takeone_user
+            )
+            self._advance(job, ProvisioningJob.Step.DONE)
+
+    def run_job(
+        self,
+        job: ProvisioningJob
+    ):
+        try:
+            self._run_steps(job=job)
+        except BaseException as e:
+            print(f'an exception occurred running provisioning job {job.id}: {e}')
+            job.last_error = str(e)
+            job.locked_date_time = None
+            if job.attempts >= self.max_attempts:
+                job.state = ProvisioningJob.State.FAILED
+            else:
+                ## exponential backoff between attempts
+                delay = self.retry_delay_seconds * (2 ** (job.attempts - 1))
+                job.state = ProvisioningJob.State.PENDING
+                job.available_date_time = timezone.now() + timedelta(seconds=delay)
+            job.save()
+
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        job.state = ProvisioningJob.State.COMPLETED
+        job.locked_date_time = None
+        job.last_error = ''
+        job.save()
\ No newline at end of file
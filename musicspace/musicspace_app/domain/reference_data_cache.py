@@ -0,0 +1,57 @@
+from typing import Dict, List, Optional
+import threading
+from django.core.cache import cache
+from musicspace_app.models import Genre, Instrument
+
+REFERENCE_DATA_VERSION_CACHE_KEY = 'reference_data:version'
+
+## Genre and Instrument rows almost never change, so each process loads them once and
+## keeps them in memory. the version number lives in the shared django cache; saving or
+## deleting a genre / instrument bumps it (see signals.py), and every process reloads
+## the next time it sees a version it hasn't loaded
+class ReferenceDataCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._genres: List[Genre] = []
+        self._instruments: List[Instrument] = []
+
+    def version(self) -> int:
+        return cache.get_or_set(REFERENCE_DATA_VERSION_CACHE_KEY, 1, timeout=None)
+
+    def _load(self):
+        version = self.version()
+        if version == self._version:
+            return
+
+        with self._lock:
+            if version == self._version:
+                return
+            self._genres = list(Genre.objects.all())
+            self._instruments = list(Instrument.objects.all())
+            self._version = version
+
+    def genres(self) -> List[Genre]:
+        self._load()
+        return self._genres
+
+    def instruments(self) -> List[Instrument]:
+        self._load()
+        return self._instruments
+
+    def genre_search_bits(self) -> Dict[str, Optional[int]]:
+        return {genre.id: genre.search_bit for genre in self.genres()}
+
+    def instrument_search_bits(self) -> Dict[str, Optional[int]]:
+        return {instrument.id: instrument.search_bit for instrument in self.instruments()}
+
+    def invalidate(self):
+        try:
+            cache.incr(REFERENCE_DATA_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(REFERENCE_DATA_VERSION_CACHE_KEY, 1, timeout=None)
+        ## this process reloads on next access even if the shared cache is unavailable
+        self._version = None
+
+reference_data_cache = ReferenceDataCache()
\ No newline at end of file
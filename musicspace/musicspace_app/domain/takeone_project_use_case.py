@@ -1,41 +1,88 @@
 from typing import Dict, Any, Optional
+from concurrent.futures import Executor
+import hashlib
+import hmac
+from datetime import timedelta
 from django.core import mail
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from pydantic import ValidationError
 from django.template.loader import render_to_string
 from musicspace_app.data import (
     TakeOneClient, TakeOneWebhookRequest, CreateVideoContainerRequest,
-    CreateProjectRequest
+    CreateProjectRequest, VideoStream, VideoContainer, Project
 )
 from musicspace_app.models import (
-    TakeOneUser, TakeOneProfileVideoContainer
+    TakeOneUser, TakeOneProfileVideoContainer, TakeOneWebhookEvent
 )
 import musicspace_app.errors as app_errors
+from .page_cache import PageCache
+from musicspace_app.sqlite import serialized_write
 
 class TakeOneProjectUseCase:
 
     def __init__(
         self,
         takeone_client: TakeOneClient,
-        profile_video_container_template_id: str
+        profile_video_container_template_id: str,
+        background_executor: Optional[Executor] = None,
+        staleness_seconds: int = 300,
+        unpublished_staleness_seconds: int = 15,
+        page_cache: Optional[PageCache] = None,
+        webhook_token: str = ''
     ):
         self.takeone_client = takeone_client
         self.profile_video_container_template_id = profile_video_container_template_id
+        self.background_executor = background_executor
+        self.staleness_seconds = staleness_seconds
+        self.unpublished_staleness_seconds = unpublished_staleness_seconds
+        self.page_cache = page_cache
+        self.webhook_token = webhook_token
 
-    def create_profile_video_container(
+    ## the video is shown on the provider's public detail page. the conditional
+    ## updates below bypass the model signals, so the cached page is replaced here.
+    ## callers pass the provider id they already have, so this doesn't query
+    def _invalidate_video_container_page(
+        self,
+        provider_id
+    ):
+        if self.page_cache is None or provider_id is None:
+            return
+
+        page_cache = self.page_cache
+        transaction.on_commit(lambda: page_cache.invalidate_provider_detail(provider_id=provider_id))
+
+    ## the providers of the given video containers, in one query
+    def _video_container_provider_ids(
+        self,
+        video_container_ids
+    ) -> Dict[str, Any]:
+        if self.page_cache is None:
+            return {}
+
+        return dict(
+            TakeOneProfileVideoContainer.objects.filter(
+                id__in=video_container_ids
+            ).values_list('id', 'takeone_user__provider_id')
+        )
+
+    def _build_create_video_container_request(
         self,
         takeone_user: TakeOneUser
-    ) -> TakeOneProfileVideoContainer:
-        
-        display_name = f"{takeone_user.provider.full_name}'s profile video"
+    ) -> CreateVideoContainerRequest:
 
-        ## create video container
-        request = CreateVideoContainerRequest(
+        display_name = f"{takeone_user.provider.full_name}'s profile video"
+        return CreateVideoContainerRequest(
             template=self.profile_video_container_template_id,
             name=display_name
         )
 
-        takeone_client_video_container = self.takeone_client.create_video_container(
-            request=request
-        )
+    def _save_profile_video_container(
+        self,
+        takeone_user: TakeOneUser,
+        takeone_client_video_container: VideoContainer
+    ) -> TakeOneProfileVideoContainer:
 
         video_container = TakeOneProfileVideoContainer(
             id=takeone_client_video_container.id,
@@ -48,76 +95,288 @@ class TakeOneProjectUseCase:
 
         return video_container
 
-    def create_project(
+    def _build_create_project_request(
         self,
         takeone_user: TakeOneUser,
         video_container: TakeOneProfileVideoContainer
-    ):
+    ) -> CreateProjectRequest:
 
         display_name = f"{takeone_user.provider.full_name}'s project"
-        request = CreateProjectRequest(
+        return CreateProjectRequest(
             user=takeone_user.takeone_id,
             video_container=video_container.id,
             organization_display_name=display_name
         )
 
-        takeone_client_project = self.takeone_client.create_project(
+    def _video_stream_fields(
+        self,
+        video_stream: Optional[VideoStream]
+    ) -> Dict[str, str]:
+        if video_stream:
+            return {
+                'video_stream_src': video_stream.src,
+                'video_stream_type': video_stream.type,
+                'video_stream_video_format': video_stream.video_format.value
+            }
+        else:
+            return {
+                'video_stream_src': '',
+                'video_stream_type': '',
+                'video_stream_video_format': ''
+            }
+
+    ## returns whether any of the stream fields changed
+    def _apply_video_stream(
+        self,
+        video_container: TakeOneProfileVideoContainer,
+        video_stream: Optional[VideoStream]
+    ) -> bool:
+        changed = False
+        for (field_name, value) in self._video_stream_fields(video_stream).items():
+            if getattr(video_container, field_name) != value:
+                setattr(video_container, field_name, value)
+                changed = True
+
+        return changed
+
+    ## saves the stream fields unless a webhook was applied since the container was
+    ## loaded, in which case the webhook wins and the container is reloaded
+    def _save_video_stream(
+        self,
+        video_container: TakeOneProfileVideoContainer
+    ):
+        video_container.clean_fields()
+        video_container.modified_date_time = timezone.now()
+
+        updated = TakeOneProfileVideoContainer.objects.filter(
+            id=video_container.id,
+            takeone_event_timestamp=video_container.takeone_event_timestamp
+        ).update(
+            video_stream_src=video_container.video_stream_src,
+            video_stream_type=video_container.video_stream_type,
+            video_stream_video_format=video_container.video_stream_video_format,
+            modified_date_time=video_container.modified_date_time
+        )
+
+        if updated:
+            ## the takeone user is loaded along with the container by the callers
+            self._invalidate_video_container_page(provider_id=video_container.takeone_user.provider_id)
+        else:
+            video_container.refresh_from_db()
+
+    ## applies the webhook with a single conditional UPDATE, so an event older than
+    ## the last one applied (or for an unknown container) changes nothing.
+    ## returns whether the container was updated
+    def _apply_webhook_request(
+        self,
+        webhook_request: TakeOneWebhookRequest,
+        provider_id=None
+    ) -> bool:
+        updated = TakeOneProfileVideoContainer.objects.filter(
+            id=webhook_request.video_container.id,
+            takeone_event_timestamp__lt=webhook_request.timestamp
+        ).update(
+            **self._video_stream_fields(webhook_request.video_container.video_stream),
+            takeone_event_timestamp=webhook_request.timestamp,
+            modified_date_time=timezone.now()
+        )
+
+        if updated:
+            self._invalidate_video_container_page(provider_id=provider_id)
+
+        return updated > 0
+
+    def create_profile_video_container(
+        self,
+        takeone_user: TakeOneUser
+    ) -> TakeOneProfileVideoContainer:
+
+        ## create video container
+        request = self._build_create_video_container_request(
+            takeone_user=takeone_user
+        )
+
+        takeone_client_video_container = self.takeone_client.create_video_container(
+            request=request
+        )
+
+        return self._save_profile_video_container(
+            takeone_user=takeone_user,
+            takeone_client_video_container=takeone_client_video_container
+        )
+
+    def create_project(
+        self,
+        takeone_user: TakeOneUser,
+        video_container: TakeOneProfileVideoContainer
+    ) -> Project:
+
+        request = self._build_create_project_request(
+            takeone_user=takeone_user,
+            video_container=video_container
+        )
+
+        return self.takeone_client.create_project(
             request=request
         )
 
-    def decode_webhook_request(
+    ## stores the raw webhook body for run_webhook_consumer to apply.
+    ## redeliveries of an identical body are ignored
+    def store_webhook_event(
         self,
-        webhook_request_dict: Dict[str, Any]
-    ) -> TakeOneWebhookRequest:
+        payload: bytes,
+        token: Optional[str] = None
+    ):
+        ## the token is part of the webhook url registered with TakeOne
+        if self.webhook_token and not hmac.compare_digest(token or '', self.webhook_token):
+            raise app_errors.ForbiddenError()
+
+        ## only bodies the consumer can apply are stored
         try:
-            return TakeOneWebhookRequest(**webhook_request_dict)
-        except BaseException as e:
+            TakeOneWebhookRequest.parse_raw(payload)
+        except ValidationError as e:
             print(f'an exception occurred parsing the webhook request: {e}')
             raise app_errors.BadRequestError()
 
-    def handle_webhook(
-        self,
-        webhook_request: TakeOneWebhookRequest
-    ):
-        
-        ## update local video container with the streaming video info
-        video_container = TakeOneProfileVideoContainer.objects.get(
-            id=webhook_request.video_container.id
+        event = TakeOneWebhookEvent(
+            event_hash=hashlib.sha256(payload).hexdigest(),
+            payload=payload.decode('utf-8')
         )
 
-        video_stream = webhook_request.video_container.video_stream
-        if video_stream:
-            video_container.video_stream_src = video_stream.src
-            video_container.video_stream_type = video_stream.type
-            video_container.video_stream_video_format = video_stream.video_format
-        else:
-            video_container.video_stream_src = ''
-            video_container.video_stream_type = ''
-            video_container.video_stream_video_format = ''
+        TakeOneWebhookEvent.objects.bulk_create([event], ignore_conflicts=True)
 
-        video_container.full_clean()
-        video_container.save()
+    ## deletes the events that were applied more than `retention_days` ago and
+    ## returns how many were deleted
+    def delete_processed_webhook_events(
+        self,
+        retention_days: int
+    ) -> int:
+        with serialized_write():
+            (count, _) = TakeOneWebhookEvent.objects.filter(
+                processed_date_time__lt=timezone.now() - timedelta(days=retention_days)
+            ).delete()
+        return count
+
+    ## applies the next batch of stored webhook events and returns how many were consumed.
+    ## only the newest event (by timestamp) per video container is applied
+    def process_webhook_events(
+        self,
+        batch_size: int = 100
+    ) -> int:
+
+        with serialized_write():
+            ## skip_locked lets several consumers run against postgres.
+            ## it is ignored on sqlite, where writes are serialized anyway
+            events = list(
+                TakeOneWebhookEvent.objects.select_for_update(skip_locked=True)
+                    .filter(processed_date_time__isnull=True)
+                    .order_by('id')[:batch_size]
+            )
+
+            if not events:
+                return 0
+
+            latest_webhook_requests: Dict[str, TakeOneWebhookRequest] = {}
+            errors: Dict[int, str] = {}
+            for event in events:
+                try:
+                    webhook_request = TakeOneWebhookRequest.parse_raw(event.payload)
+                except ValidationError as e:
+                    print(f'an exception occurred parsing webhook event {event.id}: {e}')
+                    errors[event.id] = str(e)
+                    continue
+
+                video_container_id = webhook_request.video_container.id
+                latest_webhook_request = latest_webhook_requests.get(video_container_id)
+                if latest_webhook_request is None or \
+                    webhook_request.timestamp >= latest_webhook_request.timestamp:
+                    latest_webhook_requests[video_container_id] = webhook_request
+
+            provider_ids = self._video_container_provider_ids(latest_webhook_requests.keys())
+            for (video_container_id, webhook_request) in latest_webhook_requests.items():
+                self._apply_webhook_request(
+                    webhook_request=webhook_request,
+                    provider_id=provider_ids.get(video_container_id)
+                )
+
+            now = timezone.now()
+            TakeOneWebhookEvent.objects.filter(
+                id__in=[event.id for event in events if event.id not in errors]
+            ).update(processed_date_time=now)
+
+            for event_id, error in errors.items():
+                TakeOneWebhookEvent.objects.filter(id=event_id).update(
+                    processed_date_time=now,
+                    error=error
+                )
+
+            return len(events)
 
     def update_video_container_from_server(
         self,
         video_container: TakeOneProfileVideoContainer
     ) -> TakeOneProfileVideoContainer:
-        
+
         takeone_client_video_container = self.takeone_client.fetch_video_container(
             video_container_id=video_container.id
         )
 
-        video_stream = takeone_client_video_container.video_stream
-        if video_stream:
-            video_container.video_stream_src = video_stream.src
-            video_container.video_stream_type = video_stream.type
-            video_container.video_stream_video_format = video_stream.video_format
+        changed = self._apply_video_stream(
+            video_container=video_container,
+            video_stream=takeone_client_video_container.video_stream
+        )
+
+        if changed:
+            self._save_video_stream(video_container=video_container)
+
+        return video_container
+
+    def _refresh_cache_key(
+        self,
+        video_container: TakeOneProfileVideoContainer
+    ) -> str:
+        return f'takeone:video_container:{video_container.id}:refreshed'
+
+    def _refresh_video_container(
+        self,
+        video_container_id: str
+    ):
+        ## runs on a background thread, so it owns its own db connection
+        close_old_connections()
+        try:
+            video_container = TakeOneProfileVideoContainer.objects.select_related(
+                'takeone_user'
+            ).get(id=video_container_id)
+            self.update_video_container_from_server(
+                video_container=video_container
+            )
+        except BaseException as e:
+            print(f'an exception occurred refreshing video container {video_container_id}: {e}')
+        finally:
+            close_old_connections()
+
+    ## schedules a background refresh if the container hasn't been refreshed
+    ## within its staleness window. the container passed in is not modified
+    def refresh_video_container_if_stale(
+        self,
+        video_container: TakeOneProfileVideoContainer
+    ) -> bool:
+        if video_container.should_render_video:
+            timeout = self.staleness_seconds
         else:
-            video_container.video_stream_src = ''
-            video_container.video_stream_type = ''
-            video_container.video_stream_video_format = ''
+            timeout = self.unpublished_staleness_seconds
 
-        video_container.full_clean()
-        video_container.save()
+        ## cache.add only succeeds for the first caller within the window,
+        ## so concurrent page loads schedule a single refresh
+        if not cache.add(self._refresh_cache_key(video_container), True, timeout=timeout):
+            return False
+
+        if self.background_executor is None:
+            self._refresh_video_container(video_container_id=video_container.id)
+        else:
+            self.background_executor.submit(
+                self._refresh_video_container,
+                video_container_id=video_container.id
+            )
 
-        return video_container
\ No newline at end of file
+        return True
\ No newline at end of file
@@ -1,8 +1,9 @@
 from typing import Optional
+from asgiref.sync import sync_to_async
 from django.core import mail
 from django.template.loader import render_to_string
 
-from musicspace_app.data import TakeOneClient, CreateUserRequest
+from musicspace_app.data import TakeOneClient, AsyncTakeOneClient, CreateUserRequest, User
 from musicspace_app.models import (
     Provider, TakeOneUser
 )
@@ -12,32 +13,33 @@ class TakeOneUserUseCase:
     def __init__(
         self,
         takeone_client: TakeOneClient,
-        from_email: str
+        from_email: str,
+        async_takeone_client: Optional[AsyncTakeOneClient] = None
     ):
         self.takeone_client = takeone_client
+        self.async_takeone_client = async_takeone_client
         self.from_email = from_email
 
-    def create_user(
+    def _build_create_user_request(
         self,
         provider: Provider
-    ) -> TakeOneUser:
+    ) -> CreateUserRequest:
 
         existing_takeone_user = provider.takeone_user
         if existing_takeone_user is not None:
             raise Exception("A TakeOne user already exists for this user.")
 
-        request = CreateUserRequest(
+        return CreateUserRequest(
             external_id=str(provider.id),
             display_name=provider.full_name,
             email_address=provider.user.email
         )
 
-        ## issue request to create new user
-        ## TODO - if this fails, check to see if the user already exists
-        ## there is a constrait that external_id is unique to the org
-        takeone_client_user = self.takeone_client.create_user(
-            request=request
-        )
+    def _save_takeone_user(
+        self,
+        provider: Provider,
+        takeone_client_user: User
+    ) -> TakeOneUser:
 
         ## if the request was successful, save the takeone user object
         takeone_user = TakeOneUser(
@@ -50,6 +52,25 @@ class TakeOneUserUseCase:
 
         return takeone_user
 
+    def create_user(
+        self,
+        provider: Provider
+    ) -> TakeOneUser:
+
+        request = self._build_create_user_request(provider=provider)
+
+        ## issue request to create new user
+        ## TODO - if this fails, check to see if the user already exists
+        ## there is a constrait that external_id is unique to the org
+        takeone_client_user = self.takeone_client.create_user(
+            request=request
+        )
+
+        return self._save_takeone_user(
+            provider=provider,
+            takeone_client_user=takeone_client_user
+        )
+
     def get_auth_code(
         self,
         user: TakeOneUser
@@ -57,14 +78,32 @@ class TakeOneUserUseCase:
         return self.takeone_client.authorize(
             user_id=user.takeone_id
         )
-    
+
+    async def aget_auth_code(
+        self,
+        user: TakeOneUser
+    ) -> str:
+        return await self.async_takeone_client.authorize(
+            user_id=user.takeone_id
+        )
+
     def _generate_invitation_email(
         self,
         takeone_user: TakeOneUser
     ) -> mail.EmailMessage:
+        code = self.get_auth_code(user=takeone_user)
+        return self._build_invitation_email(
+            takeone_user=takeone_user,
+            code=code
+        )
+
+    def _build_invitation_email(
+        self,
+        takeone_user: TakeOneUser,
+        code: str
+    ) -> mail.EmailMessage:
 
         recipient_description = takeone_user.provider.full_name
-        code = self.get_auth_code(user=takeone_user)
 
         subject = f'Your TakeOne Video Invitation'
         context = {
@@ -92,13 +131,30 @@ class TakeOneUserUseCase:
         msg.attach_alternative(invitation_html_email, "text/html")
 
         return msg
-    
+
+    def _send_email_message(
+        self,
+        email_message: mail.EmailMessage
+    ):
+        connection = mail.get_connection()
+        connection.send_messages([email_message])
+
     def send_invitation_email(
         self,
         takeone_user: TakeOneUser
     ):
-        connection = mail.get_connection()
         email_message = self._generate_invitation_email(
             takeone_user=takeone_user
         )
-        connection.send_messages([email_message])
\ No newline at end of file
+        self._send_email_message(email_message)
+
+    async def asend_invitation_email(
+        self,
+        takeone_user: TakeOneUser
+    ):
+        code = await self.aget_auth_code(user=takeone_user)
+        email_message = await sync_to_async(self._build_invitation_email)(
+            takeone_user=takeone_user,
+            code=code
+        )
+        await sync_to_async(self._send_email_message)(email_message)
\ No newline at end of file
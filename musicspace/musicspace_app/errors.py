@@ -4,4 +4,9 @@ from django.core.exceptions import ValidationError
 class BadRequestError(APIException):
     status_code = 400
     default_detail = 'Bad Request'
-    default_code = 'bad_request'
\ No newline at end of file
+    default_code = 'bad_request'
+
+class ForbiddenError(APIException):
+    status_code = 403
+    default_detail = 'Forbidden'
+    default_code = 'forbidden'
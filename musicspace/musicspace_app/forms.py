@@ -1,5 +1,30 @@
 from django import forms
+from django.forms.models import ModelChoiceIterator
 from musicspace_app.models import Address, Provider, MusicspaceUser, Genre, Instrument
+from musicspace_app.domain import reference_data_cache
+
+## renders the choices from the in-process reference data cache instead of querying
+## the genre / instrument table every time the form is rendered
+class ReferenceDataChoiceIterator(ModelChoiceIterator):
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.get_reference_data():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.get_reference_data()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or len(self.field.get_reference_data()) > 0
+
+class ReferenceDataMultipleChoiceField(forms.ModelMultipleChoiceField):
+    iterator = ReferenceDataChoiceIterator
+
+    def __init__(self, get_reference_data, **kwargs):
+        self.get_reference_data = get_reference_data
+        super().__init__(**kwargs)
 
 class MusicspaceUserForm(forms.ModelForm):
 
@@ -32,12 +57,14 @@ class ProviderForm(forms.ModelForm):
     title = forms.CharField(widget=forms.TextInput(attrs={'class': 'form-control'}))
     text = forms.CharField(widget=forms.Textarea(attrs={'class': 'form-control'}))
     image_url = forms.CharField(widget=forms.TextInput(attrs={'class': 'form-control'}))
-    genres = forms.ModelMultipleChoiceField(
+    genres = ReferenceDataMultipleChoiceField(
+        get_reference_data=reference_data_cache.genres,
         queryset=Genre.objects.all(),
         widget=forms.SelectMultiple(attrs={'class': 'form-control'})
     )
 
-    instruments = forms.ModelMultipleChoiceField(
+    instruments = ReferenceDataMultipleChoiceField(
+        get_reference_data=reference_data_cache.instruments,
         queryset=Instrument.objects.all(),
         widget=forms.SelectMultiple(attrs={'class': 'form-control'})
     )
@@ -0,0 +1,66 @@
+from typing import Dict, List
+import uuid
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import SafeString, mark_safe
+from musicspace_app.models import Provider
+import musicspace_app.settings as app_settings
+
+PROVIDER_LIST_ITEM_TEMPLATE = 'musicspace_app/components/provider_list_item.html'
+
+## the provider list renders the same card for a teacher on every page load, but its
+## content only changes with the teacher's profile. the rendered html is cached under
+## the provider id plus a content version; any change to the provider, their user,
+## address, genres or instruments bumps the version (see signals.py), which orphans
+## the old fragment. the version lives in the django cache, so with a per-process
+## cache the other workers only notice when their fragment expires
+
+def _version_cache_key(provider_id) -> str:
+    return f'provider_list_item:{provider_id}:version'
+
+def _fragment_cache_key(provider_id, version: str) -> str:
+    return f'provider_list_item:{provider_id}:{version}'
+
+def bump_provider_list_item_version(provider_id):
+    ## a fresh random version rather than a counter, so a version key that was
+    ## evicted and recreated can never point back at an old fragment
+    cache.set(_version_cache_key(provider_id), uuid.uuid4().hex, timeout=None)
+
+def _get_versions(providers: List[Provider]) -> Dict[str, str]:
+    version_keys = {_version_cache_key(provider.id): provider for provider in providers}
+    cached_versions = cache.get_many(version_keys.keys())
+
+    versions = {}
+    for version_key, provider in version_keys.items():
+        version = cached_versions.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            ## another worker may have set the version first, in which case use theirs
+            if not cache.add(version_key, version, timeout=None):
+                version = cache.get(version_key, version)
+        versions[provider.id] = version
+    return versions
+
+## returns the rendered list item for each provider, in order, rendering and caching
+## only the ones that are missing
+def render_provider_list_items(providers: List[Provider]) -> List[SafeString]:
+    versions = _get_versions(providers=providers)
+    fragment_keys = {
+        provider.id: _fragment_cache_key(provider.id, versions[provider.id]) for provider in providers
+    }
+    cached_fragments = cache.get_many(fragment_keys.values())
+
+    fragments = []
+    missing_fragments = {}
+    for provider in providers:
+        fragment_key = fragment_keys[provider.id]
+        fragment = cached_fragments.get(fragment_key)
+        if fragment is None:
+            fragment = render_to_string(PROVIDER_LIST_ITEM_TEMPLATE, {'provider': provider})
+            missing_fragments[fragment_key] = fragment
+        fragments.append(mark_safe(fragment))
+
+    if missing_fragments:
+        cache.set_many(missing_fragments, timeout=app_settings.PROVIDER_LIST_ITEM_CACHE_SECONDS)
+
+    return fragments
@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from musicspace_app.models import Address, MusicspaceUser, Provider
+from musicspace_app.domain import page_cache, use_case_factory
+from musicspace_app.migrations.helpers.provider_data_migration import (
+    delete_providers_with_username_prefix, generate_seed_username_prefix
+)
+from musicspace_app.sqlite import serialized_write
+
+## removes a batch added by `seed_providers` with one DELETE per table. only rows
+## tagged with the batch are touched
+class Command(BaseCommand):
+    help = 'Deletes the providers (and their users, addresses, genres, instruments and search index entries) of a seeded batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch',
+            default='default',
+            help='Tag the providers were seeded with'
+        )
+
+    def handle(self, *args, **options):
+        batch = options['batch']
+        started_at = time.monotonic()
+
+        try:
+            with serialized_write():
+                count = delete_providers_with_username_prefix(
+                    Provider=Provider,
+                    Address=Address,
+                    MusicspaceUser=MusicspaceUser,
+                    username_prefix=generate_seed_username_prefix(batch=batch),
+                    using=DEFAULT_DB_ALIAS
+                )
+        except ValueError as e:
+            raise CommandError(f'Batch `{batch}` was not deleted: {e}')
+
+        ## the raw deletes don't send the signals that normally do this. cached detail
+        ## pages of the deleted providers expire after PUBLIC_PAGE_CACHE_SECONDS
+        use_case_factory.provider_search_use_case().invalidate_facet_counts()
+        page_cache.invalidate_list_pages()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {count} providers in batch `{batch}` in {time.monotonic() - started_at:.1f}s'
+        ))
@@ -0,0 +1,96 @@
+from typing import List, Tuple
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from musicspace_app.models import Provider, ProviderSearchIndex
+from musicspace_app.domain import page_cache
+
+## the page / fragment / facet caches are swapped for a dummy cache while the pages
+## are requested, so every query a cold page runs is captured
+DUMMY_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN on every query the public views make and flags full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-full-scan',
+            action='store_true',
+            help='Exit with an error if any query scans a whole table'
+        )
+
+    def _public_urls(self) -> List[Tuple[str, str]]:
+        provider_list_url = reverse('musicspace:provider-list')
+        urls = [
+            ('index', reverse('musicspace:index')),
+            ('provider list', provider_list_url),
+            ('provider list (in person)', f'{provider_list_url}?modality=in_person_only'),
+            ('provider list (online, genre, instrument)', f'{provider_list_url}?modality=online_only&genre=jazz&instrument=piano'),
+        ]
+
+        provider = Provider.objects.filter(
+            id__in=ProviderSearchIndex.objects.values('provider_id')
+        ).first()
+        if provider is not None:
+            urls.append(('provider detail', reverse('musicspace:provider-detail', kwargs={'provider_id': provider.id})))
+
+        return urls
+
+    def _explain(self, sql: str) -> List[str]:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[-1] for row in cursor.fetchall()]
+            else:
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+
+    def _is_full_scan(self, plan_line: str) -> bool:
+        plan_line = plan_line.strip()
+        if connection.vendor == 'sqlite':
+            ## `SCAN table USING (COVERING) INDEX` walks an index, `SCAN table` the table
+            return plan_line.startswith('SCAN ') and 'USING' not in plan_line
+        else:
+            return 'Seq Scan' in plan_line
+
+    def handle(self, *args, **options):
+        full_scan_count = 0
+        client = Client()
+
+        page_cache_timeout_seconds = page_cache.timeout_seconds
+        page_cache.timeout_seconds = 0
+        try:
+            for (name, url) in self._public_urls():
+                with override_settings(CACHES=DUMMY_CACHES, ALLOWED_HOSTS=['testserver']), \
+                    CaptureQueriesContext(connection) as captured:
+                    response = client.get(url)
+
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'{name}: GET {url} ({response.status_code}, {len(captured.captured_queries)} queries)'
+                ))
+
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+
+                    self.stdout.write(f'  {sql}')
+                    for plan_line in self._explain(sql):
+                        if self._is_full_scan(plan_line):
+                            full_scan_count += 1
+                            self.stdout.write(self.style.WARNING(f'    FULL SCAN: {plan_line}'))
+                        else:
+                            self.stdout.write(f'    {plan_line}')
+        finally:
+            page_cache.timeout_seconds = page_cache_timeout_seconds
+
+        self.stdout.write(f'{full_scan_count} full table scan(s)')
+        if options['fail_on_full_scan'] and full_scan_count:
+            raise CommandError('Public view queries scan whole tables')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from musicspace_app.middleware_report import build_middleware_report
+
+class Command(BaseCommand):
+    help = 'Lists the middleware that runs on each request with the active settings profile'
+
+    def handle(self, *args, **options):
+        for line in build_middleware_report():
+            self.stdout.write(line)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from musicspace_app.domain import use_case_factory
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized provider search index from the provider tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of index entries written per insert'
+        )
+
+    def handle(self, *args, **options):
+        provider_search_use_case = use_case_factory.provider_search_use_case()
+        count = provider_search_use_case.rebuild_index(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(f'Rebuilt the search index for {count} providers')
\ No newline at end of file
@@ -0,0 +1,53 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+import musicspace_app.settings as app_settings
+from musicspace_app.domain import use_case_factory
+
+class Command(BaseCommand):
+    help = 'Runs queued TakeOne provisioning jobs (user, video container, project and invitation email)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=app_settings.PROVISIONING_WORKER_POLL_INTERVAL_SECONDS,
+            help='Seconds to wait between polls when the queue is empty'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every job that is currently available, then exit'
+        )
+
+    def handle(self, *args, **options):
+        self.should_stop = False
+
+        ## finish the current job before exiting on a docker stop / ctrl-c
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after the current job')
+            self.should_stop = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        provisioning_job_use_case = use_case_factory.provisioning_job_use_case()
+        self.stdout.write('Provisioning worker started')
+
+        while not self.should_stop:
+            close_old_connections()
+            job = provisioning_job_use_case.claim_next_job()
+
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Running provisioning job {job.id} (attempt {job.attempts})')
+            provisioning_job_use_case.run_job(job=job)
+            self.stdout.write(f'Provisioning job {job.id} is {job.state}')
+
+        self.stdout.write('Provisioning worker stopped')
\ No newline at end of file
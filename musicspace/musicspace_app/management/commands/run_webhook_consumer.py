@@ -0,0 +1,84 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+import musicspace_app.settings as app_settings
+from musicspace_app.domain import use_case_factory
+
+PRUNE_INTERVAL_SECONDS = 3600
+
+class Command(BaseCommand):
+    help = 'Applies stored TakeOne webhook events to the local video containers in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=app_settings.WEBHOOK_CONSUMER_BATCH_SIZE,
+            help='Maximum number of events applied per batch'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=app_settings.WEBHOOK_CONSUMER_POLL_INTERVAL_SECONDS,
+            help='Seconds to wait between polls when the inbox is empty'
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=app_settings.WEBHOOK_EVENT_RETENTION_DAYS,
+            help='Applied events older than this are deleted'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the inbox, then exit'
+        )
+
+    def handle(self, *args, **options):
+        self.should_stop = False
+
+        ## finish the current batch before exiting on a docker stop / ctrl-c
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after the current batch')
+            self.should_stop = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        takeone_project_use_case = use_case_factory.takeone_project_use_case()
+        last_pruned_at = None
+        self.stdout.write('Webhook consumer started')
+
+        while not self.should_stop:
+            close_old_connections()
+            try:
+                event_count = takeone_project_use_case.process_webhook_events(
+                    batch_size=options['batch_size']
+                )
+            except Exception as e:
+                print(f'an exception occurred processing webhook events: {e}')
+                event_count = 0
+
+            if event_count:
+                self.stdout.write(f'Processed {event_count} webhook events')
+                continue
+
+            ## old events are deleted while the inbox is empty, at most once per interval
+            if last_pruned_at is None or time.monotonic() - last_pruned_at >= PRUNE_INTERVAL_SECONDS:
+                try:
+                    deleted_count = takeone_project_use_case.delete_processed_webhook_events(
+                        retention_days=options['retention_days']
+                    )
+                    if deleted_count:
+                        self.stdout.write(f'Deleted {deleted_count} old webhook events')
+                except Exception as e:
+                    print(f'an exception occurred deleting old webhook events: {e}')
+                last_pruned_at = time.monotonic()
+
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write('Webhook consumer stopped')
\ No newline at end of file
@@ -0,0 +1,213 @@
+import random
+import time
+import uuid
+from typing import List, Tuple
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from musicspace_app.models import (
+    Address, MusicspaceUser, Provider, ProviderSearchIndex
+)
+from musicspace_app.domain import page_cache, use_case_factory
+from musicspace_app.migrations.helpers.provider_data_migration import (
+    DEFAULT_USER_PASSWORD, PyProvider, generate_provider, generate_random_text_pool,
+    generate_seed_username, generate_seed_username_prefix
+)
+from musicspace_app.sqlite import serialized_write
+
+TEXT_POOL_SIZE = 500
+
+## bulk inserts random providers for load testing, using the same generators as the
+## provider data migration. every chunk is written with one insert per table, and the
+## search index entries are built here since bulk inserts don't send the signals that
+## normally keep the index up to date. the same --seed and --batch always produce the
+## same providers (including their ids), so a batch can be recreated exactly
+class Command(BaseCommand):
+    help = 'Bulk inserts random providers (with their users, addresses, genres, instruments and search index entries)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            required=True,
+            help='Number of providers to add'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed, the same seed and batch always generate the same providers'
+        )
+        parser.add_argument(
+            '--batch',
+            default='default',
+            help='Tag for the seeded providers (letters, digits and `-`), used by `delete_seeded_providers` to remove them again'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of providers written per transaction'
+        )
+
+    ## a multi row insert without building model instances, which is most of the cost
+    ## of bulk_create for the provider, through and search index rows. the values are
+    ## still converted by the model fields
+    def _insert_rows(self, model, field_names: List[str], rows: List[Tuple]):
+        ## the connection proxy looks the connection up on every attribute access
+        db_connection = connections[DEFAULT_DB_ALIAS]
+        fields = [model._meta.get_field(field_name) for field_name in field_names]
+        quote_name = db_connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote_name(model._meta.db_table),
+            ', '.join(quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields))
+        )
+        with db_connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(value, connection=db_connection) for (field, value) in zip(fields, row)]
+                for row in rows
+            ])
+
+    def _write_chunk(self, seeded_providers: List[Tuple[uuid.UUID, PyProvider]]):
+        provider_search_use_case = use_case_factory.provider_search_use_case()
+        py_providers = [py_provider for (_, py_provider) in seeded_providers]
+
+        users = [
+            MusicspaceUser(
+                username=py_provider.username,
+                email=py_provider.email,
+                password=DEFAULT_USER_PASSWORD,
+                first_name=py_provider.name.given_name,
+                last_name=py_provider.name.family_name,
+                date_joined=py_provider.created_date_time
+            ) for py_provider in py_providers
+        ]
+
+        addresses = [
+            Address(
+                street_1=py_provider.location.street_1,
+                street_2=py_provider.location.street_2 or '',
+                city=py_provider.location.city,
+                state=py_provider.location.state,
+                zip=py_provider.location.zip
+            ) for py_provider in py_providers
+        ]
+
+        genre_masks = provider_search_use_case.genre_masks(
+            genre_id_lists=[py_provider.genres for py_provider in py_providers]
+        )
+        instrument_masks = provider_search_use_case.instrument_masks(
+            instrument_id_lists=[py_provider.instruments for py_provider in py_providers]
+        )
+
+        with serialized_write():
+            MusicspaceUser.objects.bulk_create(users)
+            Address.objects.bulk_create(addresses)
+
+            self._insert_rows(
+                Provider,
+                ['id', 'user', 'title', 'text', 'gender', 'location', 'image_url', 'in_person', 'online'],
+                [
+                    (
+                        provider_id,
+                        user.id,
+                        py_provider.title,
+                        py_provider.text,
+                        py_provider.gender.value.lower(),
+                        address.id,
+                        py_provider.image_url,
+                        py_provider.in_person,
+                        py_provider.online
+                    ) for ((provider_id, py_provider), user, address) in zip(seeded_providers, users, addresses)
+                ]
+            )
+
+            self._insert_rows(
+                Provider.genres.through,
+                ['provider', 'genre'],
+                [
+                    (provider_id, genre_id)
+                    for (provider_id, py_provider) in seeded_providers
+                    for genre_id in py_provider.genres
+                ]
+            )
+
+            self._insert_rows(
+                Provider.instruments.through,
+                ['provider', 'instrument'],
+                [
+                    (provider_id, instrument_id)
+                    for (provider_id, py_provider) in seeded_providers
+                    for instrument_id in py_provider.instruments
+                ]
+            )
+
+            self._insert_rows(
+                ProviderSearchIndex,
+                ['provider', 'genre_mask', 'instrument_mask', 'in_person', 'online', 'date_joined'],
+                [
+                    (
+                        provider_id,
+                        genre_mask,
+                        instrument_mask,
+                        py_provider.in_person,
+                        py_provider.online,
+                        py_provider.created_date_time
+                    ) for ((provider_id, py_provider), genre_mask, instrument_mask) in zip(seeded_providers, genre_masks, instrument_masks)
+                ]
+            )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        batch = options['batch']
+        chunk_size = options['chunk_size']
+
+        if count < 1 or chunk_size < 1:
+            raise CommandError('--count and --chunk-size must be positive')
+
+        ## the user and address ids are needed for the provider rows
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('The database can\'t return ids from bulk inserts (sqlite 3.35+ or postgresql is needed)')
+
+        try:
+            username_prefix = generate_seed_username_prefix(batch=batch)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if MusicspaceUser.objects.filter(
+            username__startswith=username_prefix
+        ).exists():
+            raise CommandError(f'Batch `{batch}` has already been seeded, delete it first or pick another --batch')
+
+        ## the batch is part of the seed, so two batches seeded with the same --seed
+        ## don't generate the same provider ids
+        random.seed(f'{options["seed"]}:{batch}')
+        text_pool = generate_random_text_pool(size=TEXT_POOL_SIZE)
+
+        started_at = time.monotonic()
+        added = 0
+        while added < count:
+            seeded_providers = []
+            for index in range(added, min(added + chunk_size, count)):
+                py_provider = generate_provider(
+                    username=generate_seed_username(batch=batch, index=index),
+                    text_pool=text_pool
+                )
+                ## drawn from the seeded generator right after the provider, so the ids
+                ## are reproducible too and don't depend on --chunk-size
+                provider_id = uuid.UUID(int=random.getrandbits(128), version=4)
+                seeded_providers.append((provider_id, py_provider))
+            self._write_chunk(seeded_providers=seeded_providers)
+            added += len(seeded_providers)
+
+            elapsed = time.monotonic() - started_at
+            self.stdout.write(f'{added}/{count} providers ({added / elapsed:.0f}/s)')
+
+        ## the cached list pages and facet counts don't include the new providers yet
+        use_case_factory.provider_search_use_case().invalidate_facet_counts()
+        page_cache.invalidate_list_pages()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {added} providers in batch `{batch}` in {time.monotonic() - started_at:.1f}s'
+        ))
@@ -0,0 +1,29 @@
+from typing import List
+from django.conf import settings
+
+STATIC_FILES_MIDDLEWARE = 'whitenoise.middleware.WhiteNoiseMiddleware'
+
+## describes the middleware every request goes through with the active settings
+## profile. static file requests are answered by WhiteNoise, so the middleware
+## after it only runs for requests that reach a view
+def build_middleware_report() -> List[str]:
+    lines = [
+        f'Settings profile: {settings.SETTINGS_PROFILE} (DEBUG={settings.DEBUG})',
+        'Middleware run per request, in order:'
+    ]
+
+    static_files_handled = False
+    for index, middleware in enumerate(settings.MIDDLEWARE, start=1):
+        note = '' if not static_files_handled else ' (skipped for static files)'
+        lines.append(f'  {index}. {middleware}{note}')
+        if middleware == STATIC_FILES_MIDDLEWARE:
+            static_files_handled = True
+
+    if not static_files_handled:
+        lines.append(f'  warning: {STATIC_FILES_MIDDLEWARE} is not installed, static files run every middleware')
+
+    debug_apps = [app for app in ('debug_toolbar', 'whitenoise.runserver_nostatic') if app in settings.INSTALLED_APPS]
+    if debug_apps:
+        lines.append(f"Development apps installed: {', '.join(debug_apps)}")
+
+    return lines
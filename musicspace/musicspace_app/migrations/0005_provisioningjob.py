@@ -0,0 +1,35 @@
+# Generated by Django 4.1.5 on 2026-10-18 09:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicspace_app', '0004_takeoneuser_takeoneprofilevideocontainer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('step', models.CharField(choices=[('create_user', 'Creating TakeOne user'), ('create_video_container', 'Creating video container'), ('create_project', 'Creating project'), ('send_invitation', 'Sending invitation email'), ('done', 'Done')], default='create_user', max_length=32)),
+                ('takeone_project_id', models.CharField(blank=True, default='', max_length=64)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('available_date_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_date_time', models.DateTimeField(blank=True, null=True)),
+                ('created_date_time', models.DateTimeField(auto_now_add=True)),
+                ('modified_date_time', models.DateTimeField(auto_now=True)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='provisioning_jobs', to='musicspace_app.provider')),
+            ],
+            options={
+                'ordering': ['created_date_time'],
+            },
+        ),
+    ]
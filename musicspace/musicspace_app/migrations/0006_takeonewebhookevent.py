@@ -0,0 +1,31 @@
+# Generated by Django 4.1.5 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicspace_app', '0005_provisioningjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TakeOneWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_hash', models.CharField(editable=False, max_length=64, unique=True)),
+                ('payload', models.TextField(editable=False)),
+                ('error', models.TextField(blank=True, default='')),
+                ('received_date_time', models.DateTimeField(auto_now_add=True)),
+                ('processed_date_time', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='takeonewebhookevent',
+            index=models.Index(condition=models.Q(('processed_date_time__isnull', True)), fields=['id'], name='webhook_event_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicspace_app', '0006_takeonewebhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='takeoneprofilevideocontainer',
+            name='takeone_event_timestamp',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.5 on 2026-10-18 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+from .helpers.provider_search_index_migration import (
+    assign_search_bits, build_provider_search_index, delete_provider_search_index
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicspace_app', '0007_takeoneprofilevideocontainer_takeone_event_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderSearchIndex',
+            fields=[
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='musicspace_app.provider')),
+                ('genre_mask', models.BigIntegerField(default=0)),
+                ('instrument_mask', models.BigIntegerField(default=0)),
+                ('in_person', models.BooleanField()),
+                ('online', models.BooleanField()),
+                ('date_joined', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='search_bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='instrument',
+            name='search_bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='providersearchindex',
+            index=models.Index(fields=['date_joined', 'provider'], name='provider_search_joined_idx'),
+        ),
+        migrations.RunPython(assign_search_bits, reverse_code=migrations.RunPython.noop),
+        migrations.RunPython(build_provider_search_index, reverse_code=delete_provider_search_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.5 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicspace_app', '0008_provider_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='takeoneuser',
+            name='takeone_id',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='providersearchindex',
+            index=models.Index(fields=['in_person', 'date_joined', 'provider'], name='provider_search_in_person_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='providersearchindex',
+            index=models.Index(fields=['online', 'date_joined', 'provider'], name='provider_search_online_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='provisioningjob',
+            index=models.Index(fields=['provider', 'created_date_time'], name='provisioning_job_provider_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='provisioningjob',
+            index=models.Index(fields=['state', 'created_date_time'], name='provisioning_job_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='takeoneuser',
+            index=models.Index(fields=['created_date_time'], name='takeone_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+## the genre / instrument through tables only have Django's (provider, genre) unique
+## index plus single column indexes. finding the providers for a genre (e.g. when a
+## genre is edited from the admin) reads the genre-first composite index alone,
+## without going back to the table
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicspace_app', '0009_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX provider_genres_genre_provider_idx ON musicspace_app_provider_genres (genre_id, provider_id)',
+            reverse_sql='DROP INDEX provider_genres_genre_provider_idx'
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX provider_instruments_instrument_provider_idx ON musicspace_app_provider_instruments (instrument_id, provider_id)',
+            reverse_sql='DROP INDEX provider_instruments_instrument_provider_idx'
+        ),
+    ]
@@ -1,4 +1,5 @@
 import random
+import re
 from datetime import datetime
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password
@@ -7,6 +8,7 @@ from typing import List, Tuple, Optional
 from pydantic import BaseModel
 from enum import Enum
 from django.conf import settings
+from django.db import models, transaction
 
 
 class PyAddress(BaseModel):
@@ -44,6 +46,21 @@ class PyGender(str, Enum):
     NONBINARY = 'nonbinary'
     OTHER = 'other'
 
+class PyProvider(BaseModel):
+    username: str
+    email: str
+    gender: PyGender
+    name: PyName
+    title: str
+    location: PyAddress
+    image_url: str
+    created_date_time: datetime
+    genres: List[str]
+    instruments: List[str]
+    in_person: bool
+    online: bool
+    text: str
+
 NUMBER_OF_PROVIDERS_TO_ADD = 15
 
 GENRES = [
@@ -159,7 +176,7 @@ def generate_random_name(
     else:
         given_name_list = male_given_names + female_given_names
 
-    return PyName(
+    return PyName.construct(
         given_name=random.choice(given_name_list),
         family_name=random.choice(family_names)
     )
@@ -221,6 +238,64 @@ def generate_in_person_online() -> Tuple[bool, bool]:
         online_value = random.random()
         return (True, online_value <= 0.75)
 
+## lorem shuffles its whole word list for every paragraph, which is most of the
+## cost of generating a provider. bulk seeding draws from a pool of pregenerated
+## paragraphs instead
+def generate_random_text_pool(size: int) -> List[str]:
+    return [generate_random_text() for _ in range(size)]
+
+def generate_provider(
+    username: str,
+    text_pool: Optional[List[str]] = None
+) -> PyProvider:
+    email = generate_email(username=username)
+    gender = generate_random_gender()
+    name = generate_random_name(gender=gender)
+    title = generate_random_title()
+    location = generate_random_location()
+    image_url = generate_random_image_url(gender=gender)
+    created_date_time = generate_random_created_date_time()
+    genres = generate_genres()
+    instruments = generate_instruments()
+    (in_person, online) = generate_in_person_online()
+
+    if text_pool:
+        text = random.choice(text_pool)
+    else:
+        text = generate_random_text()
+
+    ## every field comes from the generators above, so pydantic's validation (which
+    ## also copies the nested models) is skipped
+    return PyProvider.construct(
+        username=username,
+        email=email,
+        gender=gender,
+        name=name,
+        title=title,
+        location=location,
+        image_url=image_url,
+        created_date_time=created_date_time,
+        genres=genres,
+        instruments=instruments,
+        in_person=in_person,
+        online=online,
+        text=text
+    )
+
+## providers added by `manage.py seed_providers` are tagged with their batch
+## through the username, so a batch can be removed without touching real users.
+## batch names can't contain `_`, otherwise the prefix of batch `x` would also
+## match the usernames of batch `x_y`
+SEED_BATCH_PATTERN = re.compile(r'[A-Za-z0-9-]+')
+
+def generate_seed_username_prefix(batch: str) -> str:
+    if not SEED_BATCH_PATTERN.fullmatch(batch):
+        raise ValueError(f'Batch names may only contain letters, digits and `-`, got `{batch}`')
+    return f'{settings.PROVIDER_USER_PREFIX}seed_{batch}_'
+
+def generate_seed_username(batch: str, index: int) -> str:
+    return f'{generate_seed_username_prefix(batch=batch)}{index}'
+
 def insert_genres(apps, schema_editor):
     if schema_editor.connection.alias != 'default':
         return
@@ -267,66 +342,100 @@ def insert_providers(apps, schema_editor):
     Provider = apps.get_model('musicspace_app', 'Provider')
 
     for i in range(NUMBER_OF_PROVIDERS_TO_ADD):
-        username = generate_username(index=i)
-        email = generate_email(username=username)
-        gender = generate_random_gender()
-        name = generate_random_name(gender=gender)
-        title = generate_random_title()
-        location = generate_random_location()
-        image_url = generate_random_image_url(gender=gender)
-        created_date_time = generate_random_created_date_time()
-        genres = generate_genres()
-        instruments = generate_instruments()
-        (in_person, online) = generate_in_person_online()
-
-        text = generate_random_text()
+        py_provider = generate_provider(username=generate_username(index=i))
 
         try:
             user = MusicspaceUser.objects.create(
-                username=username,
-                email=email,
+                username=py_provider.username,
+                email=py_provider.email,
                 password=DEFAULT_USER_PASSWORD,
-                first_name=name.given_name,
-                last_name=name.family_name,
-                date_joined=created_date_time
+                first_name=py_provider.name.given_name,
+                last_name=py_provider.name.family_name,
+                date_joined=py_provider.created_date_time
             )
 
             address = Address.objects.create(
-                street_1=location.street_1,
-                street_2=location.street_2 or '',
-                city=location.city,
-                state=location.state,
-                zip=location.zip
+                street_1=py_provider.location.street_1,
+                street_2=py_provider.location.street_2 or '',
+                city=py_provider.location.city,
+                state=py_provider.location.state,
+                zip=py_provider.location.zip
             )
 
             provider = Provider.objects.create(
                 user=user,
-                title=title,
-                text=text,
-                gender=gender.value.lower(),
+                title=py_provider.title,
+                text=py_provider.text,
+                gender=py_provider.gender.value.lower(),
                 location=address,
-                image_url=image_url,
-                in_person=in_person,
-                online=online
+                image_url=py_provider.image_url,
+                in_person=py_provider.in_person,
+                online=py_provider.online
             )
 
-            provider.genres.add(*genres)
-            provider.instruments.add(*instruments)
+            provider.genres.add(*py_provider.genres)
+            provider.instruments.add(*py_provider.instruments)
 
         except BaseException as e:
             print(f'got an exception {e}')
             raise e
 
+## deletes the providers whose usernames start with `username_prefix`, along with their
+## genre / instrument rows, addresses and users, using one DELETE per table.
+## QuerySet.delete() loads every row to collect cascades and send signals, so this uses
+## _raw_delete instead; callers take care of anything the delete signals would have
+## done. works with both the real and the historical (migration) models
+def delete_providers_with_username_prefix(
+    Provider,
+    Address,
+    MusicspaceUser,
+    username_prefix: str,
+    using: str
+) -> int:
+    users = MusicspaceUser._base_manager.using(using).filter(username__startswith=username_prefix)
+    providers = Provider._base_manager.using(using).filter(user__in=users.values('id'))
+    provider_ids = providers.values('id')
+
+    with transaction.atomic(using=using):
+        ## rows in other tables that point at the providers, e.g. search index entries.
+        ## cascading ones go with the providers, protected ones (a TakeOne user, a
+        ## provisioning job) mean this isn't purely generated data
+        for relation in Provider._meta.related_objects:
+            related_rows = relation.related_model._base_manager.using(using).filter(
+                **{f'{relation.field.name}__in': provider_ids}
+            )
+            if relation.on_delete is models.CASCADE:
+                related_rows._raw_delete(using=using)
+            elif related_rows.exists():
+                raise ValueError(
+                    f'{relation.related_model._meta.verbose_name} rows reference providers with the username prefix `{username_prefix}`'
+                )
+
+        Provider.genres.through._base_manager.using(using).filter(provider__in=provider_ids)._raw_delete(using=using)
+        Provider.instruments.through._base_manager.using(using).filter(provider__in=provider_ids)._raw_delete(using=using)
+        MusicspaceUser.groups.through._base_manager.using(using).filter(musicspaceuser__in=users.values('id'))._raw_delete(using=using)
+        MusicspaceUser.user_permissions.through._base_manager.using(using).filter(musicspaceuser__in=users.values('id'))._raw_delete(using=using)
+
+        ## the foreign keys from providers to their address and user are only checked at
+        ## commit, so both can go while the provider rows are still there to select them by
+        Address._base_manager.using(using).filter(id__in=providers.values('location_id'))._raw_delete(using=using)
+        count = providers._raw_delete(using=using)
+        users._raw_delete(using=using)
+
+    return count
+
 def delete_providers(apps, schema_editor):
     if schema_editor.connection.alias != 'default':
         return
 
     Provider = apps.get_model('musicspace_app', 'Provider')
+    Address = apps.get_model('musicspace_app', 'Address')
+    MusicspaceUser = apps.get_model('musicspace_app', 'MusicspaceUser')
 
-    for provider in Provider.objects.all():
-        location = provider.location
-        user = provider.user
-        provider.delete()
-        location.delete()
-        user.delete()
-
+    delete_providers_with_username_prefix(
+        Provider=Provider,
+        Address=Address,
+        MusicspaceUser=MusicspaceUser,
+        username_prefix=settings.PROVIDER_USER_PREFIX,
+        using=schema_editor.connection.alias
+    )
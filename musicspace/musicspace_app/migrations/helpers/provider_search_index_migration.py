@@ -0,0 +1,37 @@
+def _mask_from_bits(search_bits) -> int:
+    mask = 0
+    for search_bit in search_bits:
+        if search_bit is not None:
+            mask |= 1 << search_bit
+    return mask
+
+def assign_search_bits(apps, schema_editor):
+    for model_name in ['Genre', 'Instrument']:
+        model = apps.get_model('musicspace_app', model_name)
+        for (search_bit, obj) in enumerate(model.objects.order_by('id')):
+            obj.search_bit = search_bit
+            obj.save(update_fields=['search_bit'])
+
+def build_provider_search_index(apps, schema_editor):
+    Provider = apps.get_model('musicspace_app', 'Provider')
+    ProviderSearchIndex = apps.get_model('musicspace_app', 'ProviderSearchIndex')
+
+    providers = Provider.objects.select_related('user').prefetch_related(
+        'genres', 'instruments'
+    )
+
+    ProviderSearchIndex.objects.bulk_create([
+        ProviderSearchIndex(
+            provider=provider,
+            genre_mask=_mask_from_bits(genre.search_bit for genre in provider.genres.all()),
+            instrument_mask=_mask_from_bits(instrument.search_bit for instrument in provider.instruments.all()),
+            in_person=provider.in_person,
+            online=provider.online,
+            date_joined=provider.user.date_joined
+        )
+        for provider in providers
+    ], batch_size=1000)
+
+def delete_provider_search_index(apps, schema_editor):
+    ProviderSearchIndex = apps.get_model('musicspace_app', 'ProviderSearchIndex')
+    ProviderSearchIndex.objects.all().delete()
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import gettext_lazy as _
 from typing import Optional, Any
@@ -58,6 +59,23 @@ class Address(models.Model):
 
         return '\n'.join(lines)
 
+## genres and instruments are stored as bitmasks in ProviderSearchIndex,
+## so each one is assigned a bit position (0 - 62) when it is first saved
+MAX_SEARCH_BIT = 62
+
+## a bit that is still set in some index entry (e.g. from a genre removed without the
+## delete signals) is skipped, so the entry doesn't match the new genre / instrument
+def _next_search_bit(model, mask_field: str) -> int:
+    max_search_bit = model.objects.aggregate(models.Max('search_bit'))['search_bit__max']
+    search_bit = 0 if max_search_bit is None else max_search_bit + 1
+    while search_bit <= MAX_SEARCH_BIT and ProviderSearchIndex.objects.alias(
+        search_bit_set=models.F(mask_field).bitand(1 << search_bit)
+    ).exclude(search_bit_set=0).exists():
+        search_bit += 1
+    if search_bit > MAX_SEARCH_BIT:
+        raise ValueError(f'No search bits are left for {model.__name__}')
+    return search_bit
+
 class Genre(models.Model):
     id = models.CharField(
         max_length=32,
@@ -68,8 +86,19 @@ class Genre(models.Model):
         max_length=64
     )
 
+    search_bit = models.PositiveSmallIntegerField(
+        unique=True,
+        null=True,
+        editable=False
+    )
+
     def __str__(self):
         return self.display_text
+
+    def save(self, *args, **kwargs):
+        if self.search_bit is None:
+            self.search_bit = _next_search_bit(Genre, mask_field='genre_mask')
+        super().save(*args, **kwargs)
         
 class Instrument(models.Model):
     id = models.CharField(
@@ -80,10 +109,21 @@ class Instrument(models.Model):
     display_text = models.CharField(
         max_length=64
     )
+
+    search_bit = models.PositiveSmallIntegerField(
+        unique=True,
+        null=True,
+        editable=False
+    )
     
     def __str__(self):
         return self.display_text
 
+    def save(self, *args, **kwargs):
+        if self.search_bit is None:
+            self.search_bit = _next_search_bit(Instrument, mask_field='instrument_mask')
+        super().save(*args, **kwargs)
+
 class Provider(models.Model):
 
     class Gender(models.TextChoices):
@@ -153,6 +193,45 @@ class Provider(models.Model):
         except ObjectDoesNotExist:
             return None
 
+## denormalized copy of the fields the provider search filters and orders on,
+## so a search is a single table scan with no joins or DISTINCT. kept up to date
+## by the signal handlers in signals.py
+class ProviderSearchIndex(models.Model):
+
+    provider = models.OneToOneField(
+        Provider,
+        primary_key=True,
+        related_name='search_index',
+        on_delete=models.CASCADE
+    )
+
+    ## bit n is set if the provider has the genre / instrument whose search_bit is n
+    genre_mask = models.BigIntegerField(default=0)
+    instrument_mask = models.BigIntegerField(default=0)
+
+    in_person = models.BooleanField()
+    online = models.BooleanField()
+
+    ## copied from the provider's user
+    date_joined = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['date_joined', 'provider'],
+                name='provider_search_joined_idx'
+            ),
+            ## in person only / online only searches walk these in result order
+            models.Index(
+                fields=['in_person', 'date_joined', 'provider'],
+                name='provider_search_in_person_idx'
+            ),
+            models.Index(
+                fields=['online', 'date_joined', 'provider'],
+                name='provider_search_online_idx'
+            )
+        ]
+
 class TakeOneUser(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -163,8 +242,10 @@ class TakeOneUser(models.Model):
         on_delete=models.PROTECT
     )
 
+    ## TakeOne's id for the user, which webhooks refer to
     takeone_id = models.CharField(
         max_length=64,
+        unique=True,
         editable=False
     )
 
@@ -175,6 +256,12 @@ class TakeOneUser(models.Model):
 
     class Meta:
         ordering = ['created_date_time']
+        indexes = [
+            models.Index(
+                fields=['created_date_time'],
+                name='takeone_user_created_idx'
+            )
+        ]
 
 class TakeOneProfileVideoContainer(models.Model):
 
@@ -221,6 +308,13 @@ class TakeOneProfileVideoContainer(models.Model):
         blank=True
     )
 
+    ## `timestamp` of the newest TakeOne webhook applied to this container.
+    ## webhooks that arrive late with an older timestamp are ignored
+    takeone_event_timestamp = models.BigIntegerField(
+        default=0,
+        editable=False
+    )
+
     created_date_time = models.DateTimeField(auto_now_add=True)
     modified_date_time = models.DateTimeField(auto_now=True)
 
@@ -240,4 +334,115 @@ class TakeOneProfileVideoContainer(models.Model):
 
     @property
     def should_render_video(self) -> bool:
-        return self.video_stream != None
\ No newline at end of file
+        return self.video_stream != None
+
+class ProvisioningJob(models.Model):
+
+    class State(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        COMPLETED = 'completed', _('Completed')
+        FAILED = 'failed', _('Failed')
+
+    ## steps run in this order. each one is skipped if its work
+    ## has already been done, so a job can be resumed at any point
+    class Step(models.TextChoices):
+        CREATE_USER = 'create_user', _('Creating TakeOne user')
+        CREATE_VIDEO_CONTAINER = 'create_video_container', _('Creating video container')
+        CREATE_PROJECT = 'create_project', _('Creating project')
+        SEND_INVITATION = 'send_invitation', _('Sending invitation email')
+        DONE = 'done', _('Done')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    provider = models.ForeignKey(
+        Provider,
+        related_name='provisioning_jobs',
+        on_delete=models.PROTECT
+    )
+
+    state = models.CharField(
+        max_length=16,
+        choices=State.choices,
+        default=State.PENDING
+    )
+
+    step = models.CharField(
+        max_length=32,
+        choices=Step.choices,
+        default=Step.CREATE_USER
+    )
+
+    takeone_project_id = models.CharField(
+        max_length=64,
+        blank=True,
+        default=''
+    )
+
+    attempts = models.PositiveIntegerField(default=0)
+
+    last_error = models.TextField(
+        blank=True,
+        default=''
+    )
+
+    ## a pending job is not picked up before this time (used for retry backoff)
+    available_date_time = models.DateTimeField(default=timezone.now)
+
+    ## set when a worker claims the job. a running job whose lock is older than
+    ## the worker's lock timeout is assumed to be abandoned and is reclaimed
+    locked_date_time = models.DateTimeField(null=True, blank=True)
+
+    created_date_time = models.DateTimeField(auto_now_add=True)
+    modified_date_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_date_time']
+        indexes = [
+            ## the latest job for a provider (ProvisioningJobUseCase.get_latest_job)
+            models.Index(
+                fields=['provider', 'created_date_time'],
+                name='provisioning_job_provider_idx'
+            ),
+            ## jobs a worker can claim, oldest first
+            models.Index(
+                fields=['state', 'created_date_time'],
+                name='provisioning_job_state_idx'
+            )
+        ]
+
+    @property
+    def is_active(self) -> bool:
+        return self.state in (self.State.PENDING, self.State.RUNNING)
+
+
+## raw webhook requests are stored here by the webhook view and
+## applied in batches by `manage.py run_webhook_consumer`
+class TakeOneWebhookEvent(models.Model):
+
+    ## sha256 of the raw body, so redelivered events are only stored once
+    event_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        editable=False
+    )
+
+    payload = models.TextField(editable=False)
+
+    error = models.TextField(
+        blank=True,
+        default=''
+    )
+
+    received_date_time = models.DateTimeField(auto_now_add=True)
+    processed_date_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(processed_date_time__isnull=True),
+                name='webhook_event_pending_idx'
+            )
+        ]
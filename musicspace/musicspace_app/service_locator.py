@@ -1,8 +1,38 @@
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from musicspace_app import settings
-from .data import TakeOneClient
+from .data import TakeOneClient, AsyncTakeOneClient
 
 takeone_client = TakeOneClient(
     base_url=settings.TAKEONE_BASE_URL,
     client_id=settings.TAKEONE_CLIENT_ID,
-    client_secret=settings.TAKEONE_CLIENT_SECRET
+    client_secret=settings.TAKEONE_CLIENT_SECRET,
+    max_connections=settings.TAKEONE_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.TAKEONE_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.TAKEONE_HTTP_KEEPALIVE_EXPIRY,
+    timeout=settings.TAKEONE_HTTP_TIMEOUT,
+    http2=settings.TAKEONE_HTTP2_ENABLED
+)
+
+## release pooled connections when the worker process exits
+atexit.register(takeone_client.close)
+
+## used by async views
+async_takeone_client = AsyncTakeOneClient(
+    base_url=settings.TAKEONE_BASE_URL,
+    client_id=settings.TAKEONE_CLIENT_ID,
+    client_secret=settings.TAKEONE_CLIENT_SECRET,
+    max_connections=settings.TAKEONE_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.TAKEONE_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.TAKEONE_HTTP_KEEPALIVE_EXPIRY,
+    timeout=settings.TAKEONE_HTTP_TIMEOUT,
+    http2=settings.TAKEONE_HTTP2_ENABLED,
+    pooled=settings.TAKEONE_ASYNC_HTTP_POOLED
+)
+
+## runs TakeOne work that should not block a request (e.g. refreshing
+## a stale video container)
+background_executor = ThreadPoolExecutor(
+    max_workers=settings.TAKEONE_BACKGROUND_WORKERS,
+    thread_name_prefix='takeone-background'
 )
\ No newline at end of file
@@ -5,4 +5,34 @@ TAKEONE_CLIENT_ID = getattr(settings, 'TAKEONE_CLIENT_ID')
 TAKEONE_CLIENT_SECRET = getattr(settings, 'TAKEONE_CLIENT_SECRET')
 TAKEONE_VIDEO_CONTAINER_TEMPLATE_ID = getattr(settings, 'TAKEONE_VIDEO_CONTAINER_TEMPLATE_ID')
 
+TAKEONE_HTTP_MAX_CONNECTIONS = getattr(settings, 'TAKEONE_HTTP_MAX_CONNECTIONS', 100)
+TAKEONE_HTTP_MAX_KEEPALIVE_CONNECTIONS = getattr(settings, 'TAKEONE_HTTP_MAX_KEEPALIVE_CONNECTIONS', 20)
+TAKEONE_HTTP_KEEPALIVE_EXPIRY = getattr(settings, 'TAKEONE_HTTP_KEEPALIVE_EXPIRY', 5.0)
+TAKEONE_HTTP_TIMEOUT = getattr(settings, 'TAKEONE_HTTP_TIMEOUT', 30.0)
+TAKEONE_HTTP2_ENABLED = getattr(settings, 'TAKEONE_HTTP2_ENABLED', False)
+TAKEONE_ASYNC_HTTP_POOLED = getattr(settings, 'TAKEONE_ASYNC_HTTP_POOLED', False)
+
+TAKEONE_VIDEO_CONTAINER_STALENESS_SECONDS = getattr(settings, 'TAKEONE_VIDEO_CONTAINER_STALENESS_SECONDS', 300)
+TAKEONE_VIDEO_CONTAINER_UNPUBLISHED_STALENESS_SECONDS = getattr(settings, 'TAKEONE_VIDEO_CONTAINER_UNPUBLISHED_STALENESS_SECONDS', 15)
+TAKEONE_BACKGROUND_WORKERS = getattr(settings, 'TAKEONE_BACKGROUND_WORKERS', 4)
+
+PROVISIONING_JOB_MAX_ATTEMPTS = getattr(settings, 'PROVISIONING_JOB_MAX_ATTEMPTS', 5)
+PROVISIONING_JOB_RETRY_DELAY_SECONDS = getattr(settings, 'PROVISIONING_JOB_RETRY_DELAY_SECONDS', 30)
+PROVISIONING_JOB_LOCK_TIMEOUT_SECONDS = getattr(settings, 'PROVISIONING_JOB_LOCK_TIMEOUT_SECONDS', 300)
+PROVISIONING_WORKER_POLL_INTERVAL_SECONDS = getattr(settings, 'PROVISIONING_WORKER_POLL_INTERVAL_SECONDS', 1.0)
+
+WEBHOOK_CONSUMER_BATCH_SIZE = getattr(settings, 'WEBHOOK_CONSUMER_BATCH_SIZE', 100)
+WEBHOOK_CONSUMER_POLL_INTERVAL_SECONDS = getattr(settings, 'WEBHOOK_CONSUMER_POLL_INTERVAL_SECONDS', 1.0)
+WEBHOOK_EVENT_RETENTION_DAYS = getattr(settings, 'WEBHOOK_EVENT_RETENTION_DAYS', 7)
+TAKEONE_WEBHOOK_TOKEN = getattr(settings, 'TAKEONE_WEBHOOK_TOKEN', '')
+
+PROVIDER_FACET_COUNTS_CACHE_SECONDS = getattr(settings, 'PROVIDER_FACET_COUNTS_CACHE_SECONDS', 300)
+PROVIDER_LIST_ITEM_CACHE_SECONDS = getattr(settings, 'PROVIDER_LIST_ITEM_CACHE_SECONDS', 86400)
+PUBLIC_PAGE_CACHE_SECONDS = getattr(settings, 'PUBLIC_PAGE_CACHE_SECONDS', 300)
+
+SQLITE_HARDENED = getattr(settings, 'SQLITE_HARDENED', True)
+SQLITE_BUSY_TIMEOUT_MS = getattr(settings, 'SQLITE_BUSY_TIMEOUT_MS', 5000)
+SQLITE_MMAP_SIZE = getattr(settings, 'SQLITE_MMAP_SIZE', 268435456)
+SQLITE_CACHE_SIZE = getattr(settings, 'SQLITE_CACHE_SIZE', -65536)
+
 FROM_EMAIL = getattr(settings, 'FROM_EMAIL')
\ No newline at end of file
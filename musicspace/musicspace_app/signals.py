@@ -0,0 +1,216 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from musicspace_app.models import (
+    MusicspaceUser, Provider, Genre, Instrument, Address, TakeOneProfileVideoContainer
+)
+from musicspace_app.domain import use_case_factory, reference_data_cache, page_cache
+from musicspace_app.fragment_cache import bump_provider_list_item_version
+
+## when a genre / instrument is cleared from every provider (genre.provider_set.clear()),
+## post_clear has no pk_set, so the providers it's being removed from are noted first
+
+@receiver(m2m_changed, sender=Provider.genres.through)
+@receiver(m2m_changed, sender=Provider.instruments.through)
+def remember_cleared_providers(sender, instance, action: str, reverse: bool, **kwargs):
+    if action != 'pre_clear' or not reverse:
+        return
+    tag_field = next(field for field in sender._meta.fields if field.related_model is type(instance))
+    instance._cleared_provider_ids = list(
+        sender.objects.filter(**{tag_field.name: instance}).values_list('provider_id', flat=True)
+    )
+
+## the providers whose genres / instruments changed, for a change made from the genre /
+## instrument side
+def _changed_provider_ids(instance, pk_set) -> list:
+    if pk_set is not None:
+        return list(pk_set)
+    return getattr(instance, '_cleared_provider_ids', [])
+
+## keep ProviderSearchIndex in sync with the provider, its user and its genres / instruments.
+## a single save (e.g. the profile form) sends several of these signals for the same
+## provider, so the changed providers are collected and their entries are updated once
+## the transaction is committed
+
+class _PendingIndexUpdates:
+    def __init__(self):
+        self.provider_ids = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        use_case_factory.provider_search_use_case().update_indexes(provider_ids=list(self.provider_ids))
+
+def _provider_index_changed(provider_id):
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        use_case_factory.provider_search_use_case().update_index(provider_id=provider_id)
+        return
+
+    ## the pending updates of a rolled back transaction (or savepoint) are no longer queued
+    pending = getattr(connection, '_pending_index_updates', None)
+    if pending is None or pending.done or not any(entry[1] is pending for entry in connection.run_on_commit):
+        pending = _PendingIndexUpdates()
+        connection._pending_index_updates = pending
+        transaction.on_commit(pending)
+    pending.provider_ids.add(provider_id)
+
+@receiver(post_save, sender=Provider)
+def provider_saved(sender, instance: Provider, raw: bool = False, **kwargs):
+    if raw:
+        return
+    _provider_index_changed(provider_id=instance.id)
+
+## the index entry itself is removed by the cascade
+@receiver(post_delete, sender=Provider)
+def provider_deleted(sender, instance: Provider, **kwargs):
+    transaction.on_commit(use_case_factory.provider_search_use_case().invalidate_facet_counts)
+
+@receiver(post_save, sender=MusicspaceUser)
+def user_saved(sender, instance: MusicspaceUser, raw: bool = False, update_fields=None, **kwargs):
+    ## e.g. logging in only saves last_login
+    if raw or (update_fields is not None and 'date_joined' not in update_fields):
+        return
+    provider = instance.provider
+    if provider is not None:
+        _provider_index_changed(provider_id=provider.id)
+
+@receiver(m2m_changed, sender=Provider.genres.through)
+@receiver(m2m_changed, sender=Provider.instruments.through)
+def provider_tags_changed(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        _provider_index_changed(provider_id=instance.id)
+    else:
+        ## the change was made from the genre / instrument side
+        for provider_id in _changed_provider_ids(instance=instance, pk_set=pk_set):
+            _provider_index_changed(provider_id=provider_id)
+
+@receiver(pre_delete, sender=Genre)
+def genre_deleted(sender, instance: Genre, **kwargs):
+    if instance.search_bit is None:
+        return
+    provider_search_use_case = use_case_factory.provider_search_use_case()
+    provider_search_use_case.remove_genre_search_bit(search_bit=instance.search_bit)
+    transaction.on_commit(provider_search_use_case.invalidate_facet_counts)
+
+@receiver(pre_delete, sender=Instrument)
+def instrument_deleted(sender, instance: Instrument, **kwargs):
+    if instance.search_bit is None:
+        return
+    provider_search_use_case = use_case_factory.provider_search_use_case()
+    provider_search_use_case.remove_instrument_search_bit(search_bit=instance.search_bit)
+    transaction.on_commit(provider_search_use_case.invalidate_facet_counts)
+
+## reload the in-process genre / instrument caches in every worker. only once the
+## change is committed: a worker reloading before then would store the old rows
+## under the new version, and the version never expires
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Instrument)
+@receiver(post_delete, sender=Instrument)
+def reference_data_changed(sender, raw: bool = False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(reference_data_cache.invalidate)
+
+## replace the cached public pages that show a provider when anything on them changes.
+## the conditional video container updates made by TakeOneProjectUseCase don't send
+## signals and invalidate the page themselves. pages are only replaced once the change
+## is committed; otherwise a request in between could render the old data and cache
+## it under the new version
+
+def _provider_page_changed(provider_id):
+    transaction.on_commit(lambda: page_cache.invalidate_provider(provider_id=provider_id))
+
+@receiver(post_save, sender=Provider)
+@receiver(post_delete, sender=Provider)
+def provider_page_changed(sender, instance: Provider, raw: bool = False, **kwargs):
+    if raw:
+        return
+    _provider_page_changed(provider_id=instance.id)
+
+@receiver(post_save, sender=MusicspaceUser)
+def provider_user_page_changed(sender, instance: MusicspaceUser, raw: bool = False, update_fields=None, **kwargs):
+    ## logging in only saves last_login, which isn't shown anywhere
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    provider = instance.provider
+    if provider is not None:
+        _provider_page_changed(provider_id=provider.id)
+
+@receiver(post_save, sender=Address)
+def provider_location_page_changed(sender, instance: Address, raw: bool = False, **kwargs):
+    if raw:
+        return
+    provider_id = Provider.objects.filter(location=instance).values_list('id', flat=True).first()
+    if provider_id is not None:
+        _provider_page_changed(provider_id=provider_id)
+
+@receiver(m2m_changed, sender=Provider.genres.through)
+@receiver(m2m_changed, sender=Provider.instruments.through)
+def provider_tags_page_changed(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        _provider_page_changed(provider_id=instance.id)
+    else:
+        for provider_id in _changed_provider_ids(instance=instance, pk_set=pk_set):
+            _provider_page_changed(provider_id=provider_id)
+
+@receiver(post_save, sender=TakeOneProfileVideoContainer)
+def video_container_page_changed(sender, instance: TakeOneProfileVideoContainer, raw: bool = False, **kwargs):
+    if raw:
+        return
+    provider_id = TakeOneProfileVideoContainer.objects.filter(
+        id=instance.id
+    ).values_list('takeone_user__provider_id', flat=True).first()
+    if provider_id is not None:
+        transaction.on_commit(lambda: page_cache.invalidate_provider_detail(provider_id=provider_id))
+
+## replace the cached provider list item (see fragment_cache.py) whenever anything on
+## it changes: the name, title, text, location, genres or instruments. the version is
+## bumped once the change is committed, so a list rendered in between can't cache the
+## old card under the new version
+
+def _provider_list_item_changed(provider_id):
+    transaction.on_commit(lambda: bump_provider_list_item_version(provider_id=provider_id))
+
+@receiver(post_save, sender=Provider)
+def provider_list_item_changed(sender, instance: Provider, raw: bool = False, **kwargs):
+    if raw:
+        return
+    _provider_list_item_changed(provider_id=instance.id)
+
+@receiver(post_save, sender=MusicspaceUser)
+def provider_user_list_item_changed(sender, instance: MusicspaceUser, raw: bool = False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    provider = instance.provider
+    if provider is not None:
+        _provider_list_item_changed(provider_id=provider.id)
+
+@receiver(post_save, sender=Address)
+def provider_location_list_item_changed(sender, instance: Address, raw: bool = False, **kwargs):
+    if raw:
+        return
+    provider_id = Provider.objects.filter(location=instance).values_list('id', flat=True).first()
+    if provider_id is not None:
+        _provider_list_item_changed(provider_id=provider_id)
+
+@receiver(m2m_changed, sender=Provider.genres.through)
+@receiver(m2m_changed, sender=Provider.instruments.through)
+def provider_tags_list_item_changed(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        _provider_list_item_changed(provider_id=instance.id)
+    else:
+        for provider_id in _changed_provider_ids(instance=instance, pk_set=pk_set):
+            _provider_list_item_changed(provider_id=provider_id)
@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+import fcntl
+import threading
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+import musicspace_app.settings as app_settings
+
+## hardened sqlite for single node installs:
+##  - WAL lets readers keep reading while a write is in progress
+##  - synchronous=NORMAL only fsyncs at checkpoints, which is safe with WAL
+##  - busy_timeout makes a writer wait for the lock instead of failing with
+##    `database is locked` straight away
+##  - mmap / cache size keep the hot pages of a small database in memory
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not app_settings.SQLITE_HARDENED:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(app_settings.SQLITE_BUSY_TIMEOUT_MS)}')
+        cursor.execute(f'PRAGMA mmap_size={int(app_settings.SQLITE_MMAP_SIZE)}')
+        cursor.execute(f'PRAGMA cache_size={int(app_settings.SQLITE_CACHE_SIZE)}')
+
+_write_lock = threading.Lock()
+
+@contextmanager
+def _database_file_lock(connection):
+    database_name = str(connection.settings_dict['NAME'])
+    if connection.is_in_memory_db():
+        yield
+        return
+
+    with open(f'{database_name}.write-lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+## a transaction for use cases that read and then write. sqlite starts transactions
+## as readers, and a reader that tries to write after another connection has
+## committed fails with `database is locked` without waiting for the busy timeout.
+## on sqlite this takes a lock shared by every thread and process using the database
+## file first, so these transactions run one at a time. on other databases it is
+## just transaction.atomic
+@contextmanager
+def serialized_write(using: str = DEFAULT_DB_ALIAS):
+    connection = connections[using]
+
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    with _write_lock, _database_file_lock(connection), transaction.atomic(using=using):
+        yield
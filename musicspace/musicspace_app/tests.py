@@ -1,3 +1,730 @@
-from django.test import TestCase
+import base64
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+import httpx
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F, QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from musicspace_app.models import (
+    Address, Genre, MusicspaceUser, Provider, ProviderSearchIndex, TakeOneUser, TakeOneProfileVideoContainer,
+    TakeOneWebhookEvent, ProvisioningJob
+)
+from musicspace_app.domain import (
+    use_case_factory, reference_data_cache, page_cache, ProvisioningJobUseCase, ProviderSearchUseCase,
+    QueryParameters, TakeOneProjectUseCase
+)
+from musicspace_app.errors import BadRequestError
+from musicspace_app.data import TakeOneClient, CreateProjectRequest, VideoContainer, VideoStream
 
-# Create your tests here.
+def webhook_payload(
+    timestamp: int = 1,
+    video_stream_src: str = 'https://example.com/video.m3u8'
+) -> str:
+    return json.dumps({
+        'type': 'project_published',
+        'timestamp': timestamp,
+        'project': {
+            'id': 'project',
+            'video_container': 'video-container',
+            'user': 'takeone-user',
+            'state': 'published',
+            'created_date_time': '2023-01-01T00:00:00Z',
+            'modified_date_time': '2023-01-01T00:00:00Z'
+        },
+        'video_container': {
+            'id': 'video-container',
+            'template': 'template',
+            'hotlinking_protection_enabled': False,
+            'allowed_origins': [],
+            'video_stream': {
+                'src': video_stream_src,
+                'type': 'application/x-mpegURL',
+                'video_format': 'landscape'
+            },
+            'created_date_time': '2023-01-01T00:00:00Z',
+            'modified_date_time': '2023-01-01T00:00:00Z'
+        }
+    })
+
+## query budgets for the public views. the providers, genres and instruments come from
+## the data migration. a failing test here means a view started issuing more queries
+## (usually a lazy relation in a template) - fix the view rather than raising the budget
+
+## the manifest storage needs `collectstatic` to have been run
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PublicViewQueryBudgetTests(TestCase):
+
+    def setUp(self):
+        ## start every test with cold facet counts and warm genres / instruments,
+        ## which is what a long-running worker sees
+        cache.clear()
+        reference_data_cache.invalidate()
+        reference_data_cache.genres()
+
+        ## the budgets are for rendering the page, see PublicPageCacheTests for cached pages
+        self.page_cache_timeout_seconds = page_cache.timeout_seconds
+        page_cache.timeout_seconds = 0
+
+    def tearDown(self):
+        page_cache.timeout_seconds = self.page_cache_timeout_seconds
+
+    def test_index(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('musicspace:index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_provider_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('musicspace:provider-list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_provider_list_with_cached_facet_counts(self):
+        self.client.get(reverse('musicspace:provider-list'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('musicspace:provider-list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_provider_list_filtered(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('musicspace:provider-list'),
+                {'modality': 'online_only', 'genre': ['jazz', 'rock'], 'instrument': ['piano']}
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_provider_list_next_page(self):
+        response = self.client.get(reverse('musicspace:provider-list'))
+        next_page_url = response.context['next_page_url']
+        self.assertIsNotNone(next_page_url)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(next_page_url, HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+
+    def test_provider_list_invalid_cursor(self):
+        for cursor in [['2020-01-01', 5], ['2020-01-01'], {'a': 1}, 'not a cursor']:
+            encoded_cursor = base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('utf-8')
+            response = self.client.get(reverse('musicspace:provider-list'), {'cursor': encoded_cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_provider_detail(self):
+        provider = Provider.objects.first()
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('musicspace:provider-detail', kwargs={'provider_id': provider.id}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_provider_detail_with_video(self):
+        provider = Provider.objects.first()
+        takeone_user = TakeOneUser.objects.create(provider=provider, takeone_id='takeone-user')
+        TakeOneProfileVideoContainer.objects.create(
+            id='video-container',
+            template='template',
+            takeone_user=takeone_user,
+            video_stream_src='https://example.com/video.m3u8',
+            video_stream_type='application/x-mpegURL',
+            video_stream_video_format=TakeOneProfileVideoContainer.VideoFormat.LANDSCAPE
+        )
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('musicspace:provider-detail', kwargs={'provider_id': provider.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'https://example.com/video.m3u8')
+
+    def test_provider_detail_not_found(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('musicspace:provider-detail', kwargs={'provider_id': '00000000-0000-0000-0000-000000000000'})
+            )
+        self.assertEqual(response.status_code, 404)
+
+    def test_for_providers(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('musicspace:for-teachers'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_about_us(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('musicspace:about-us'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_provider_login(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('musicspace:provider-login'), {'next': reverse('musicspace:provider-profile')})
+        self.assertEqual(response.status_code, 200)
+
+    def test_takeone_webhook(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('musicspace:takeone-webhook'), data=webhook_payload(), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PublicPageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reference_data_cache.invalidate()
+        reference_data_cache.genres()
+
+    def test_cached_page_runs_no_queries(self):
+        first_response = self.client.get(reverse('musicspace:provider-list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('musicspace:provider-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, first_response.content)
+        self.assertEqual(response['ETag'], first_response['ETag'])
+
+    def test_query_parameter_order_shares_a_page(self):
+        self.client.get(reverse('musicspace:provider-list'), {'genre': ['jazz', 'rock']})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('musicspace:provider-list'), {'genre': ['rock', 'jazz']})
+
+    def test_missing_and_either_modality_are_cached_apart(self):
+        response = self.client.get(reverse('musicspace:provider-list'), {'genre': 'jazz'})
+        self.assertNotEqual(response.content, self.client.get(
+            reverse('musicspace:provider-list'),
+            {'genre': 'jazz', 'modality': 'either'}
+        ).content)
+
+    def test_htmx_trigger_is_part_of_the_key(self):
+        response = self.client.get(reverse('musicspace:provider-list'))
+        self.assertNotEqual(response.content, self.client.get(
+            reverse('musicspace:provider-list'),
+            HTTP_HX_REQUEST='true',
+            HTTP_HX_TRIGGER='provider-search-filter'
+        ).content)
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('musicspace:about-us'))
+        self.assertFalse(response.has_header('ETag'))
+
+        response = self.client.get(reverse('musicspace:provider-list'))
+        response = self.client.get(reverse('musicspace:provider-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse('musicspace:provider-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_provider_change_replaces_pages(self):
+        provider = Provider.objects.first()
+        detail_url = reverse('musicspace:provider-detail', kwargs={'provider_id': provider.id})
+        self.client.get(reverse('musicspace:provider-list'))
+        self.client.get(detail_url)
+
+        online_count = Provider.objects.filter(online=True).count()
+        with self.captureOnCommitCallbacks(execute=True):
+            provider.title = 'A brand new title'
+            provider.online = not provider.online
+            provider.save()
+        online_count += 1 if provider.online else -1
+
+        self.assertContains(self.client.get(detail_url), 'A brand new title')
+        self.assertContains(
+            self.client.get(reverse('musicspace:provider-list')),
+            f'Online Lessons Only ({online_count})'
+        )
+
+    def test_pages_are_replaced_after_commit(self):
+        provider = Provider.objects.first()
+        detail_url = reverse('musicspace:provider-detail', kwargs={'provider_id': provider.id})
+        self.client.get(detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            provider.title = 'A brand new title'
+            provider.save()
+            ## still in the saving transaction
+            with self.assertNumQueries(0):
+                self.client.get(detail_url)
+        self.assertTrue(callbacks)
+        self.assertContains(self.client.get(detail_url), 'A brand new title')
+
+    def test_changes_outside_the_profile_form_replace_list_items(self):
+        provider = ProviderSearchIndex.objects.order_by('date_joined', 'provider_id').first().provider
+        self.client.get(reverse('musicspace:provider-list'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            provider.user.first_name = 'Renamed'
+            provider.user.save()
+        self.assertContains(self.client.get(reverse('musicspace:provider-list')), f'Renamed {provider.user.last_name}')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            provider.location.city = 'Hoboken'
+            provider.location.save()
+        self.assertContains(self.client.get(reverse('musicspace:provider-list')), 'Hoboken, ')
+
+    def test_video_container_update_replaces_detail_page(self):
+        provider = Provider.objects.first()
+        takeone_user = TakeOneUser.objects.create(provider=provider, takeone_id='takeone-user')
+        TakeOneProfileVideoContainer.objects.create(id='video-container', template='template', takeone_user=takeone_user)
+        detail_url = reverse('musicspace:provider-detail', kwargs={'provider_id': provider.id})
+        self.assertNotContains(self.client.get(detail_url), 'https://example.com/video.m3u8')
+
+        self.client.post(reverse('musicspace:takeone-webhook'), data=webhook_payload(), content_type='application/json')
+        with self.captureOnCommitCallbacks(execute=True):
+            use_case_factory.takeone_project_use_case().process_webhook_events()
+
+        self.assertContains(self.client.get(detail_url), 'https://example.com/video.m3u8')
+
+    def test_logged_in_users_are_not_served_cached_pages(self):
+        self.client.get(reverse('musicspace:provider-list'))
+        provider = Provider.objects.first()
+        self.client.force_login(provider.user)
+
+        response = self.client.get(reverse('musicspace:provider-list'))
+        self.assertContains(response, f'Hi, {provider.full_name}')
+
+class ReferenceDataCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reference_data_cache.invalidate()
+
+    def test_genre_changes_are_loaded_after_commit(self):
+        genre = reference_data_cache.genres()[0]
+        version = reference_data_cache.version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.display_text = 'Renamed'
+            genre.save()
+            self.assertEqual(reference_data_cache.version(), version)
+
+        self.assertNotEqual(reference_data_cache.version(), version)
+        self.assertIn('Renamed', [genre.display_text for genre in reference_data_cache.genres()])
+
+class ProviderSearchIndexTests(TestCase):
+
+    def test_clearing_a_genre_updates_only_its_providers(self):
+        genre = Genre.objects.filter(provider__isnull=False).first()
+        provider_ids = set(genre.provider_set.values_list('id', flat=True))
+        other_entries = list(ProviderSearchIndex.objects.exclude(provider_id__in=provider_ids).values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.provider_set.clear()
+
+        for entry in ProviderSearchIndex.objects.filter(provider_id__in=provider_ids):
+            self.assertFalse(entry.genre_mask & (1 << genre.search_bit))
+        self.assertEqual(list(ProviderSearchIndex.objects.exclude(provider_id__in=provider_ids).values()), other_entries)
+
+    def test_provider_is_updated_once_per_transaction(self):
+        provider = Provider.objects.first()
+        genre = Genre.objects.exclude(provider=provider).first()
+        with mock.patch.object(ProviderSearchUseCase, 'update_indexes', autospec=True) as update_indexes:
+            with self.captureOnCommitCallbacks(execute=True):
+                provider.save()
+                provider.user.save()
+                provider.genres.add(genre)
+                update_indexes.assert_not_called()
+        update_indexes.assert_called_once_with(mock.ANY, provider_ids=[provider.id])
+
+        ## and the entry is up to date once it runs
+        with self.captureOnCommitCallbacks(execute=True):
+            provider.save()
+        self.assertTrue(ProviderSearchIndex.objects.get(provider=provider).genre_mask & (1 << genre.search_bit))
+
+    def test_deleted_genre_bit_is_not_matched_by_a_new_genre(self):
+        genre = Genre.objects.filter(provider__isnull=False).first()
+        search_bit = genre.search_bit
+        provider_search_use_case = use_case_factory.provider_search_use_case()
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.delete()
+
+        self.assertFalse(ProviderSearchIndex.objects.alias(
+            search_bit_set=F('genre_mask').bitand(1 << search_bit)
+        ).exclude(search_bit_set=0).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_genre = Genre.objects.create(id='newgenre', display_text='New Genre')
+        self.assertEqual(provider_search_use_case.search(QueryParameters(genre=['newgenre'])).count(), 0)
+        self.assertEqual(provider_search_use_case.facet_counts(QueryParameters()).genres[new_genre.id], 0)
+
+    def test_bit_still_set_in_the_index_is_not_reused(self):
+        genre = Genre.objects.filter(provider__isnull=False).first()
+        search_bit = genre.search_bit
+        Genre.objects.exclude(search_bit__lt=search_bit).exclude(id=genre.id).delete()
+        ## removed without the delete signals, so the index still has the bit
+        Provider.genres.through.objects.filter(genre=genre)._raw_delete(using='default')
+        Genre.objects.filter(id=genre.id)._raw_delete(using='default')
+
+        new_genre = Genre.objects.create(id='newgenre', display_text='New Genre')
+        self.assertNotEqual(new_genre.search_bit, search_bit)
+
+    def test_facet_counts_are_replaced_after_commit(self):
+        provider_search_use_case = use_case_factory.provider_search_use_case()
+        provider = Provider.objects.filter(in_person=True).first()
+        in_person_only = provider_search_use_case.facet_counts(QueryParameters()).modalities['in_person_only']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            provider.in_person = False
+            provider.online = True
+            provider.save()
+            ## a request before the commit still gets the cached counts
+            self.assertEqual(provider_search_use_case.facet_counts(QueryParameters()).modalities['in_person_only'], in_person_only)
+
+        self.assertNotEqual(provider_search_use_case.facet_counts(QueryParameters()).modalities['in_person_only'], in_person_only)
+
+    def test_rebuild_is_atomic(self):
+        count = ProviderSearchIndex.objects.count()
+        provider_search_use_case = use_case_factory.provider_search_use_case()
+        with mock.patch.object(ProviderSearchIndex.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                provider_search_use_case.rebuild_index(batch_size=5)
+        self.assertEqual(ProviderSearchIndex.objects.count(), count)
+
+class SeededProvidersTests(TestCase):
+
+    def _counts(self):
+        return (
+            MusicspaceUser.objects.count(),
+            Address.objects.count(),
+            Provider.objects.count(),
+            ProviderSearchIndex.objects.count(),
+            Provider.genres.through.objects.count(),
+            Provider.instruments.through.objects.count()
+        )
+
+    def test_seeded_batches_are_deleted_on_their_own(self):
+        counts_before = self._counts()
+        call_command('seed_providers', count=25, batch='kept', chunk_size=10, stdout=StringIO())
+        counts_with_kept_batch = self._counts()
+        call_command('seed_providers', count=40, batch='deleted', chunk_size=10, stdout=StringIO())
+        self.assertEqual(Provider.objects.count(), counts_before[2] + 65)
+        self.assertEqual(ProviderSearchIndex.objects.count(), counts_before[3] + 65)
+
+        call_command('delete_seeded_providers', batch='deleted', stdout=StringIO())
+        self.assertEqual(self._counts(), counts_with_kept_batch)
+
+    def test_batches_with_overlapping_names_are_kept_apart(self):
+        call_command('seed_providers', count=3, batch='x-y', stdout=StringIO())
+        call_command('seed_providers', count=3, batch='x', stdout=StringIO())
+        call_command('delete_seeded_providers', batch='x', stdout=StringIO())
+        self.assertEqual(Provider.objects.filter(user__username__contains='seed_').count(), 3)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_providers', count=3, batch='x_y', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('delete_seeded_providers', batch='x_y', stdout=StringIO())
+
+    def test_seeding_is_deterministic(self):
+        call_command('seed_providers', count=5, batch='deterministic', stdout=StringIO())
+        providers = list(Provider.objects.filter(
+            user__username__contains='seed_deterministic_'
+        ).order_by('id').values_list('id', 'title', 'text', 'user__username'))
+        call_command('delete_seeded_providers', batch='deterministic', stdout=StringIO())
+
+        ## ids don't depend on how the providers are split into chunks
+        call_command('seed_providers', count=5, batch='deterministic', chunk_size=2, stdout=StringIO())
+        self.assertEqual(list(Provider.objects.filter(
+            user__username__contains='seed_deterministic_'
+        ).order_by('id').values_list('id', 'title', 'text', 'user__username')), providers)
+
+    def test_providers_with_takeone_users_are_not_deleted(self):
+        call_command('seed_providers', count=5, batch='provisioned', stdout=StringIO())
+        TakeOneUser.objects.create(
+            provider=Provider.objects.filter(user__username__contains='seed_provisioned_').first(),
+            takeone_id='takeone-user'
+        )
+
+        with self.assertRaises(CommandError):
+            call_command('delete_seeded_providers', batch='provisioned', stdout=StringIO())
+        self.assertEqual(Provider.objects.filter(user__username__contains='seed_provisioned_').count(), 5)
+
+class TakeOneWebhookTests(TestCase):
+
+    def setUp(self):
+        provider = Provider.objects.first()
+        takeone_user = TakeOneUser.objects.create(provider=provider, takeone_id='takeone-user')
+        self.video_container = TakeOneProfileVideoContainer.objects.create(
+            id='video-container',
+            template='template',
+            takeone_user=takeone_user
+        )
+
+    def _post(self, payload, **kwargs):
+        return self.client.post(reverse('musicspace:takeone-webhook'), data=payload, content_type='application/json', **kwargs)
+
+    def _process(self) -> int:
+        return use_case_factory.takeone_project_use_case().process_webhook_events()
+
+    def test_stale_event_does_not_overwrite_newer_state(self):
+        self._post(webhook_payload(timestamp=2, video_stream_src='https://example.com/new.m3u8'))
+        self._process()
+        self._post(webhook_payload(timestamp=1, video_stream_src='https://example.com/old.m3u8'))
+        self.assertEqual(self._process(), 1)
+
+        self.video_container.refresh_from_db()
+        self.assertEqual(self.video_container.video_stream_src, 'https://example.com/new.m3u8')
+        self.assertEqual(self.video_container.takeone_event_timestamp, 2)
+        self.assertFalse(TakeOneWebhookEvent.objects.filter(processed_date_time__isnull=True).exists())
+
+    def test_redelivered_event_is_a_no_op(self):
+        self._post(webhook_payload())
+        self._process()
+        self.video_container.refresh_from_db()
+        modified_date_time = self.video_container.modified_date_time
+
+        self.assertEqual(self._post(webhook_payload()).status_code, 200)
+        self.assertEqual(TakeOneWebhookEvent.objects.count(), 1)
+        self.assertEqual(self._process(), 0)
+        self.video_container.refresh_from_db()
+        self.assertEqual(self.video_container.modified_date_time, modified_date_time)
+
+    def test_latest_event_in_a_batch_wins(self):
+        self._post(webhook_payload(timestamp=3, video_stream_src='https://example.com/latest.m3u8'))
+        self._post(webhook_payload(timestamp=2, video_stream_src='https://example.com/older.m3u8'))
+        self.assertEqual(self._process(), 2)
+
+        self.video_container.refresh_from_db()
+        self.assertEqual(self.video_container.video_stream_src, 'https://example.com/latest.m3u8')
+        self.assertEqual(self.video_container.takeone_event_timestamp, 3)
+
+    def test_undecodable_and_invalid_payloads_are_rejected(self):
+        self.assertEqual(self._post(b'\xff\xfe').status_code, 400)
+        self.assertEqual(self._post(json.dumps({'type': 'project_published', 'timestamp': 1})).status_code, 400)
+        self.assertFalse(TakeOneWebhookEvent.objects.exists())
+
+    def test_token_is_required_when_configured(self):
+        with mock.patch('musicspace_app.settings.TAKEONE_WEBHOOK_TOKEN', 'secret'):
+            self.assertEqual(self._post(webhook_payload()).status_code, 403)
+            self.assertEqual(self._post(webhook_payload(), QUERY_STRING='token=wrong').status_code, 403)
+            self.assertEqual(self._post(webhook_payload(), QUERY_STRING='token=secret').status_code, 200)
+        self.assertEqual(TakeOneWebhookEvent.objects.count(), 1)
+
+    def test_old_processed_events_are_deleted(self):
+        self._post(webhook_payload(timestamp=1))
+        self._post(webhook_payload(timestamp=2))
+        self._process()
+        self._post(webhook_payload(timestamp=3))
+
+        old_event = TakeOneWebhookEvent.objects.first()
+        TakeOneWebhookEvent.objects.filter(id=old_event.id).update(
+            processed_date_time=timezone.now() - timedelta(days=8)
+        )
+
+        takeone_project_use_case = use_case_factory.takeone_project_use_case()
+        self.assertEqual(takeone_project_use_case.delete_processed_webhook_events(retention_days=7), 1)
+        ## the recently processed and the pending events are kept
+        self.assertEqual(TakeOneWebhookEvent.objects.count(), 2)
+        self.assertFalse(TakeOneWebhookEvent.objects.filter(id=old_event.id).exists())
+
+class ProvisioningJobTests(TestCase):
+
+    def setUp(self):
+        self.provider = Provider.objects.first()
+        self.takeone_user_use_case = mock.Mock()
+        self.takeone_project_use_case = mock.Mock()
+        self.takeone_project_use_case.create_project.return_value = mock.Mock(id='project')
+
+    def _use_case(self) -> ProvisioningJobUseCase:
+        return ProvisioningJobUseCase(
+            takeone_user_use_case=self.takeone_user_use_case,
+            takeone_project_use_case=self.takeone_project_use_case,
+            max_attempts=3,
+            retry_delay_seconds=30
+        )
+
+    def test_failed_job_resumes_from_its_step(self):
+        takeone_user = TakeOneUser.objects.create(provider=self.provider, takeone_id='takeone-user')
+        TakeOneProfileVideoContainer.objects.create(id='video-container', template='template', takeone_user=takeone_user)
+        failed_job = ProvisioningJob.objects.create(
+            provider=self.provider,
+            state=ProvisioningJob.State.FAILED,
+            step=ProvisioningJob.Step.CREATE_PROJECT,
+            attempts=3
+        )
+
+        provisioning_job_use_case = self._use_case()
+        job = provisioning_job_use_case.enqueue(provider=self.provider)
+        self.assertEqual(job.id, failed_job.id)
+        self.assertEqual((job.state, job.attempts), (ProvisioningJob.State.PENDING, 0))
+
+        provisioning_job_use_case.run_job(provisioning_job_use_case.claim_next_job())
+
+        self.takeone_user_use_case.create_user.assert_not_called()
+        self.takeone_project_use_case.create_profile_video_container.assert_not_called()
+        self.takeone_project_use_case.create_project.assert_called_once()
+        self.takeone_user_use_case.send_invitation_email.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.step, job.takeone_project_id), (
+            ProvisioningJob.State.COMPLETED, ProvisioningJob.Step.DONE, 'project'
+        ))
+
+    def test_provisioned_provider_is_not_provisioned_again(self):
+        provisioning_job_use_case = self._use_case()
+        job = provisioning_job_use_case.enqueue(provider=self.provider)
+        ProvisioningJob.objects.filter(id=job.id).update(
+            state=ProvisioningJob.State.COMPLETED,
+            step=ProvisioningJob.Step.DONE
+        )
+        self.assertEqual(provisioning_job_use_case.enqueue(provider=self.provider).id, job.id)
+        self.assertIsNone(provisioning_job_use_case.claim_next_job())
+
+        ## provisioned before there were jobs
+        ProvisioningJob.objects.all().delete()
+        takeone_user = TakeOneUser.objects.create(provider=self.provider, takeone_id='takeone-user')
+        TakeOneProfileVideoContainer.objects.create(id='video-container', template='template', takeone_user=takeone_user)
+        with self.assertRaises(BadRequestError):
+            provisioning_job_use_case.enqueue(provider=self.provider)
+        self.assertFalse(ProvisioningJob.objects.exists())
+
+    def test_failed_attempts_back_off_exponentially(self):
+        self.takeone_user_use_case.create_user.side_effect = Exception('TakeOne is down')
+        provisioning_job_use_case = self._use_case()
+        job = provisioning_job_use_case.enqueue(provider=self.provider)
+
+        for (attempt, delay_seconds) in [(1, 30), (2, 60)]:
+            started_at = timezone.now()
+            provisioning_job_use_case.run_job(provisioning_job_use_case.claim_next_job())
+            job.refresh_from_db()
+            self.assertEqual((job.state, job.attempts), (ProvisioningJob.State.PENDING, attempt))
+            self.assertEqual(job.last_error, 'TakeOne is down')
+            self.assertGreaterEqual(job.available_date_time, started_at + timedelta(seconds=delay_seconds))
+            self.assertLess(job.available_date_time, started_at + timedelta(seconds=delay_seconds + 5))
+
+            ## not picked up again before the delay is over
+            self.assertIsNone(provisioning_job_use_case.claim_next_job())
+            ProvisioningJob.objects.filter(id=job.id).update(available_date_time=timezone.now())
+
+        provisioning_job_use_case.run_job(provisioning_job_use_case.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (ProvisioningJob.State.FAILED, 3))
+
+    def test_job_is_claimed_by_one_worker(self):
+        job = self._use_case().enqueue(provider=self.provider)
+        worker = self._use_case()
+        other_worker = self._use_case()
+
+        ## the other worker claims the job after this worker has read its candidates,
+        ## but before its conditional update
+        other_worker_claims = []
+        update = QuerySet.update
+        def update_after_other_worker_claims(queryset, **kwargs):
+            if not other_worker_claims:
+                with mock.patch.object(QuerySet, 'update', update):
+                    other_worker_claims.append(other_worker.claim_next_job())
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_after_other_worker_claims):
+            self.assertIsNone(worker.claim_next_job())
+
+        self.assertEqual(other_worker_claims[0].id, job.id)
+        self.assertIsNone(worker.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (ProvisioningJob.State.RUNNING, 1))
+
+class TakeOneClientTests(TestCase):
+
+    def _client(self, handler) -> TakeOneClient:
+        takeone_client = TakeOneClient(base_url='https://takeone.example.com', client_id='id', client_secret='secret')
+        takeone_client._client = httpx.Client(transport=httpx.MockTransport(handler))
+        return takeone_client
+
+    def test_requests_are_counted(self):
+        def handler(request):
+            if request.url.path == '/api/v1/app_users/authorize':
+                return httpx.Response(200, json={'code': 'code'})
+            if request.url.path == '/api/v1/projects':
+                return httpx.Response(400, json={'detail': 'invalid'})
+            raise httpx.ConnectError('unreachable', request=request)
+
+        takeone_client = self._client(handler)
+        self.assertEqual(takeone_client.authorize(user_id='user'), 'code')
+        with self.assertRaises(httpx.HTTPStatusError):
+            takeone_client.create_project(request=CreateProjectRequest(user='user', video_container='video-container'))
+        with self.assertRaises(httpx.ConnectError):
+            takeone_client.fetch_video_container(video_container_id='video-container')
+
+        pool_stats = takeone_client.pool_stats()
+        self.assertEqual((pool_stats.requests_total, pool_stats.requests_in_flight, pool_stats.requests_failed), (3, 0, 2))
+
+    def test_pool_stats_are_only_shown_to_staff(self):
+        user = MusicspaceUser.objects.create(username='staff')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('musicspace:takeone-pool-stats')).status_code, 403)
+
+        MusicspaceUser.objects.filter(id=user.id).update(is_staff=True)
+        response = self.client.get(reverse('musicspace:takeone-pool-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('requests_failed', response.json()['takeone_client'])
+
+class VideoContainerRefreshTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        takeone_user = TakeOneUser.objects.create(provider=Provider.objects.first(), takeone_id='takeone-user')
+        self.video_container = TakeOneProfileVideoContainer.objects.create(
+            id='video-container',
+            template='template',
+            takeone_user=takeone_user,
+            video_stream_src='https://example.com/video.m3u8',
+            video_stream_type='application/x-mpegURL',
+            video_stream_video_format='landscape'
+        )
+        self.takeone_client = mock.Mock()
+        self.takeone_client.fetch_video_container.return_value = self._server_video_container(
+            video_stream_src='https://example.com/video.m3u8'
+        )
+        ## runs the refresh straight away, on this thread
+        background_executor = mock.Mock()
+        background_executor.submit.side_effect = lambda fn, **kwargs: fn(**kwargs)
+        self.takeone_project_use_case = TakeOneProjectUseCase(
+            takeone_client=self.takeone_client,
+            profile_video_container_template_id='template',
+            background_executor=background_executor,
+            staleness_seconds=300
+        )
+
+    def _server_video_container(self, video_stream_src: str) -> VideoContainer:
+        return VideoContainer(
+            id='video-container',
+            template='template',
+            name='video container',
+            hotlinking_protection_enabled=False,
+            allowed_origins=[],
+            video_stream=VideoStream(src=video_stream_src, type='application/x-mpegURL', video_format='landscape'),
+            created_date_time='2023-01-01T00:00:00Z',
+            modified_date_time='2023-01-01T00:00:00Z'
+        )
+
+    def test_fresh_container_is_not_fetched_again(self):
+        self.assertTrue(self.takeone_project_use_case.refresh_video_container_if_stale(video_container=self.video_container))
+        self.assertFalse(self.takeone_project_use_case.refresh_video_container_if_stale(video_container=self.video_container))
+        self.takeone_client.fetch_video_container.assert_called_once()
+
+    def test_unchanged_container_is_not_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.takeone_project_use_case.refresh_video_container_if_stale(video_container=self.video_container)
+        self.takeone_client.fetch_video_container.assert_called_once()
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
+    def test_changed_container_is_written(self):
+        self.takeone_client.fetch_video_container.return_value = self._server_video_container(
+            video_stream_src='https://example.com/new.m3u8'
+        )
+        self.takeone_project_use_case.refresh_video_container_if_stale(video_container=self.video_container)
+        self.video_container.refresh_from_db()
+        self.assertEqual(self.video_container.video_stream_src, 'https://example.com/new.m3u8')
+
+    def test_webhook_during_the_refresh_wins(self):
+        ## the webhook is applied while the refresh is waiting for TakeOne, whose
+        ## response was already outdated
+        def fetch_video_container(video_container_id):
+            self.client.post(
+                reverse('musicspace:takeone-webhook'),
+                data=webhook_payload(timestamp=5, video_stream_src='https://example.com/webhook.m3u8'),
+                content_type='application/json'
+            )
+            use_case_factory.takeone_project_use_case().process_webhook_events()
+            return self._server_video_container(video_stream_src='https://example.com/stale.m3u8')
+        self.takeone_client.fetch_video_container.side_effect = fetch_video_container
+
+        self.takeone_project_use_case.refresh_video_container_if_stale(video_container=self.video_container)
+        self.video_container.refresh_from_db()
+        self.assertEqual(self.video_container.video_stream_src, 'https://example.com/webhook.m3u8')
+        self.assertEqual(self.video_container.takeone_event_timestamp, 5)
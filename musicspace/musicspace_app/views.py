@@ -1,28 +1,45 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from django.shortcuts import render, get_object_or_404
-from django.views.generic.base import TemplateView
+from django.views.generic.base import TemplateView, View
 from django.urls import reverse
-from django.http import HttpResponse, HttpResponseRedirect, QueryDict, HttpResponseBadRequest
-from musicspace_app.models import Provider, Genre, Instrument, TakeOneProfileVideoContainer
-from django.core.paginator import Paginator 
-from dataclasses import dataclass, asdict, field
+from django.http import HttpResponse, HttpResponseRedirect, QueryDict
+from musicspace_app.models import (
+    Provider, Genre, Instrument, TakeOneProfileVideoContainer, ProvisioningJob,
+    ProviderSearchIndex
+)
+from dataclasses import asdict
 import urllib.parse
-from enum import Enum
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin, AccessMixin
 from django.contrib.auth import logout
 from django.contrib import messages
 from django.contrib.auth.views import LoginView, LogoutView
 from django.shortcuts import redirect
-from django.views.generic.edit import UpdateView, FormView
+from django.views.generic.edit import UpdateView
 from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
 from rest_framework import status
 from rest_framework.response import Response
-from musicspace_app.forms import AddressForm, ProviderForm, MusicspaceUserForm, EmptyForm
-from django.db import transaction
-from musicspace_app.domain import use_case_factory
+from musicspace_app.forms import AddressForm, ProviderForm, MusicspaceUserForm
+from django.db.models import Q
+from musicspace_app.domain import use_case_factory, reference_data_cache, page_cache, QueryParameters
 import json
-from django.core.exceptions import ObjectDoesNotExist
+import os
+import base64
+import hashlib
+import time
+import uuid
+from datetime import datetime
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, BadRequest
 import musicspace_app.errors as app_errors
+from musicspace_app.fragment_cache import render_provider_list_items
+from musicspace_app.db_router import replica_reads
+from musicspace_app.sqlite import serialized_write
+from musicspace_app.service_locator import takeone_client, async_takeone_client
 
 class ProviderPortalAuthMixin(UserPassesTestMixin, LoginRequiredMixin):
     login_url = 'musicspace:provider-login'
@@ -41,6 +58,18 @@ class ProviderPortalComponentAuthMixin(UserPassesTestMixin, LoginRequiredMixin):
     def test_func(self):
         return self.request.user.is_authenticated and self.request.user.provider != None
 
+## async views cannot use the auth mixins above since they touch the
+## (lazy) user and provider synchronously from inside the event loop
+class AsyncProviderPortalComponentAuthMixin:
+    def test_func(self):
+        return self.request.user.is_authenticated and self.request.user.provider != None
+
+    async def dispatch(self, request, *args, **kwargs):
+        has_permission = await sync_to_async(self.test_func)()
+        if not has_permission:
+            raise PermissionDenied()
+        return await super().dispatch(request, *args, **kwargs)
+
 class ProviderLoginView(LoginView):
     template_name = 'musicspace_app/login.html'
     next_page = 'musicspace:provider-profile'
@@ -57,29 +86,92 @@ class ProviderLoginView(LoginView):
 class ProviderLogoutView(LogoutView):
     next_page ='musicspace:index'
 
-class Modality(str, Enum):
-    IN_PERSON_ONLY = 'in_person_only'
-    ONLINE_ONLY = 'online_only'
-    EITHER = 'either'
-
-@dataclass
-class QueryParameters:
-    modality: Modality = Modality.EITHER
-    genre: List[str] = field(default_factory=list)
-    instrument: List[str] = field(default_factory=list)
+## runs the read-only public views against the read replica, when one is configured.
+## the template is rendered inside the block too, since it can still run queries
+class ReadReplicaMixin:
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+## serves anonymous GETs of the public views from PageCache. the cached response
+## carries an ETag and Last-Modified, so browsers revalidate with a 304 instead of
+## downloading the page again. anyone logged in, or with messages waiting to be shown,
+## gets a freshly rendered page
+class AnonymousPageCacheMixin:
+
+    def get_page_cache_key(self) -> str:
+        raise NotImplementedError()
+
+    def _htmx_key_parts(self) -> List[Any]:
+        ## the template depends on whether this is an htmx request and what triggered it
+        return [bool(self.request.htmx), self.request.headers.get('HX-Trigger')]
+
+    def _is_page_cacheable(self) -> bool:
+        return self.request.method in ('GET', 'HEAD') and \
+            page_cache.timeout_seconds > 0 and \
+            not self.request.user.is_authenticated and \
+            len(messages.get_messages(self.request)) == 0
+
+    def _build_page_cache_entry(self, response: HttpResponse) -> Dict[str, Any]:
+        return {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+            'last_modified': int(time.time())
+        }
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self._is_page_cacheable():
+            return super().dispatch(request, *args, **kwargs)
+
+        page_cache_key = self.get_page_cache_key()
+        entry = page_cache.get(page_cache_key)
+
+        if entry is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if hasattr(response, 'render'):
+                response.render()
+            entry = self._build_page_cache_entry(response=response)
+            page_cache.set(page_cache_key, entry)
+        else:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        ## let the browser keep the page, but always check it is still current
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['HX-Request', 'HX-Trigger'])
+
+        return get_conditional_response(
+            request,
+            etag=entry['etag'],
+            last_modified=entry['last_modified'],
+            response=response
+        )
 
 DEFAULT_PAGE_SIZE = 10
-class ProviderListView(TemplateView):
+
+## the search filter form posts here only to be redirected to the matching GET url.
+## nothing changes server side, so it doesn't need a csrf token - which would
+## otherwise make the cached pages different for every visitor
+@method_decorator(csrf_exempt, name='dispatch')
+class ProviderListView(ReadReplicaMixin, AnonymousPageCacheMixin, TemplateView):
 
     ## this needs to differentiate between the initial load
     ## the filters being updated
     ## and another page being loaded
     def get_template_names(self) -> List[str]:
         if self.request.htmx:
-            if self.request.htmx.trigger == 'provider-search-filter':
-                return 'musicspace_app/components/provider_search_results.html'
-            else:
+            if self.is_next_page_request():
                 return 'musicspace_app/components/provider_list.html'
+            else:
+                return 'musicspace_app/components/provider_search_results.html'
         else:
             return 'musicspace_app/provider_search.html'
 
@@ -96,87 +188,128 @@ class ProviderListView(TemplateView):
     def _generate_url_from_query_params(
         self,
         query_params: QueryParameters,
-        next_page_index: Optional[int] = None
+        cursor: Optional[str] = None
     ) -> str:
         base_url = reverse('musicspace:provider-list')
 
         ## we should probably only include these if they are different than defaults
         query_dict = {key: value for (key, value) in asdict(query_params).items() if value is not None} 
-        if next_page_index:
-            query_dict['page'] = next_page_index
+        if cursor:
+            query_dict['cursor'] = cursor
         query_string = urllib.parse.urlencode(query_dict, doseq=True)
         return "%s?%s" % (base_url, query_string)
 
-    def get_queryset(
+    ## the cursor is the sort key, (date_joined, provider id), of the last provider
+    ## on the previous page. it is opaque to the client
+    def _encode_cursor(
         self,
-        query_params: QueryParameters
-    ):
-        providers_queryset = Provider.objects.all()
-
-        if query_params.modality == Modality.IN_PERSON_ONLY:
-            providers_queryset = providers_queryset.exclude(
-                in_person=False
-            )
+        entry: ProviderSearchIndex
+    ) -> str:
+        cursor = json.dumps([entry.date_joined.isoformat(), str(entry.provider_id)])
+        return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('utf-8')
 
-        elif query_params.modality == Modality.ONLINE_ONLY:
-            providers_queryset = providers_queryset.exclude(
-                online=False
+    def _decode_cursor(
+        self,
+        cursor: str
+    ) -> Tuple[datetime, uuid.UUID]:
+        try:
+            (date_joined, provider_id) = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+            if not isinstance(date_joined, str) or not isinstance(provider_id, str):
+                raise TypeError('expected a date and a provider id')
+            return (datetime.fromisoformat(date_joined), uuid.UUID(provider_id))
+        except (ValueError, TypeError) as e:
+            raise BadRequest(f'Invalid cursor: {e}')
+
+    def _get_query_params(self) -> QueryParameters:
+        if not self.request.GET:
+            return QueryParameters()
+        else:
+            return self._generate_query_params_from_input(
+                d=self.request.GET
             )
 
-        ## if genres are selected, we want to include teachers that match ANY of the genres
-        if query_params.genre:
-            providers_queryset = providers_queryset.filter(
-                genres__in=query_params.genre
-            ).distinct()
-
-        if query_params.instrument:
-            providers_queryset = providers_queryset.filter(
-                instruments__in=query_params.instrument
-            ).distinct()
-                
+    def get_page_cache_key(self) -> str:
+        query_params = self._get_query_params()
+        return page_cache.list_page_key(
+            name=self.__class__.__name__,
+            ## the raw modality: no modality and `either` search the same way, but the
+            ## form and next page links render differently
+            key_parts=[
+                query_params.modality,
+                sorted(query_params.genre),
+                sorted(query_params.instrument),
+                self.request.GET.get('cursor')
+            ] + self._htmx_key_parts()
+        )
 
-        providers_queryset = providers_queryset.select_related('user', 'location')\
-            .order_by('user__date_joined')
+    ## returns ProviderSearchIndex entries, see ProviderSearchUseCase.search
+    def get_queryset(
+        self,
+        query_params: QueryParameters
+    ):
+        provider_search_use_case = use_case_factory.provider_search_use_case()
+        return provider_search_use_case.search(query_params=query_params)
 
-        return providers_queryset
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
 
         # print(self.request.GET)
-        if not self.request.GET:
-            query_params = QueryParameters()
-        else:
-            query_params = self._generate_query_params_from_input(
-                d=self.request.GET
-            )
+        query_params = self._get_query_params()
 
         # print(query_params)
         # print(type(query_params.genre))
         # print(query_params.genre)
 
         context['query_params'] = query_params
-        context['genres'] = Genre.objects.all()
-        context['instruments'] = Instrument.objects.all()
+        context['genres'] = reference_data_cache.genres()
+        context['instruments'] = reference_data_cache.instruments()
+
+        ## the counts are only rendered with the first page of results
+        if not self.is_next_page_request():
+            provider_search_use_case = use_case_factory.provider_search_use_case()
+            facet_counts = provider_search_use_case.facet_counts(query_params=query_params)
+            context['total_provider_count'] = facet_counts.total
+            context['facet_counts'] = facet_counts
+            context['genre_facets'] = [
+                (genre, facet_counts.genres.get(genre.id, 0)) for genre in context['genres']
+            ]
+            context['instrument_facets'] = [
+                (instrument, facet_counts.instruments.get(instrument.id, 0)) for instrument in context['instruments']
+            ]
 
         providers_queryset = self.get_queryset(query_params=query_params)
-        paginator = Paginator(providers_queryset, DEFAULT_PAGE_SIZE)
 
-        page_number = int(self.request.GET.get('page', 1))
-        context['page_of_providers'] = paginator.get_page(page_number)
+        ## keyset pagination - seek past the cursor instead of using an OFFSET, so deep
+        ## pages are as cheap as the first and concurrent inserts don't shift pages
+        cursor = self.request.GET.get('cursor')
+        page_queryset = providers_queryset
+        if cursor:
+            (date_joined, provider_id) = self._decode_cursor(cursor=cursor)
+            page_queryset = page_queryset.filter(
+                Q(date_joined__gt=date_joined) |
+                Q(date_joined=date_joined, provider_id__gt=provider_id)
+            )
 
-        next_page_index = page_number + 1
-        if next_page_index <= paginator.num_pages:
-            
+        ## fetch one extra entry to find out whether there is a next page
+        entries = list(page_queryset[:DEFAULT_PAGE_SIZE + 1])
+        page_entries = entries[:DEFAULT_PAGE_SIZE]
+        context['page_of_providers'] = [entry.provider for entry in page_entries]
+        context['page_of_provider_list_items'] = render_provider_list_items(
+            providers=context['page_of_providers']
+        )
+
+        if len(entries) > DEFAULT_PAGE_SIZE:
             context['next_page_url'] = self._generate_url_from_query_params(
                 query_params=query_params,
-                next_page_index=next_page_index
+                cursor=self._encode_cursor(entry=page_entries[-1])
             )
 
-
-        context['total_provider_count'] = paginator.count
-
         return context
 
+    def is_next_page_request(self) -> bool:
+        return bool(self.request.htmx) and \
+            self.request.htmx.trigger != 'provider-search-filter'
+
     ## extract form params, compute url and redirect
     def post(self, request, *args, **kwargs):
 
@@ -189,11 +322,26 @@ class ProviderListView(TemplateView):
         print(url)
         return HttpResponseRedirect(url)
 
-class ProviderDetailView(TemplateView):
+class ProviderDetailView(ReadReplicaMixin, AnonymousPageCacheMixin, TemplateView):
     template_name = 'musicspace_app/provider_detail.html'
 
+    def get_page_cache_key(self) -> str:
+        return page_cache.provider_page_key(
+            name=self.__class__.__name__,
+            provider_id=self.kwargs['provider_id'],
+            key_parts=self._htmx_key_parts()
+        )
+
+    ## the provider, its user, location, TakeOne user and video container are loaded in
+    ## a single query. a missing TakeOne user / video container is cached as well, so
+    ## get_takeone_profile_video_container never goes back to the database
     def get_provider(self) -> Provider:
-        return get_object_or_404(Provider.objects.select_related('user', 'location'), id=self.kwargs['provider_id'])
+        return get_object_or_404(
+            Provider.objects.select_related(
+                'user', 'location', 'takeone_user_opt__profile_video_container'
+            ),
+            id=self.kwargs['provider_id']
+        )
 
     def get_takeone_profile_video_container(
         self, 
@@ -208,11 +356,27 @@ class ProviderDetailView(TemplateView):
         except ObjectDoesNotExist:
             return None
 
+    ## only the ids are read from the through tables; the genres / instruments
+    ## themselves come from the reference data cache
+    def get_provider_genres(self, provider: Provider) -> List[Genre]:
+        genre_ids = set(
+            Provider.genres.through.objects.filter(provider_id=provider.id).values_list('genre_id', flat=True)
+        )
+        return [genre for genre in reference_data_cache.genres() if genre.id in genre_ids]
+
+    def get_provider_instruments(self, provider: Provider) -> List[Instrument]:
+        instrument_ids = set(
+            Provider.instruments.through.objects.filter(provider_id=provider.id).values_list('instrument_id', flat=True)
+        )
+        return [instrument for instrument in reference_data_cache.instruments() if instrument.id in instrument_ids]
+
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
         provider = self.get_provider()
         context['provider'] = provider
         context['takeone_profile_video_container'] = self.get_takeone_profile_video_container(provider)
+        context['provider_genres'] = self.get_provider_genres(provider)
+        context['provider_instruments'] = self.get_provider_instruments(provider)
 
         return context
 
@@ -246,13 +410,20 @@ class ProviderProfileView(ProviderPortalAuthMixin, TemplateView):
         context['provider_form'] = ProviderForm(instance=provider)
         context['user_form'] = MusicspaceUserForm(instance=provider.user)
         
+        ## a job that hasn't completed takes the place of the video section
+        provisioning_job_use_case = use_case_factory.provisioning_job_use_case()
+        provisioning_job = provisioning_job_use_case.get_latest_job(provider=provider)
+        if provisioning_job and provisioning_job.state != ProvisioningJob.State.COMPLETED:
+            context['provisioning_job'] = provisioning_job
+
         takeone_profile_video_container = self.get_takeone_profile_video_container(provider=provider)
 
         if takeone_profile_video_container:
 
+            ## serve the local copy and refresh it in the background if it is stale
             ## NOTE - if webhooks are used, this refreshing from the server would be unnecessary
             takeone_project_use_case = use_case_factory.takeone_project_use_case()
-            takeone_profile_video_container = takeone_project_use_case.update_video_container_from_server(
+            takeone_project_use_case.refresh_video_container_if_stale(
                 video_container=takeone_profile_video_container
             )
 
@@ -267,7 +438,7 @@ class ProviderProfileView(ProviderPortalAuthMixin, TemplateView):
         user_form = MusicspaceUserForm(self.request.POST, instance=provider.user)
 
         if address_form.is_valid() and provider_form.is_valid() and user_form.is_valid():
-            with transaction.atomic():
+            with serialized_write():
                 address_form.save()
                 provider_form.save()
                 user_form.save()
@@ -276,39 +447,20 @@ class ProviderProfileView(ProviderPortalAuthMixin, TemplateView):
             context = self.get_context_data(**kwargs)
             return self.render_to_response(context)
 
-class AddVideoView(ProviderPortalComponentAuthMixin, FormView):
-    template_name = None
-    form_class = EmptyForm
+class AddVideoView(AsyncProviderPortalComponentAuthMixin, View):
 
     def get_provider(self) -> Provider:
         return self.request.user.provider
 
-    def form_valid(self, form):
-
-        provider = self.get_provider()
-        ## this needs to create a user and a project
-        takeone_user_use_case = use_case_factory.takeone_user_use_case()
-        takeone_user = provider.takeone_user
-        if not takeone_user:
-            takeone_user = takeone_user_use_case.create_user(
-                provider=provider
-            )
-
-        takeone_project_use_case = use_case_factory.takeone_project_use_case()
-        ## create video container
-        profile_video_container = takeone_project_use_case.create_profile_video_container(
-            takeone_user=takeone_user
-        )
+    async def post(self, request, *args, **kwargs):
 
-        ## create the project
-        takeone_project = takeone_project_use_case.create_project(
-            takeone_user=takeone_user,
-            video_container=profile_video_container
-        )
+        provider = await sync_to_async(self.get_provider)()
 
-        ## send email to user
-        takeone_user_use_case.send_invitation_email(
-            takeone_user=takeone_user
+        ## creating the user, video container and project and sending the email
+        ## are done by the provisioning worker. the profile page polls for status
+        provisioning_job_use_case = use_case_factory.provisioning_job_use_case()
+        await sync_to_async(provisioning_job_use_case.enqueue)(
+            provider=provider
         )
 
         response = HttpResponse()
@@ -316,29 +468,39 @@ class AddVideoView(ProviderPortalComponentAuthMixin, FormView):
 
         return response
 
-    def form_invalid(self, form) -> HttpResponse:
-        return HttpResponseBadRequest()
+class ProvisioningJobStatusView(ProviderPortalComponentAuthMixin, TemplateView):
+    template_name = 'musicspace_app/components/provisioning_job_status.html'
+
+    def get(self, request, *args, **kwargs):
+        provider = self.request.user.provider
+        provisioning_job_use_case = use_case_factory.provisioning_job_use_case()
+        provisioning_job = provisioning_job_use_case.get_latest_job(provider=provider)
+
+        ## once provisioning is done, reload the page to show the new video container
+        if provisioning_job is None or provisioning_job.state == ProvisioningJob.State.COMPLETED:
+            response = HttpResponse()
+            response["HX-Refresh"] = "true"
+            return response
+
+        context = self.get_context_data(**kwargs)
+        context['provisioning_job'] = provisioning_job
+        return self.render_to_response(context)
 
-    def get(self, request, *args, **kwargs) -> HttpResponse:
-        return self.http_method_not_allowed(request, *args, **kwargs)
-    
-class ResendInvitationView(ProviderPortalComponentAuthMixin, FormView):
-    template_name = None
-    form_class = EmptyForm
+class ResendInvitationView(AsyncProviderPortalComponentAuthMixin, View):
 
     def get_provider(self) -> Provider:
         return self.request.user.provider
 
-    def form_valid(self, form):
+    async def post(self, request, *args, **kwargs):
 
-        provider = self.get_provider()
-        takeone_user = provider.takeone_user
+        provider = await sync_to_async(self.get_provider)()
+        takeone_user = await sync_to_async(lambda: provider.takeone_user)()
         if not takeone_user:
             raise app_errors.BadRequestError()
 
         ## send email to user
         takeone_user_use_case = use_case_factory.takeone_user_use_case()
-        takeone_user_use_case.send_invitation_email(
+        await takeone_user_use_case.asend_invitation_email(
             takeone_user=takeone_user
         )
 
@@ -347,12 +509,6 @@ class ResendInvitationView(ProviderPortalComponentAuthMixin, FormView):
 
         return response
 
-    def form_invalid(self, form) -> HttpResponse:
-        return HttpResponseBadRequest()
-
-    def get(self, request, *args, **kwargs) -> HttpResponse:
-        return self.http_method_not_allowed(request, *args, **kwargs)
-
 class AboutUsView(TemplateView):
     template_name = 'musicspace_app/about_us.html'
 
@@ -362,27 +518,28 @@ class AboutUsView(TemplateView):
 class IndexView(ProviderListView):
     pass
 
+## the TakeOne connection pool counters of the worker process that serves the request
+## (each gunicorn worker has its own clients), for monitoring
+class TakeOneClientPoolStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'pid': os.getpid(),
+            'takeone_client': takeone_client.pool_stats().dict(),
+            'async_takeone_client': async_takeone_client.pool_stats().dict()
+        })
+
 class TakeOneWebhookView(APIView):
 
+    ## the event is only stored here. run_webhook_consumer applies it,
+    ## so bursts of webhooks don't tie up request threads
     def post(self, request, *args,  **kwargs):
 
-        print(json.dumps(request.data, indent=4))
         takeone_project_use_case = use_case_factory.takeone_project_use_case()
-        try:
-            webhook_request = takeone_project_use_case.decode_webhook_request(
-                webhook_request_dict=request.data
-            )
-        except BaseException as e:
-            print('got exception')
-            print(e)
-            return Response({}, status=status.HTTP_200_OK)
-
-        try:
-            takeone_project_use_case.handle_webhook(
-                webhook_request=webhook_request
-            )
-        except BaseException as e:
-            print('got exception')
-            print(e)
+        takeone_project_use_case.store_webhook_event(
+            payload=request.body,
+            token=request.query_params.get('token')
+        )
 
         return Response({}, status=status.HTTP_200_OK)
\ No newline at end of file
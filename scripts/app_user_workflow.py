@@ -1,18 +1,31 @@
 import argparse
 import json
-from time import sleep
+import httpx
 import common
 import logging
 import models
+from production_watcher import (
+    ProductionProgressWatcher, WebhookListener,
+    DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL, DEFAULT_WEBHOOK_POLL_INTERVAL
+)
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from typing import List
 logger = logging.getLogger()
 logger.setLevel('DEBUG')
 
+DEFAULT_SEGMENT_CONCURRENCY = 4
+
 def main():
 
     parser = argparse.ArgumentParser(description='Full workflow')
     parser.add_argument('config_file', help='Config file')
     parser.add_argument('code', help='App User Auth Code')
+    parser.add_argument('--segment-concurrency', type=int, default=DEFAULT_SEGMENT_CONCURRENCY, help='Number of video segments handled at once')
+    parser.add_argument('--upload-concurrency', type=int, default=common.DEFAULT_UPLOAD_CONCURRENCY, help='Number of parts uploaded at once for each video segment')
+    parser.add_argument('--min-poll-interval', type=float, default=DEFAULT_MIN_POLL_INTERVAL, help='Shortest wait in seconds between production progress checks')
+    parser.add_argument('--max-poll-interval', type=float, help='Longest wait in seconds between production progress checks')
+    parser.add_argument('--webhook-port', type=int, help='Listen for TakeOne webhook events on this port and check progress when one arrives')
 
     args = parser.parse_args()
     config: models.AppUserWorkflowConfig = models.AppUserWorkflowConfig.parse_file(args.config_file)
@@ -29,70 +42,100 @@ def main():
     auth = common.AppUserTokenAuth(
         access_token=token_response.access_token,
         refresh_token=token_response.refresh_token,
-        base_url=config.base_url
-    )
-
-    ## fetch user projects 
-    ## results are reverse chron order
-    projects_response = common.fetch_projects(
         base_url=config.base_url,
-        auth=auth
+        expires_in=token_response.expires_in
     )
 
-    ## get latest project
-    project = projects_response.results[0]
+    ## one connection pool for the TakeOne api, shared by all the segments, and one
+    ## (without the app user's auth) for the presigned uploads
+    upload_connections = args.segment_concurrency * args.upload_concurrency
+    client = httpx.Client(
+        auth=auth,
+        timeout=None,
+        limits=httpx.Limits(max_connections=args.segment_concurrency * 2, max_keepalive_connections=args.segment_concurrency * 2)
+    )
+    upload_client = httpx.Client(
+        timeout=None,
+        limits=httpx.Limits(max_connections=upload_connections, max_keepalive_connections=upload_connections)
+    )
 
-    ## handle video segments
-    video_segments: List[str] = []
-    for video_segment_config in config.project.video_segments:
-        video_segment = common.handle_video_segment(
+    with client, upload_client:
+        ## fetch user projects 
+        ## results are reverse chron order
+        projects_response = common.fetch_projects(
             base_url=config.base_url,
-            project_id=project.id,
-            video_segment_config=video_segment_config,
-            auth=auth
+            auth=None,
+            client=client
         )
 
-        video_segments.append(str(video_segment.id))
+        ## get latest project
+        project = projects_response.results[0]
+
+        ## handle video segments
+        ## segments are independent of each other until the production request, so
+        ## several are created, hashed and uploaded at once. the ids keep the order
+        ## of the segments in the config
+        def handle_video_segment(video_segment_config: models.VideoSegmentConfig) -> str:
+            video_segment = common.handle_video_segment(
+                base_url=config.base_url,
+                project_id=project.id,
+                video_segment_config=video_segment_config,
+                auth=None,
+                upload_concurrency=args.upload_concurrency,
+                client=client,
+                upload_client=upload_client
+            )
+            return str(video_segment.id)
+
+        with ThreadPoolExecutor(max_workers=args.segment_concurrency) as executor:
+            video_segments: List[str] = list(executor.map(handle_video_segment, config.project.video_segments))
+
+        ## Create production request
+        request = models.CreateProductionRequestRequest(
+            video_segments=video_segments,
+            music=config.production_request.music,
+            add_subtitles=config.production_request.add_subtitles,
+            name=config.production_request.name,
+            title=config.production_request.title
+        )
 
-    ## Create production request
-    request = models.CreateProductionRequestRequest(
-        video_segments=video_segments,
-        music=config.production_request.music,
-        add_subtitles=config.production_request.add_subtitles,
-        name=config.production_request.name,
-        title=config.production_request.title
-    )
+        production_request = common.create_production_request(
+            base_url=config.base_url,
+            project_id=project.id,
+            request=request,
+            auth=None,
+            client=client
+        )
 
-    production_request = common.create_production_request(
-        base_url=config.base_url,
-        project_id=project.id,
-        request=request,
-        auth=auth
-    )
+        max_poll_interval = args.max_poll_interval
+        if max_poll_interval is None:
+            max_poll_interval = DEFAULT_WEBHOOK_POLL_INTERVAL if args.webhook_port else DEFAULT_MAX_POLL_INTERVAL
 
-    while production_request.state != 'completed' and production_request.state != 'error':
-        sleep(30)
-        production_request = common.fetch_production_request(
+        watcher = ProductionProgressWatcher(
             base_url=config.base_url,
             project_id=project.id,
-            production_request_id=production_request.id,
-            auth=auth
+            client=client,
+            min_poll_interval=args.min_poll_interval,
+            max_poll_interval=max_poll_interval
         )
 
-        print(f'Production request is in the {production_request.state} state.')
-        print(f'Coloring progress is {production_request.coloring_progress}')
-        print(f'Editing progress is {production_request.editing_progress}')
-        print(f'Post processing progress is {production_request.post_processing_progress}')
+        if args.webhook_port:
+            webhook_listener = WebhookListener(watcher=watcher, port=args.webhook_port)
+        else:
+            webhook_listener = nullcontext()
 
-    ## once completed, submit review
-    user_review = common.submit_review(
-        base_url=config.base_url,
-        project_id=project.id,
-        production_request_id=production_request.id,
-        result='accepted',
-        auth=auth
-    )
+        with webhook_listener:
+            production_request = watcher.wait_until_done(production_request=production_request)
 
+        ## once completed, submit review
+        user_review = common.submit_review(
+            base_url=config.base_url,
+            project_id=project.id,
+            production_request_id=production_request.id,
+            result='accepted',
+            auth=None,
+            client=client
+        )
 
 
 if __name__ == "__main__":
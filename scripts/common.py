@@ -3,45 +3,127 @@ import httpx
 from models import *
 import ffmpeg
 import hashlib
+import asyncio
 import base64
 import decimal
+import io
 import json
 import os
-
+import time
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+DEFAULT_UPLOAD_CONCURRENCY = 4
+DEFAULT_UPLOAD_ATTEMPTS = 4
+
+FINGERPRINT_CACHE_FILENAME = './data/fingerprints.json'
+FINGERPRINT_READ_SIZE = 8 * 1024 * 1024
+
+## tokens are refreshed this long before they expire, so requests in flight don't
+## start failing with 401s first
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+## single-flight token refresh for sync and async clients. only one request refreshes
+## at a time, and requests waiting for it use its new token instead of refreshing
+## again (a refresh token can only be used once). tokens are refreshed proactively
+## once they are about to expire, and after a 401 as a fallback. each request
+## remembers the token generation it was sent with, so a 401 for a token that has
+## already been replaced just retries with the current one
 class AppUserTokenAuth(httpx.Auth):
-    def __init__(self, access_token, refresh_token, base_url):
+    def __init__(self, access_token, refresh_token, base_url, expires_in: Optional[int] = None):
         self.access_token = access_token
         self.refresh_token = refresh_token
         self.base_url = base_url
+        self.expires_at = self._expires_at(expires_in)
+        self.generation = 0
+        self._sync_lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+
+    def _expires_at(self, expires_in: Optional[int]) -> Optional[float]:
+        if expires_in is None:
+            return None
+        return time.monotonic() + expires_in - TOKEN_REFRESH_MARGIN_SECONDS
+
+    def _is_expiring(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
 
-    def build_refresh_request(self):
+    def _needs_refresh(self, generation: Optional[int]) -> bool:
+        if generation is None:
+            return self._is_expiring()
+        return generation == self.generation
+
+    def build_refresh_request(self) -> httpx.Request:
         url = f'{self.base_url}/sdkapi/v1/token'
         body = {
             'grant_type': 'refresh_token',
             'refresh_token': self.refresh_token
         }
 
-        return httpx.post(url, json=body, timeout=None)
+        return httpx.Request('POST', url, json=body)
 
     def update_tokens(
         self,
         refresh_response
     ):
+        refresh_response.raise_for_status()
         token_response = TokenResponse(**refresh_response.json())
         self.access_token = token_response.access_token
         self.refresh_token = token_response.refresh_token
+        self.expires_at = self._expires_at(token_response.expires_in)
+        self.generation = self.generation + 1
 
-    def auth_flow(self, request):
+    def _authorize(self, request) -> int:
         request.headers['Authorization'] = f'Bearer {self.access_token}'
+        return self.generation
+
+    ## `generation` is None for a proactive refresh, otherwise it's the generation of the
+    ## token that got a 401
+    def _sync_refresh_flow(self, generation: Optional[int]):
+        if not self._needs_refresh(generation):
+            return
+        with self._sync_lock:
+            if self._needs_refresh(generation):
+                refresh_response = yield self.build_refresh_request()
+                refresh_response.read()
+                self.update_tokens(refresh_response)
+
+    def sync_auth_flow(self, request):
+        yield from self._sync_refresh_flow(generation=None)
+
+        generation = self._authorize(request)
+        response = yield request
+
+        if response.status_code == 401:
+            yield from self._sync_refresh_flow(generation=generation)
+            self._authorize(request)
+            yield request
+
+    ## created on first use, so it belongs to the event loop the client runs on
+    def _get_async_lock(self) -> asyncio.Lock:
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    async def async_auth_flow(self, request):
+        ## async generators can't `yield from`, so the refresh is spelled out twice
+        if self._needs_refresh(None):
+            async with self._get_async_lock():
+                if self._needs_refresh(None):
+                    refresh_response = yield self.build_refresh_request()
+                    await refresh_response.aread()
+                    self.update_tokens(refresh_response)
+
+        generation = self._authorize(request)
         response = yield request
 
         if response.status_code == 401:
-            # If the server issues a 401 response, then issue a request to
-            # refresh tokens, and resend the request.
-            refresh_response = yield self.build_refresh_request()
-            self.update_tokens(refresh_response)
+            async with self._get_async_lock():
+                if self._needs_refresh(generation):
+                    refresh_response = yield self.build_refresh_request()
+                    await refresh_response.aread()
+                    self.update_tokens(refresh_response)
 
-            request.headers['Authorization'] = f'Bearer {self.access_token}'
+            self._authorize(request)
             yield request
 
 def get_video_stats(video_filename: str) -> FFMPEGVideoStats:
@@ -58,18 +140,82 @@ def get_video_stats(video_filename: str) -> FFMPEGVideoStats:
 
     return FFMPEGVideoStats(**video_stream)
 
-def _get_file_size(filename) -> int:
-    return os.path.getsize(filename)
+def _md5_to_base64(m) -> str:
+    return base64.b64encode(m.digest()).decode('utf-8')
+
+## a single pass over the file in large unbuffered reads into one reused buffer.
+## hashlib releases the GIL on large buffers, so this runs alongside ffprobe (see
+## create_video_file_item_props)
+def compute_file_fingerprint(filename: str) -> FileFingerprint:
+    with open(filename, 'rb', buffering=0) as file:
+        stat = os.fstat(file.fileno())
+
+        file_md5 = hashlib.md5()
+        buffer = bytearray(FINGERPRINT_READ_SIZE)
+        view = memoryview(buffer)
+        number_of_bytes_read = file.readinto(buffer)
+        while number_of_bytes_read:
+            file_md5.update(view[:number_of_bytes_read])
+            number_of_bytes_read = file.readinto(buffer)
+
+    return FileFingerprint(
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        md5=_md5_to_base64(file_md5)
+    )
 
-def _compute_md5(filename) -> str:
-    with open(filename, 'rb') as file:
-        m = hashlib.md5()
-        b = file.read(4096)
-        while len(b) > 0:
-            m.update(b)
-            b = file.read(4096)
-        md5_data = m.digest()
-    return base64.b64encode(md5_data).decode('utf-8')
+## fingerprints are cached by absolute path, and reused while the file's size and
+## mtime are unchanged, so re-running the workflow doesn't rehash the takes
+_fingerprint_cache_lock = threading.Lock()
+
+def _load_fingerprint_cache() -> dict:
+    try:
+        with open(FINGERPRINT_CACHE_FILENAME) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_fingerprint(path: str, fingerprint: FileFingerprint):
+    with _fingerprint_cache_lock:
+        fingerprint_cache = _load_fingerprint_cache()
+        fingerprint_cache[path] = fingerprint.dict()
+
+        os.makedirs(os.path.dirname(FINGERPRINT_CACHE_FILENAME), exist_ok=True)
+        tmp_filename = f'{FINGERPRINT_CACHE_FILENAME}.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp_filename, 'w') as file:
+            json.dump(fingerprint_cache, file)
+        os.replace(tmp_filename, FINGERPRINT_CACHE_FILENAME)
+
+def get_file_fingerprint(filename: str) -> FileFingerprint:
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+
+    with _fingerprint_cache_lock:
+        cached = _load_fingerprint_cache().get(path)
+    if cached is not None:
+        fingerprint = FileFingerprint(**cached)
+        if fingerprint.size == stat.st_size and fingerprint.mtime_ns == stat.st_mtime_ns:
+            return fingerprint
+
+    fingerprint = compute_file_fingerprint(filename=path)
+    _save_fingerprint(path=path, fingerprint=fingerprint)
+    return fingerprint
+
+## requests go through `client` when one is given, reusing its pooled connections (and
+## its auth, when `auth` is None). otherwise they are sent on a connection of their own
+def _request(
+    method: str,
+    url: str,
+    auth: Optional[httpx.Auth],
+    client: Optional[httpx.Client],
+    **kwargs
+) -> httpx.Response:
+    if client is None:
+        return httpx.request(method, url, auth=auth, timeout=None, **kwargs)
+    elif auth is None:
+        return client.request(method, url, **kwargs)
+    else:
+        return client.request(method, url, auth=auth, **kwargs)
 
 # def create_app_user(
 #     base_url: str,
@@ -169,7 +315,8 @@ def create_video_segment(
     base_url: str,
     project_id: str,
     script: Optional[str], 
-    auth: httpx.Auth
+    auth: Optional[httpx.Auth],
+    client: Optional[httpx.Client] = None
 ) -> VideoSegmentResponse:
     url = f'{base_url}/sdkapi/v1/projects/{project_id}/segments'
 
@@ -177,7 +324,7 @@ def create_video_segment(
     if script:
         body['script'] = script
 
-    r = httpx.post(url, auth=auth, json=body, timeout=None)
+    r = _request('POST', url, auth=auth, client=client, json=body)
     if r.status_code >= 400:
         print(f'An error occurred: {r.text}')
     r.raise_for_status()
@@ -187,10 +334,15 @@ def create_video_segment(
 def create_video_file_item_props(
     video_filename: str
 ) -> TakeVideoFileItemProps:
-    
-    ffmpeg_stats = get_video_stats(video_filename)
-    content_length = _get_file_size(video_filename)
-    content_md5 = _compute_md5(video_filename)
+
+    ## ffprobe runs in its own process while this one hashes the file
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        ffmpeg_stats_future = executor.submit(get_video_stats, video_filename)
+        fingerprint = get_file_fingerprint(video_filename)
+        ffmpeg_stats = ffmpeg_stats_future.result()
+
+    content_length = fingerprint.size
+    content_md5 = fingerprint.md5
 
     quantized_video_length = decimal.Decimal(ffmpeg_stats.duration_in_seconds).quantize(decimal.Decimal('.1'), rounding=decimal.ROUND_UP)
 
@@ -212,77 +364,165 @@ def create_take(
     project_id: str,
     video_segment_id: str,
     request: CreateTakeRequest,
-    auth: httpx.Auth
+    auth: Optional[httpx.Auth],
+    client: Optional[httpx.Client] = None
 ) -> TakeResponse:
     url = f'{base_url}/sdkapi/v1/projects/{project_id}/segments/{video_segment_id}/takes'
 
     request_dict = request.dict(exclude_none=True)
 
-    r = httpx.post(url, auth=auth, json=request_dict, timeout=None)
+    r = _request('POST', url, auth=auth, client=client, json=request_dict)
     if r.status_code >= 400:
         print(f'An error occurred: {r.text}')
     r.raise_for_status()
 
     return TakeResponse(**r.json())
 
-def _get_tmp_filename(part_id):
-    filename = f'./data/tmp/{part_id}'
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    return filename
-
-def write_temp_file(
-    input_file: str, 
-    output_file: str, 
-    offset: int, 
-    length: int
-):
-    remaining_bytes = length
-    with open(input_file, 'rb') as infile:
-        infile.seek(offset)
-        with open(output_file, 'wb') as outfile:
-            b = infile.read(4096)
-            while remaining_bytes > 0 and len(b) > 0:
-                number_of_bytes_to_write = min(remaining_bytes, 4096)
-                bytes_to_write = b[0:number_of_bytes_to_write]
-                assert(len(bytes_to_write) == number_of_bytes_to_write)
-                bytes_written = outfile.write(bytes_to_write)
-                assert(len(bytes_to_write) == bytes_written)
-                remaining_bytes = remaining_bytes - bytes_written
-                b = infile.read(4096)
-
-    assert(_get_file_size(output_file) == length)
-
-def _upload_file(
-    filename: str,
-    presigned_post_request: PresignedPostRequest
-) -> Any:
-
-    with open(filename, 'rb') as file:
-        files = {'file': file}
-
-        r = httpx.post(
-            presigned_post_request.url, 
-            data=presigned_post_request.fields, 
-            files=files
+## a read-only view of `length` bytes of an open file, starting at `offset`. reads use
+## os.pread, so several slices of the same file can be uploaded at once without
+## sharing a file position, and nothing is copied to disk. httpx streams it in chunks
+## and seeks back to the start when a request is retried
+class FileSlice(io.RawIOBase):
+    def __init__(self, fd: int, offset: int, length: int):
+        self.fd = fd
+        self.offset = offset
+        self.length = length
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self.position + offset
+        else:
+            position = self.length + offset
+
+        self.position = max(0, min(position, self.length))
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        number_of_bytes_to_read = min(len(buffer), self.length - self.position)
+        if number_of_bytes_to_read <= 0:
+            return 0
+
+        b = os.pread(self.fd, number_of_bytes_to_read, self.offset + self.position)
+        buffer[:len(b)] = b
+        self.position = self.position + len(b)
+        return len(b)
+
+def _is_retryable_upload_error(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+def _upload_part(
+    client: httpx.Client,
+    fd: int,
+    part_id: str,
+    part: VideoUploadRequestPart,
+    attempts: int
+) -> float:
+    file_slice = FileSlice(fd=fd, offset=part.content_offset, length=part.content_length)
+
+    for attempt in range(1, attempts + 1):
+        started_at = time.monotonic()
+        try:
+            r = client.post(
+                part.presigned_post_request.url,
+                data=part.presigned_post_request.fields,
+                files={'file': (part_id, file_slice)}
+            )
+            r.raise_for_status()
+            return time.monotonic() - started_at
+        except Exception as e:
+            if attempt == attempts or not _is_retryable_upload_error(e):
+                raise
+            ## 1s, 2s, 4s, ...
+            backoff_seconds = 2 ** (attempt - 1)
+            reason = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else repr(e)
+            print(f'Upload of part {part_id} failed ({reason}), retrying in {backoff_seconds}s')
+            time.sleep(backoff_seconds)
+
+def upload_video_file(
+    video_filename: str,
+    take_id: str,
+    parts: List[VideoUploadRequestPart],
+    concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+    attempts: int = DEFAULT_UPLOAD_ATTEMPTS,
+    client: Optional[httpx.Client] = None
+) -> int:
+    parts_to_upload = [
+        part for part in sorted(parts, key=lambda x: x.part_offset)
+        if part.presigned_post_request is not None
+    ]
+    total_length = sum(part.content_length for part in parts_to_upload)
+
+    ## presigned posts carry their own credentials, so the client has no auth
+    owns_client = client is None
+    if owns_client:
+        client = httpx.Client(
+            timeout=None,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
         )
 
-        r.raise_for_status()
-        response_text = r.text
+    fd = os.open(video_filename, os.O_RDONLY)
+    try:
+        started_at = time.monotonic()
+
+        def upload(part: VideoUploadRequestPart) -> int:
+            part_id = f'{take_id}-{part.part_offset}'
+            elapsed = _upload_part(
+                client=client,
+                fd=fd,
+                part_id=part_id,
+                part=part,
+                attempts=attempts
+            )
+            megabytes = part.content_length / 1_000_000
+            print(f'Uploaded part {part.part_offset} ({megabytes:.1f} MB in {elapsed:.1f}s, {megabytes / max(elapsed, 0.001):.1f} MB/s)')
+            return part.content_length
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            uploaded_length = sum(executor.map(upload, parts_to_upload))
+
+        elapsed = time.monotonic() - started_at
+        megabytes = uploaded_length / 1_000_000
+        print(f'Uploaded {len(parts_to_upload)} parts ({megabytes:.1f} MB in {elapsed:.1f}s, {megabytes / max(elapsed, 0.001):.1f} MB/s)')
+    finally:
+        os.close(fd)
+        if owns_client:
+            client.close()
+
+    assert(uploaded_length == total_length)
+    return uploaded_length
 
-        return response_text
-    
 def handle_video_segment(
     base_url: str,
     project_id: str,
     video_segment_config: VideoSegmentConfig, 
-    auth: httpx.Auth
+    auth: Optional[httpx.Auth],
+    upload_concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+    client: Optional[httpx.Client] = None,
+    upload_client: Optional[httpx.Client] = None
 ) -> VideoSegmentResponse:
     ## create video segment
     video_segment_response = create_video_segment(
         base_url=base_url,
         project_id=project_id,
         script=video_segment_config.script,
-        auth=auth
+        auth=auth,
+        client=client
     )
 
     ## add take to video segment
@@ -300,48 +540,30 @@ def handle_video_segment(
         project_id=project_id,
         video_segment_id=video_segment_response.id,
         request=create_take_request,
-        auth=auth
+        auth=auth,
+        client=client
     )
 
-    video_upload_request = take_response.video_upload_request
-    parts = video_upload_request.parts
-
-    total_length = 0
-    tmp_files = []
-    for part in sorted(parts, key=lambda x: x.part_offset):
-
-        if part.presigned_post_request is None:
-            continue
-
-        part_id = f'{take_response.id}-{part.part_offset}'
-        tmp_file = _get_tmp_filename(part_id)
-        tmp_files.append(tmp_file)
-
-        write_temp_file(
-            input_file=video_segment_config.take.video_filename, 
-            output_file=tmp_file,
-            offset=part.content_offset,
-            length=part.content_length
-        )
-
-        part_content_length = _get_file_size(tmp_file)
-        total_length = total_length + part_content_length
-
-        _upload_file(
-            filename=tmp_file,
-            presigned_post_request=part.presigned_post_request
-        )
+    ## parts are streamed straight from the video file, several at a time
+    total_length = upload_video_file(
+        video_filename=video_segment_config.take.video_filename,
+        take_id=take_response.id,
+        parts=take_response.video_upload_request.parts,
+        concurrency=upload_concurrency,
+        client=upload_client
+    )
 
     assert(total_length == video_file_item_props.file_object_content_length)
     return video_segment_response
 
 def fetch_projects(
     base_url: str,
-    auth: httpx.Auth
+    auth: Optional[httpx.Auth],
+    client: Optional[httpx.Client] = None
 ) -> ProjectsResponse:
     url = f'{base_url}/sdkapi/v1/projects'
 
-    r = httpx.get(url, auth=auth, timeout=None)
+    r = _request('GET', url, auth=auth, client=client)
     if r.status_code >= 400:
         print(f'An error occurred: {r.text}')
     r.raise_for_status()
@@ -352,12 +574,13 @@ def create_production_request(
     base_url: str,
     project_id: str,
     request: CreateProductionRequestRequest,
-    auth: httpx.Auth
+    auth: Optional[httpx.Auth],
+    client: Optional[httpx.Client] = None
 ) -> ProductionRequest:
 
     url = f'{base_url}/sdkapi/v1/projects/{project_id}/productionrequests'
 
-    r = httpx.post(url, auth=auth, json=request.dict(exclude_none=True), timeout=None)
+    r = _request('POST', url, auth=auth, client=client, json=request.dict(exclude_none=True))
     if r.status_code >= 400:
         print(f'An error occurred: {r.text}')
     r.raise_for_status()
@@ -370,12 +593,13 @@ def fetch_production_request(
     base_url: str,
     project_id: str,
     production_request_id: str,
-    auth: httpx.Auth
+    auth: Optional[httpx.Auth],
+    client: Optional[httpx.Client] = None
 ) -> ProductionRequest:
 
     url = f'{base_url}/sdkapi/v1/projects/{project_id}/productionrequests/{production_request_id}'
 
-    r = httpx.get(url, auth=auth, timeout=None)
+    r = _request('GET', url, auth=auth, client=client)
     if r.status_code >= 400:
         print(f'An error occurred: {r.text}')
     r.raise_for_status()
@@ -389,7 +613,8 @@ def submit_review(
     project_id: str,
     production_request_id: str,
     result: str,
-    auth: httpx.Auth
+    auth: Optional[httpx.Auth],
+    client: Optional[httpx.Client] = None
 ) -> AppUserReview:
     url = f'{base_url}/sdkapi/v1/projects/{project_id}/user_reviews'
 
@@ -398,7 +623,7 @@ def submit_review(
         'production_request': production_request_id
     }
 
-    r = httpx.post(url, auth=auth, json=body, timeout=None)
+    r = _request('POST', url, auth=auth, client=client, json=body)
     if r.status_code >= 400:
         print(f'An error occurred: {r.text}')
     r.raise_for_status()
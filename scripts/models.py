@@ -182,6 +182,13 @@ class TakeVideoFileItemProps(BaseModel):
     file_object_content_length: int
     file_object_content_md5: str
 
+## the whole-file MD5 (base64, as the API expects it) of a video file, along with
+## the size and mtime it was computed for
+class FileFingerprint(BaseModel):
+    size: int
+    mtime_ns: int
+    md5: str
+
 class CreateTakeRequest(BaseModel):
     metadata: Optional[dict] = None
     video_file_item: TakeVideoFileItemProps
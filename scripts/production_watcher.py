@@ -0,0 +1,146 @@
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import httpx
+import common
+from models import *
+
+DEFAULT_MIN_POLL_INTERVAL = 2.0
+DEFAULT_MAX_POLL_INTERVAL = 60.0
+## with a webhook listener the polls are only a fallback for missed events
+DEFAULT_WEBHOOK_POLL_INTERVAL = 120.0
+
+def overall_progress(production_request: ProductionRequest) -> float:
+    ## coloring, editing and post processing run one after the other, each from 0 to 1
+    return (
+        production_request.coloring_progress +
+        production_request.editing_progress +
+        production_request.post_processing_progress
+    ) / 3
+
+## waits for a production request to finish. the time until the next poll follows the
+## progress reported by the previous polls: while progress is being made, it is half of
+## the estimated time remaining (so completion is noticed soon after it happens), and
+## while nothing changes it backs off towards `max_poll_interval`. a webhook event for
+## the project (see WebhookListener) triggers a poll straight away
+class ProductionProgressWatcher:
+    def __init__(
+        self,
+        base_url: str,
+        project_id: str,
+        client: httpx.Client,
+        min_poll_interval: float = DEFAULT_MIN_POLL_INTERVAL,
+        max_poll_interval: float = DEFAULT_MAX_POLL_INTERVAL
+    ):
+        self.base_url = base_url
+        self.project_id = project_id
+        self.client = client
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.wake_event = threading.Event()
+
+    def notify(self):
+        self.wake_event.set()
+
+    def _next_poll_interval(
+        self,
+        previous: ProductionRequest,
+        previous_time: float,
+        current: ProductionRequest,
+        current_time: float,
+        poll_interval: float
+    ) -> float:
+        if current.state != previous.state:
+            return self.min_poll_interval
+
+        progress_made = overall_progress(current) - overall_progress(previous)
+        if progress_made <= 0:
+            return min(poll_interval * 1.5, self.max_poll_interval)
+
+        rate = progress_made / max(current_time - previous_time, 0.001)
+        estimated_seconds_remaining = max(1 - overall_progress(current), 0) / rate
+        return max(self.min_poll_interval, min(estimated_seconds_remaining / 2, self.max_poll_interval))
+
+    def _print_progress(self, production_request: ProductionRequest):
+        print(f'Production request is in the {production_request.state} state.')
+        print(f'Coloring progress is {production_request.coloring_progress}')
+        print(f'Editing progress is {production_request.editing_progress}')
+        print(f'Post processing progress is {production_request.post_processing_progress}')
+
+    def wait_until_done(self, production_request: ProductionRequest) -> ProductionRequest:
+        previous = production_request
+        previous_time = time.monotonic()
+        poll_interval = self.min_poll_interval
+
+        while production_request.state != 'completed' and production_request.state != 'error':
+            if self.wake_event.wait(timeout=poll_interval):
+                print('Webhook event received')
+            self.wake_event.clear()
+
+            production_request = common.fetch_production_request(
+                base_url=self.base_url,
+                project_id=self.project_id,
+                production_request_id=production_request.id,
+                auth=None,
+                client=self.client
+            )
+            current_time = time.monotonic()
+            self._print_progress(production_request)
+
+            poll_interval = self._next_poll_interval(
+                previous=previous,
+                previous_time=previous_time,
+                current=production_request,
+                current_time=current_time,
+                poll_interval=poll_interval
+            )
+            previous = production_request
+            previous_time = current_time
+            if production_request.state != 'completed' and production_request.state != 'error':
+                print(f'Next check in {poll_interval:.1f}s')
+
+        return production_request
+
+## a local http server for TakeOne webhook deliveries (e.g. through a tunnel to
+## `port`). every event for the watched project wakes the watcher
+class WebhookListener:
+    def __init__(
+        self,
+        watcher: ProductionProgressWatcher,
+        port: int,
+        host: str = '0.0.0.0'
+    ):
+        project_id = watcher.project_id
+
+        class WebhookRequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                content_length = int(self.headers.get('Content-Length', 0))
+                try:
+                    event = json.loads(self.rfile.read(content_length))
+                    event_project_id = event.get('project', {}).get('id')
+                except (ValueError, AttributeError):
+                    event_project_id = None
+
+                self.send_response(200)
+                self.end_headers()
+
+                if event_project_id == project_id:
+                    watcher.notify()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+        self.thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f'Listening for webhook events on port {self.server.server_address[1]}')
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()